@@ -1,14 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
-from forms import EditPedidoForm
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, send_file,
+                   Response, stream_with_context, jsonify, make_response, has_request_context)
+from forms import EditPedidoForm, ImportarLoteForm
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
 import os
-import io
-from db import get_pedidos, get_db_connection
+import tempfile
+from db import (conexao, versao_dados, invalidar_versao_dados, get_pedidos_por_ids, alvo_leitura, exigir_lsn,
+                lsn_atual, com_failover)
+from edicao_pedidos import (CAMPOS_EDITAVEIS, LOTE_MAX_LINHAS, validar_alteracoes, atualizar_pedido,
+                            atualizar_pedidos_em_lote, ler_planilha_lote)
+from paginacao import paginar_pedidos
+from status_pedidos import processa_pedidos
+from exportacao import gerar_csv, gerar_xlsx, exportar_paralelo
+from ingestao_transportadoras import caminho_relatorio
+from jobs_ingestao import iniciar_ingestao, ler_ingestao
+from sla import periodo_sla, indicadores_sla
+from jobs_exportacao import FORMATOS, MIMETYPES, iniciar_exportacao, ler_job, arquivo_job
+from cache import CacheTTL
+from paralelo import em_paralelo
+from instrumentacao import iniciar_instrumentacao, medir
+from eventos import EVENTOS_POLLING, iniciar_eventos, fluxo_eventos, ao_vivo
+from respostas import chave_listagem, etag_listagem, fragmento, nao_modificado, marcar_cache
+from referencias import choices_status, status_logisticos
+from historico_pedidos import HISTORICO_POR_PAGINA, historico_pedido
 from werkzeug.security import check_password_hash, generate_password_hash
 from psycopg2.extras import RealDictCursor
-from datetime import date
-import pandas as pd
 from urllib.parse import urlencode
 from math import ceil
+from datetime import date
 from functools import wraps
 
 def login_required(f):
@@ -31,128 +50,99 @@ def admin_required(f):
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'default-insecure-key')
+iniciar_instrumentacao(app)
+
+# Situações comerciais exibidas em cada tela (nomes iguais aos do banco)
+SITUACOES_ORDER_TRACKING = ['Atendido', '02 Faturado MMVB', 'Em aberto']
+SITUACOES_PEDIDOS = ['Em aberto', '01 E-Bikes']
+
+KPI_CACHE_TTL = int(os.environ.get('KPI_CACHE_TTL', 60))
+cache_indicadores = CacheTTL(KPI_CACHE_TTL)
+
+# Uma única passada por pedidos_teste: quantidade e atrasos por status (os de 'Entregue'
+# são descartados em _consultar_indicadores). A contagem por status lê todos os pedidos de
+# qualquer jeito; separar os atrasos numa segunda consulta por índices parciais custava mais
+# (140ms contra 115ms com 300 mil pedidos, ver benchmarks/verificar_planos.py)
+SQL_INDICADORES = """
+    SELECT
+        p.status_logistico_id,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE p.data_entrega < CURRENT_DATE),
+        COUNT(*) FILTER (WHERE p.data_expedicao < CURRENT_DATE)
+    FROM pedidos_teste p
+    GROUP BY p.status_logistico_id
+"""
+
+@com_failover
+def _consultar(sql, params=None):
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        linhas = cur.fetchall()
+        cur.close()
+    return linhas
 
-def count_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None, f_status=None,
-                  situacoes=None):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    query = """
-        SELECT COUNT(*)
-        FROM pedidos_teste p
-        LEFT JOIN status_logistico_teste s ON p.status_logistico_id = s.id
-        LEFT JOIN notas_fiscais_teste n ON p.id_nf = n.id
-        LEFT JOIN situacoes sit ON p.id_situacao = sit.id
-        WHERE 1=1
-    """
-
-    params = []
-
-    if situacoes:
-        query += " AND sit.situacao = ANY(%s)"
-        params.append(situacoes)
-    if f_pedido:
-        query += " AND CAST(p.n_pedido AS TEXT) ILIKE %s"
-        params.append(f"%{f_pedido}%")
-    if f_cliente:
-        query += " AND n.nome_cliente ILIKE %s"
-        params.append(f"%{f_cliente}%")
-    if f_nota:
-        query += " AND CAST(n.n_nota AS TEXT) ILIKE %s"
-        params.append(f"%{f_nota}%")
-    if f_status and f_status != "Todos":
-        query += " AND s.descricao = %s"
-        params.append(f_status)
-    if data_ini and data_fim:
-        query += " AND p.data_pedido BETWEEN %s AND %s"
-        params.extend([data_ini, data_fim])
-
-    cur.execute(query, params)
-    total = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return total
-
-def registrar_log_alteracao(conn, pedido_id, numero_pedido, campo, valor_antigo, valor_novo, usuario):
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO log_pedidos (id_pedido, numero_pedido, campo, valor_antigo, valor_novo, usuario)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (pedido_id, numero_pedido, campo, valor_antigo, valor_novo, usuario))
-    conn.commit()
-    cur.close()
-
-def processa_pedidos(pedidos):
-    hoje = date.today()
-    for p in pedidos:
-        p['entrega_atrasada'] = False
-        if (p.get('status_descricao') != 'Entregue'
-            and p.get('data_entrega')
-            and p['data_entrega'] < date.today()):
-            p['entrega_atrasada'] = True
-        else:
-            situacao = (p.get('situacao_comercial') or '').strip().lower()
-            if situacao in ['atendido', '02 faturado mmvb']:
-                if not p.get('status_descricao') or p.get('status_descricao') == 'Aguardando Envio':
-                    p['status_descricao'] = 'Aguardando Envio'
-            p['expedicao_atrasada'] = False
-            status = p.get('status_descricao')
-            if (
-                status == 'Aguardando Envio'
-                and p.get('data_expedicao')
-                and str(p.get('data_expedicao')).strip() not in ['', 'None', 'null']
-            ):
-                data_exp = p['data_expedicao']
-                if isinstance(data_exp, str):
-                    try:
-                        data_exp = pd.to_datetime(data_exp).date()
-                    except:
-                        data_exp = None
-                if data_exp and data_exp < hoje:
-                    p['expedicao_atrasada'] = True
-            if p.get('status_descricao') == 'Aguardando Envio' and p.get('data_previsao'):
-                data_prev = p['data_previsao']
-                if isinstance(data_prev, str):
-                    data_prev = pd.to_datetime(data_prev).date()
-                if data_prev and data_prev < hoje:
-                    p['status_descricao'] = 'Atrasado'
-                    p['expedicao_atrasada'] = False
-    return pedidos
+def _consultar_indicadores():
+    status = status_logisticos()
+    por_status = {}
+    atraso_entrega = atraso_expedicao = 0
+    for status_id, total, entrega, expedicao in _consultar(SQL_INDICADORES):
+        descricao = status.get(status_id, {}).get('descricao')
+        por_status[descricao or 'Sem status'] = por_status.get(descricao or 'Sem status', 0) + total
+        # Pedidos sem status ou já entregues não contam como atrasados
+        if descricao and descricao != 'Entregue':
+            atraso_entrega += entrega
+            atraso_expedicao += expedicao
+    return {
+        'atraso_entrega': atraso_entrega,
+        'atraso_expedicao': atraso_expedicao,
+        'por_status': por_status,
+    }
+
+def _pedidos_alterados():
+    # O trigger de versao_dados já incrementou a versão na transação da escrita;
+    # aqui só se descartam as cópias locais (indicadores e versão lida)
+    cache_indicadores.invalidar()
+    invalidar_versao_dados()
+    # Read-your-writes: as próximas leituras deste usuário só usam a réplica depois que
+    # ela aplicar esta escrita (também chamado pela thread de eventos, fora de requisição)
+    if has_request_context():
+        lsn = lsn_atual()
+        if lsn:
+            session['lsn_escrita'] = lsn
+            exigir_lsn(lsn)
+
+@app.before_request
+def _leituras_do_usuario():
+    exigir_lsn(session.get('lsn_escrita'))
 
 def contar_pedidos_atrasados():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT COUNT(*) FROM pedidos_teste p
-        JOIN status_logistico_teste s ON p.status_logistico_id = s.id
-        WHERE s.descricao != 'Entregue'
-          AND p.data_entrega < CURRENT_DATE
-          AND p.data_entrega IS NOT NULL
-    """)
-    atraso_entrega = cur.fetchone()[0]
-    cur.execute("""
-        SELECT COUNT(*) FROM pedidos_teste p
-        JOIN status_logistico_teste s ON p.status_logistico_id = s.id
-        WHERE s.descricao != 'Entregue'
-          AND p.data_expedicao < CURRENT_DATE
-          AND p.data_expedicao IS NOT NULL
-    """)
-    atraso_expedicao = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return atraso_entrega, atraso_expedicao
+    # Um cache por alvo: números lidos da réplica não são servidos a quem acabou de editar
+    return cache_indicadores.obter(('dashboard', alvo_leitura()), _consultar_indicadores)
+
+def _indicadores_evento():
+    # Chamado pela thread de eventos, fora de requisição
+    with app.app_context():
+        indicadores = contar_pedidos_atrasados()
+        return {'html': render_template(
+            'order_tracking_indicadores.html',
+            atraso_entrega=indicadores['atraso_entrega'],
+            atraso_expedicao=indicadores['atraso_expedicao'],
+            pedidos_por_status=indicadores['por_status']
+        )}
+
+iniciar_eventos(ao_alterar=[_pedidos_alterados], indicadores=_indicadores_evento)
 
 @app.route('/', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         senha = request.form.get('senha')
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM usuarios WHERE email = %s AND ativo = TRUE", (email,))
-        usuario = cur.fetchone()
-        cur.close()
-        conn.close()
+        with conexao() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("SELECT * FROM usuarios WHERE email = %s AND ativo = TRUE", (email,))
+            usuario = cur.fetchone()
+            cur.close()
         if usuario and check_password_hash(usuario['senha'], senha):
             session['usuario'] = usuario['nome']
             session['email'] = usuario['email']
@@ -167,104 +157,122 @@ def login():
 @login_required
 def order_tracking():
     form = EditPedidoForm()
-    form.status_logistico_id.choices = [
-        (1, 'Aguardando Envio'),
-        (2, 'Em Trânsito'),
-        (3, 'Entregue'),
-        (4, 'Atrasado'),
-    ]
-    page = request.args.get('page', 1, type=int)
+    form.status_logistico_id.choices = choices_status()
+    page = max(request.args.get('page', 1, type=int), 1)
+    cursor = request.args.get('cursor')
     per_page = 12
-    offset = (page - 1) * per_page
-    situacoes_desejadas = ['Atendido', '02 Faturado MMVB', 'Em aberto']
     f_pedido = request.values.get('f_pedido', '')
     f_cliente = request.values.get('f_cliente', '')
     f_status = request.values.get('f_status', 'Todos')
     f_data_ini = request.values.get('f_data_ini', '')
     f_data_fim = request.values.get('f_data_fim', '')
-    pedidos = get_pedidos(
-        data_ini=f_data_ini, data_fim=f_data_fim,
-        f_pedido=f_pedido, f_cliente=f_cliente, f_status=f_status,
-        limit=per_page, offset=offset,
-        situacoes=situacoes_desejadas
-    )
-    total_count = count_pedidos(f_pedido=f_pedido, f_cliente=f_cliente, f_status=f_status, 
-                                data_ini=f_data_ini, data_fim=f_data_fim)
-    total_pages = (total_count + per_page - 1) // per_page
-    pedidos = processa_pedidos(pedidos)
-    atraso_entrega, atraso_expedicao = contar_pedidos_atrasados()
+    filtros = {'f_pedido': f_pedido, 'f_cliente': f_cliente, 'f_status': f_status,
+               'f_data_ini': f_data_ini, 'f_data_fim': f_data_fim}
+
     usuario_perfil = session.get('perfil', 'visualizador')
-    atraso_entrega = atraso_expedicao = 0
+    indicadores = {'atraso_entrega': 0, 'atraso_expedicao': 0, 'por_status': {}}
     if usuario_perfil in ['admin', 'editor']:
-        atraso_entrega = sum(
-            1 for p in pedidos 
-            if p.get('status_descricao') == 'Atrasado' 
-               or (p.get('data_entrega') and p.get('data_entrega') < date.today())
+        # Indicadores e versão dos dados (ao mesmo tempo com CONSULTAS_PARALELAS=1); a listagem
+        # só é consultada se a resposta não estiver em cache
+        indicadores, (versao, modificado) = em_paralelo(contar_pedidos_atrasados, versao_dados)
+    else:
+        versao, modificado = versao_dados()
+    chave = chave_listagem()
+    etag = etag_listagem(chave, versao, indicadores['atraso_entrega'], indicadores['atraso_expedicao'],
+                         sorted(indicadores['por_status'].items()))
+    if request.method == 'GET' and nao_modificado(etag):
+        return marcar_cache(app.response_class(status=304), etag, modificado)
+
+    def renderizar_cards():
+        pedidos, total_count, navegacao = paginar_pedidos(
+            page, cursor, per_page,
+            data_ini=f_data_ini, data_fim=f_data_fim,
+            f_pedido=f_pedido, f_cliente=f_cliente, f_status=f_status,
+            situacoes=SITUACOES_ORDER_TRACKING
         )
-        atraso_expedicao = sum(
-            1 for p in pedidos
-            if p.get('status_descricao') == 'Aguardando Envio' and p.get('expedicao_atrasada', False)
+        total_pages = (total_count + per_page - 1) // per_page
+        with medir('processa_pedidos'):
+            pedidos = processa_pedidos(pedidos)
+        return render_template(
+            'order_tracking_cards.html',
+            pedidos=pedidos,
+            filtros=filtros,
+            page=page,
+            total_pages = total_pages,
+            navegacao=navegacao
         )
-    return render_template(
+
+    resposta = make_response(render_template(
         'order_tracking.html',
-        pedidos=pedidos,
-        filtros={'f_pedido': f_pedido, 'f_cliente': f_cliente, 'f_status': f_status,
-                 'f_data_ini': f_data_ini, 'f_data_fim': f_data_fim},
+        fragmento_pedidos=fragmento(chave, versao, renderizar_cards),
+        filtros=filtros,
         form=form,
+        form_lote=ImportarLoteForm(),
+        form_rastreio=ImportarLoteForm(prefix='rastreio'),
+        ingestao=session.pop('ingestao', None),
+        formatos_exportacao=FORMATOS,
+        eventos_ao_vivo=ao_vivo(),
+        eventos_polling=EVENTOS_POLLING,
+        status_opcoes=[d for _, d in form.status_logistico_id.choices],
         active_page = 'order_tracking',
-        atraso_entrega=atraso_entrega,
-        atraso_expedicao=atraso_expedicao,
-        page=page,
-        total_pages = total_pages
-    )
+        atraso_entrega=indicadores['atraso_entrega'],
+        atraso_expedicao=indicadores['atraso_expedicao'],
+        pedidos_por_status=indicadores['por_status']
+    ))
+    return marcar_cache(resposta, etag, modificado)
 
 
 @app.route('/pedidos')
 @login_required
 def pedidos_tabela():
-    page = int(request.args.get('page', 1))
+    page = max(request.args.get('page', 1, type=int), 1)
+    cursor = request.args.get('cursor')
     per_page = 30
-    offset = (page - 1) * per_page
 
     f_pedido = request.args.get('f_pedido', '')
     f_cliente = request.args.get('f_cliente', '')
     f_status = request.args.get('f_status', 'Todos')
     f_data_ini = request.args.get('f_data_ini', '')
     f_data_fim = request.args.get('f_data_fim', '')
+    filtros = {'f_pedido': f_pedido, 'f_cliente': f_cliente, 'f_status': f_status,
+               'f_data_ini': f_data_ini, 'f_data_fim': f_data_fim}
+
+    versao, modificado = versao_dados()
+    chave = chave_listagem()
+    etag = etag_listagem(chave, versao)
+    if nao_modificado(etag):
+        return marcar_cache(app.response_class(status=304), etag, modificado)
+
+    def renderizar_tabela():
+        pedidos, total_count, navegacao = paginar_pedidos(
+            page, cursor, per_page,
+            f_pedido=f_pedido,
+            f_cliente=f_cliente,
+            f_status=f_status,
+            data_ini=f_data_ini,
+            data_fim=f_data_fim,
+            situacoes=SITUACOES_PEDIDOS
+        )
 
-    situacoes_permitidas = ['Em aberto', '01 E-Bikes']  # Ajustado nome igual ao do banco
-
-    pedidos = get_pedidos(
-        f_pedido=f_pedido,
-        f_cliente=f_cliente,
-        f_status=f_status,
-        data_ini=f_data_ini,
-        data_fim=f_data_fim,
-        situacoes=situacoes_permitidas,
-        limit=per_page,
-        offset=offset
-    )
-
-    total_count = count_pedidos(
-        f_pedido=f_pedido,
-        f_cliente=f_cliente,
-        f_status=f_status,
-        data_ini=f_data_ini,
-        data_fim=f_data_fim,
-        situacoes=situacoes_permitidas
-    )
+        total_pages = (total_count + per_page - 1) // per_page
 
-    total_pages = (total_count + per_page - 1) // per_page
+        return render_template(
+            'pedidos_tabela_linhas.html',
+            pedidos=pedidos,
+            filtros=filtros,
+            page=page,
+            total_pages=total_pages,
+            navegacao=navegacao
+        )
 
-    return render_template(
+    resposta = make_response(render_template(
         'pedidos_tabela.html',
-        pedidos=pedidos,
-        filtros={'f_pedido': f_pedido, 'f_cliente': f_cliente, 'f_status': f_status,
-                 'f_data_ini': f_data_ini, 'f_data_fim': f_data_fim},
-        page=page,
-        total_pages=total_pages,
+        fragmento_pedidos=fragmento(chave, versao, renderizar_tabela),
+        filtros=filtros,
+        status_opcoes=[d for _, d in choices_status()],
         active_page='pedidos_tabela'
-    )
+    ))
+    return marcar_cache(resposta, etag, modificado)
 
 
 
@@ -273,12 +281,7 @@ def pedidos_tabela():
 @login_required
 def editar_pedido():
     form = EditPedidoForm()
-    form.status_logistico_id.choices = [
-        (1, 'Aguardando Envio'),
-        (2, 'Em Trânsito'),
-        (3, 'Entregue'),
-        (4, 'Atrasado'),
-    ]
+    form.status_logistico_id.choices = choices_status()
     if not form.validate_on_submit():
         flash("Formulário inválido!", "danger")
         return redirect(url_for('order_tracking'))
@@ -291,58 +294,6 @@ def editar_pedido():
         flash("Você não tem permissão para editar!", "danger")
         return redirect(url_for('order_tracking'))
     
-    pedido_id = request.form.get('id')
-    status_id = request.form.get('status_logistico_id')
-    data_exp = request.form.get('data_expedicao') or None
-    data_prev = request.form.get('data_previsao') or None
-    data_entr = request.form.get('data_entrega') or None
-    transp = request.form.get('transportadora') or None
-    rast = request.form.get('cod_rastreamento') or None
-    frete = request.form.get('frete') or None
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Buscar valor antigo de data_expedicao e número do pedido
-    cur.execute("SELECT data_expedicao, n_pedido FROM pedidos_teste WHERE id=%s", (pedido_id,))
-    result = cur.fetchone()
-    data_exp_antiga = result[0] if result else None
-    numero_pedido = result[1] if result else None
-
-    # Atualizar pedido
-    cur.execute("""
-        UPDATE pedidos_teste SET
-            status_logistico_id = %s,
-            data_expedicao = %s,
-            data_previsao = %s,
-            data_entrega = %s,
-            transportadora = %s,
-            cod_rastreamento = %s,
-            frete = %s
-        WHERE id = %s
-    """, (
-        status_id, data_exp, data_prev, data_entr,
-        transp, rast, frete, pedido_id
-    ))
-
-    # Registrar log se data_expedicao mudou
-    if str(data_exp_antiga or '') != str(data_exp or ''):
-        registrar_log_alteracao(
-            conn,
-            pedido_id,
-            numero_pedido,
-            'data_expedicao',
-            str(data_exp_antiga),
-            str(data_exp),
-            session.get('usuario', 'desconhecido')
-        )
-
-    conn.commit()
-    cur.close()
-    conn.close()
-
-    flash("Pedido atualizado com sucesso!", "success")
-
     # --- Mantendo filtros atuais após update ---
     filtros = {
         'f_pedido': request.form.get('f_pedido', ''),
@@ -352,9 +303,264 @@ def editar_pedido():
         'f_data_fim': request.form.get('f_data_fim', '')
     }
     query_string = urlencode(filtros)
+
+    pedido_id = request.form.get('id')
+    alteracoes, erros = validar_alteracoes({c: request.form.get(c) for c in CAMPOS_EDITAVEIS})
+    if erros:
+        # Nada é gravado, como na API (api_editar_pedido)
+        flash("Pedido não atualizado: " + " ".join(f"{c}: {m}" for c, m in erros.items()), "danger")
+        return redirect(url_for('order_tracking') + '?' + query_string)
+
+    with conexao() as conn:
+        atualizar_pedido(conn, pedido_id, alteracoes, session.get('usuario', 'desconhecido'))
+        conn.commit()
+    _pedidos_alterados()
+
+    flash("Pedido atualizado com sucesso!", "success")
     return redirect(url_for('order_tracking') + '?' + query_string)
 
 
+def _json_registro(registro):
+    return {k: v.isoformat() if isinstance(v, date) else v for k, v in registro.items()}
+
+
+def _erro_api_edicao():
+    if session.get('perfil') not in ['admin', 'editor']:
+        return jsonify({'erro': 'Você não tem permissão para editar!'}), 403
+    if app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError:
+            return jsonify({'erro': 'Token CSRF inválido ou expirado.'}), 400
+    return None
+
+
+@app.route('/api/pedidos/<int:pedido_id>', methods=['PATCH'])
+@login_required
+def api_editar_pedido(pedido_id):
+    # Edição inline: grava só os campos enviados e devolve o pedido recalculado e o card
+    # renderizado, para a página trocar o card sem recarregar a listagem
+    erro = _erro_api_edicao()
+    if erro:
+        return erro
+
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict) or not dados:
+        return jsonify({'erro': 'Envie um objeto JSON com os campos a alterar.'}), 400
+    alteracoes, erros = validar_alteracoes(dados)
+    if erros:
+        return jsonify({'erro': 'Dados inválidos.', 'campos': erros}), 400
+
+    with conexao() as conn:
+        pedido, alterados = atualizar_pedido(conn, pedido_id, alteracoes, session.get('usuario', 'desconhecido'))
+        if pedido is None:
+            conn.rollback()
+            return jsonify({'erro': 'Pedido não encontrado.'}), 404
+        conn.commit()
+    _pedidos_alterados()
+
+    pedido = processa_pedidos([pedido])[0]
+    return jsonify({
+        'pedido': _json_registro(pedido),
+        'alterados': alterados,
+        'html': render_template('order_tracking_card.html', p=pedido)
+    })
+
+
+@app.route('/api/pedidos/<int:pedido_id>/historico')
+@login_required
+def api_historico_pedido(pedido_id):
+    # Alterações do pedido, mais recentes primeiro; 'proximo' vai em ?antes= para a página seguinte
+    antes = request.args.get('antes', type=int)
+    limite = min(max(request.args.get('limite', HISTORICO_POR_PAGINA, type=int), 1), 500)
+    linhas, proximo = historico_pedido(pedido_id, antes, limite)
+    return jsonify({'historico': [_json_registro(l) for l in linhas], 'proximo': proximo})
+
+
+@app.route('/eventos/pedidos')
+@login_required
+def eventos_pedidos():
+    # Server-Sent Events com as alterações de pedidos e os indicadores (ver eventos.py).
+    # 204 em workers síncronos: o EventSource não reconecta e não prende um worker
+    if not ao_vivo():
+        return app.response_class(status=204)
+    return Response(fluxo_eventos(session.get('perfil') in ['admin', 'editor']), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/pedidos/cards')
+@login_required
+def api_cards_pedidos():
+    # Cards renderizados dos pedidos informados (?ids=1,2,3), para a atualização ao vivo.
+    # A conferência periódica (workers síncronos) manda o ETag da última resposta e recebe
+    # 304 enquanto a versão dos dados não muda, sem consultar os pedidos
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()][:100]
+    versao, modificado = versao_dados()
+    etag = etag_listagem((request.endpoint, tuple(ids), session.get('perfil'), date.today().isoformat()), versao)
+    if nao_modificado(etag):
+        return marcar_cache(app.response_class(status=304), etag, modificado)
+    pedidos = processa_pedidos(get_pedidos_por_ids(ids))
+    resposta = jsonify({str(p['id']): render_template('order_tracking_card.html', p=p) for p in pedidos})
+    return marcar_cache(resposta, etag, modificado)
+
+
+@app.route('/api/pedidos/lote', methods=['POST'])
+@login_required
+def api_editar_pedidos_em_lote():
+    # Mesmo conjunto de campos aplicado a vários pedidos, por id ({"ids": [...]}) ou
+    # número ({"pedidos": [...]}), num único UPDATE e num único INSERT de log
+    erro = _erro_api_edicao()
+    if erro:
+        return erro
+
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        dados = {}
+    chave = 'id' if 'ids' in dados else 'pedido'
+    valores = dados.get('ids', dados.get('pedidos'))
+    campos = dados.get('campos')
+    if not isinstance(valores, list) or not valores or not isinstance(campos, dict) or not campos:
+        return jsonify({'erro': 'Envie {"ids" ou "pedidos": [...], "campos": {...}}.'}), 400
+    try:
+        valores = sorted({int(v) for v in valores})
+    except (TypeError, ValueError):
+        return jsonify({'erro': 'Lista de pedidos inválida.'}), 400
+    if len(valores) > LOTE_MAX_LINHAS:
+        return jsonify({'erro': f'Máximo de {LOTE_MAX_LINHAS} pedidos por lote.'}), 400
+    alteracoes, erros = validar_alteracoes(campos)
+    if erros:
+        return jsonify({'erro': 'Dados inválidos.', 'campos': erros}), 400
+
+    with conexao() as conn:
+        resumo = atualizar_pedidos_em_lote(conn, chave, {v: alteracoes for v in valores}, list(alteracoes),
+                                           session.get('usuario', 'desconhecido'))
+        conn.commit()
+    _pedidos_alterados()
+    return jsonify(resumo)
+
+
+@app.route('/pedidos/lote/importar', methods=['POST'])
+@login_required
+def importar_lote_pedidos():
+    # Planilha (CSV/XLSX) com a coluna 'pedido' e os campos a alterar, tipicamente os
+    # códigos de rastreio após a coleta; tudo ou nada, numa transação
+    form = ImportarLoteForm()
+    if session.get('perfil') not in ['admin', 'editor']:
+        flash("Você não tem permissão para editar!", "danger")
+        return redirect(url_for('order_tracking'))
+    if not form.validate_on_submit():
+        flash("Envie um arquivo CSV ou XLSX.", "danger")
+        return redirect(url_for('order_tracking'))
+
+    arquivo = form.arquivo.data
+    linhas, campos, erros = ler_planilha_lote(arquivo.read(), arquivo.filename or '')
+    if erros:
+        resto = f" (e mais {len(erros) - 5})" if len(erros) > 5 else ""
+        flash("Nenhum pedido foi alterado: " + "; ".join(erros[:5]) + resto, "danger")
+        return redirect(url_for('order_tracking'))
+    if not linhas:
+        flash("A planilha não tem pedidos.", "warning")
+        return redirect(url_for('order_tracking'))
+
+    with conexao() as conn:
+        resumo = atualizar_pedidos_em_lote(conn, 'pedido', linhas, campos, session.get('usuario', 'desconhecido'),
+                                           manter_vazios=True)
+        conn.commit()
+    _pedidos_alterados()
+
+    mensagem = (f"{len(resumo['atualizados'])} pedido(s) processado(s), "
+                f"{len(resumo['alterados'])} com alterações.")
+    if resumo['nao_encontrados']:
+        nao_encontrados = ', '.join(str(n) for n in resumo['nao_encontrados'][:20])
+        mensagem += f" Não encontrados: {nao_encontrados}" + ('...' if len(resumo['nao_encontrados']) > 20 else '.')
+    flash(mensagem, "warning" if resumo['nao_encontrados'] else "success")
+    return redirect(url_for('order_tracking'))
+
+
+@app.route('/pedidos/rastreio/importar', methods=['POST'])
+@login_required
+def importar_rastreio_transportadora():
+    # Arquivo diário da transportadora (ver ingestao_transportadoras.py), ingerido em segundo
+    # plano (jobs_ingestao.py): a página acompanha pelo status e, no fim, oferece o relatório
+    # das linhas rejeitadas
+    form = ImportarLoteForm(prefix='rastreio')
+    if session.get('perfil') not in ['admin', 'editor']:
+        flash("Você não tem permissão para editar!", "danger")
+        return redirect(url_for('order_tracking'))
+    if not form.validate_on_submit():
+        flash("Envie um arquivo CSV ou XLSX.", "danger")
+        return redirect(url_for('order_tracking'))
+
+    arquivo = form.arquivo.data
+    job = iniciar_ingestao(arquivo, arquivo.filename or '', session.get('usuario', 'desconhecido'),
+                           ao_concluir=_pedidos_alterados)
+    session['ingestao'] = job['chave']
+    flash(f"Arquivo {arquivo.filename} recebido; a importação continua em segundo plano.", "info")
+    return redirect(url_for('order_tracking'))
+
+
+def _mensagem_ingestao(resumo):
+    # (mensagem, categoria) do resultado de uma ingestão
+    if resumo['erros_arquivo']:
+        return "Arquivo rejeitado: " + "; ".join(resumo['erros_arquivo'][:5]), "danger"
+    mensagem = (f"{resumo['linhas']} linha(s) lida(s): {resumo['alterados']} pedido(s) alterado(s), "
+                f"{resumo['processados'] - resumo['alterados']} sem mudança, {resumo['erros']} com erro.")
+    if resumo['erros']:
+        mensagem += " " + "; ".join(f"linha {linha}: {erro}" for linha, _, erro in resumo['amostra_erros'])
+    return mensagem, "warning" if resumo['erros'] else "success"
+
+
+@app.route('/pedidos/rastreio/importacoes/<chave>')
+@login_required
+def status_ingestao(chave):
+    job = ler_ingestao(chave)
+    if not job:
+        return jsonify({'erro': 'Importação não encontrada.'}), 404
+    resposta = {k: job.get(k) for k in ('chave', 'status', 'arquivo', 'linhas', 'erro')}
+    if job['status'] == 'pronto':
+        resposta['mensagem'], resposta['categoria'] = _mensagem_ingestao(job['resumo'])
+        resposta['alterados'] = job['resumo']['alterados']
+        if job.get('relatorio'):
+            resposta['url_relatorio'] = url_for('relatorio_rastreio_transportadora', chave=chave)
+        # Read-your-writes: a escrita foi feita pela thread do job, fora desta sessão; o LSN
+        # atual do primário já inclui o commit dela
+        if resposta['alterados']:
+            lsn = lsn_atual()
+            if lsn:
+                session['lsn_escrita'] = lsn
+                exigir_lsn(lsn)
+    elif job['status'] == 'erro':
+        resposta['mensagem'], resposta['categoria'] = "Falha na importação: " + (job['erro'] or ''), "danger"
+    return jsonify(resposta)
+
+
+@app.route('/pedidos/rastreio/relatorios/<chave>')
+@login_required
+def relatorio_rastreio_transportadora(chave):
+    caminho = caminho_relatorio(chave)
+    if caminho is None or not os.path.exists(caminho):
+        flash("Relatório não encontrado ou expirado.", "warning")
+        return redirect(url_for('order_tracking'))
+    return send_file(caminho, mimetype='text/csv', as_attachment=True, download_name='erros_rastreio.csv')
+
+
+@app.route('/sla')
+@login_required
+def sla_logistico():
+    data_ini, data_fim = periodo_sla(request.args.get('f_data_ini', ''), request.args.get('f_data_fim', ''))
+    with medir('sla'):
+        indicadores = indicadores_sla(data_ini, data_fim)
+    return render_template('sla.html', indicadores=indicadores, active_page='sla')
+
+
+@app.route('/api/sla')
+@login_required
+def api_sla():
+    data_ini, data_fim = periodo_sla(request.args.get('f_data_ini', ''), request.args.get('f_data_fim', ''))
+    with medir('sla'):
+        return jsonify(indicadores_sla(data_ini, data_fim))
+
+
 @app.route('/exportar_pedidos')
 @login_required
 def exportar_pedidos():
@@ -365,55 +571,78 @@ def exportar_pedidos():
     f_data_ini = request.args.get('f_data_ini', '')
     f_data_fim = request.args.get('f_data_fim', '')
 
-    # Busca pedidos filtrados
-    pedidos = get_pedidos(
-        data_ini=f_data_ini, data_fim=f_data_fim,
-        f_pedido=f_pedido, f_cliente=f_cliente, f_status=f_status,
-        limit=None, offset=None
-    )
-    pedidos = processa_pedidos(pedidos)
-
-    # Criar DataFrame e remover colunas desnecessárias
-    df = pd.DataFrame(pedidos)
-
-    colunas_para_remover = ['status_cor', 'entrega_atrasada', 'expedicao_atrasada', 'id']
-    for col in colunas_para_remover:
-        if col in df.columns:
-            df.drop(columns=col, inplace=True)
-
-    df = df[['Cliente',
-    'Nota_Fiscal',
-    'data_pedido',
-    'data_expedicao',
-    'data_previsao',
-    'data_entrega',
-    'transportadora',
-    'cod_rastreamento',
-    'frete',
-    'status_descricao',
-    'situacao_comercial'
-    ]]
-
-    # Formatar datas para string dd/mm/yyyy
-    for col in ['data_pedido', 'data_expedicao', 'data_previsao', 'data_entrega']:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%d/%m/%Y')
-
-    # Gerar Excel em memória
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Pedidos')
-    output.seek(0)
+    filtros = dict(data_ini=f_data_ini, data_fim=f_data_fim,
+                   f_pedido=f_pedido, f_cliente=f_cliente, f_status=f_status)
+
+    if request.args.get('formato') == 'csv':
+        # CSV sai em streaming, lote a lote, direto do cursor do banco
+        return Response(
+            stream_with_context(gerar_csv(filtros)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=pedidos_exportados.csv'}
+        )
+
+    if request.args.get('formato') == 'parquet' and 'parquet' in FORMATOS:
+        arquivo = tempfile.NamedTemporaryFile(suffix='.parquet')
+        exportar_paralelo(filtros, 'parquet', arquivo.name)
+        return send_file(arquivo, mimetype=MIMETYPES['parquet'], as_attachment=True,
+                         download_name='pedidos_exportados.parquet')
+
+    with medir('excel'):
+        arquivo = gerar_xlsx(filtros)
 
     # Enviar arquivo para download
     return send_file(
-        output,
+        arquivo,
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         as_attachment=True,
         download_name='pedidos_exportados.xlsx'
     )
 
 
+def _job_json(job):
+    resposta = {k: job.get(k) for k in ('chave', 'status', 'formato', 'linhas', 'total', 'erro')}
+    resposta['url_status'] = url_for('status_exportacao', chave=job['chave'])
+    if job.get('status') == 'pronto':
+        resposta['url_download'] = url_for('download_exportacao', chave=job['chave'])
+    return resposta
+
+
+@app.route('/exportacoes', methods=['POST'])
+@login_required
+def iniciar_exportacao_pedidos():
+    filtros = dict(data_ini=request.form.get('f_data_ini', ''), data_fim=request.form.get('f_data_fim', ''),
+                   f_pedido=request.form.get('f_pedido', ''), f_cliente=request.form.get('f_cliente', ''),
+                   f_status=request.form.get('f_status', 'Todos'))
+    job = iniciar_exportacao(filtros, request.form.get('formato', 'xlsx'), session.get('usuario'))
+    return jsonify(_job_json(job)), 202
+
+
+@app.route('/exportacoes/<chave>')
+@login_required
+def status_exportacao(chave):
+    job = ler_job(chave)
+    if not job:
+        return jsonify({'erro': 'Exportação não encontrada.'}), 404
+    return jsonify(_job_json(job))
+
+
+@app.route('/exportacoes/<chave>/arquivo')
+@login_required
+def download_exportacao(chave):
+    caminho = arquivo_job(chave)
+    if not caminho:
+        flash("Arquivo de exportação não encontrado ou expirado.", "warning")
+        return redirect(url_for('order_tracking'))
+    formato = ler_job(chave)['formato']
+    return send_file(
+        caminho,
+        mimetype=MIMETYPES[formato],
+        as_attachment=True,
+        download_name=f'pedidos_exportados.{formato}'
+    )
+
+
 USUARIOS_POR_PAGINA = 10
 
 def admin_required():
@@ -431,22 +660,21 @@ def listar_usuarios():
     pagina = request.args.get('pagina', 1, type=int)
     offset = (pagina - 1) * USUARIOS_POR_PAGINA
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with conexao() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) FROM usuarios")
-    total = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM usuarios")
+        total = cur.fetchone()[0]
 
-    cur.execute("""
-        SELECT id, nome, email, perfil, ativo
-        FROM usuarios
-        ORDER BY nome
-        LIMIT %s OFFSET %s
-    """, (USUARIOS_POR_PAGINA, offset))
-    usuarios = cur.fetchall()
+        cur.execute("""
+            SELECT id, nome, email, perfil, ativo
+            FROM usuarios
+            ORDER BY nome
+            LIMIT %s OFFSET %s
+        """, (USUARIOS_POR_PAGINA, offset))
+        usuarios = cur.fetchall()
 
-    cur.close()
-    conn.close()
+        cur.close()
 
     total_paginas = ceil(total / USUARIOS_POR_PAGINA)
 
@@ -475,15 +703,14 @@ def criar_usuario():
 
         senha_hash = generate_password_hash(senha)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO usuarios (nome, email, senha, perfil, ativo)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (nome, email, senha_hash, perfil, ativo))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with conexao() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO usuarios (nome, email, senha, perfil, ativo)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (nome, email, senha_hash, perfil, ativo))
+            conn.commit()
+            cur.close()
 
         flash("Usuário criado com sucesso!", "success")
         return redirect(url_for('listar_usuarios'))
@@ -496,9 +723,6 @@ def editar_usuario(id):
     if not admin_required():
         return redirect(url_for('order_tracking'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     if request.method == 'POST':
         nome = request.form.get('nome')
         email = request.form.get('email')
@@ -510,27 +734,29 @@ def editar_usuario(id):
             flash("Nome, email e perfil são obrigatórios.", "danger")
             return redirect(url_for('editar_usuario', id=id))
 
-        if senha:
-            senha_hash = generate_password_hash(senha)
-            cur.execute("""
-                UPDATE usuarios SET nome=%s, email=%s, senha=%s, perfil=%s, ativo=%s WHERE id=%s
-            """, (nome, email, senha_hash, perfil, ativo, id))
-        else:
-            cur.execute("""
-                UPDATE usuarios SET nome=%s, email=%s, perfil=%s, ativo=%s WHERE id=%s
-            """, (nome, email, perfil, ativo, id))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with conexao() as conn:
+            cur = conn.cursor()
+            if senha:
+                senha_hash = generate_password_hash(senha)
+                cur.execute("""
+                    UPDATE usuarios SET nome=%s, email=%s, senha=%s, perfil=%s, ativo=%s WHERE id=%s
+                """, (nome, email, senha_hash, perfil, ativo, id))
+            else:
+                cur.execute("""
+                    UPDATE usuarios SET nome=%s, email=%s, perfil=%s, ativo=%s WHERE id=%s
+                """, (nome, email, perfil, ativo, id))
+            conn.commit()
+            cur.close()
 
         flash("Usuário atualizado com sucesso!", "success")
         return redirect(url_for('listar_usuarios'))
 
     # GET - buscar dados para preencher o formulário
-    cur.execute("SELECT nome, email, perfil, ativo FROM usuarios WHERE id=%s", (id,))
-    usuario = cur.fetchone()
-    cur.close()
-    conn.close()
+    with conexao() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT nome, email, perfil, ativo FROM usuarios WHERE id=%s", (id,))
+        usuario = cur.fetchone()
+        cur.close()
 
     if not usuario:
         flash("Usuário não encontrado.", "danger")
@@ -544,12 +770,11 @@ def excluir_usuario(id):
     if not admin_required():
         return redirect(url_for('order_tracking'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM usuarios WHERE id=%s", (id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conexao() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM usuarios WHERE id=%s", (id,))
+        conn.commit()
+        cur.close()
 
     flash("Usuário excluído com sucesso!", "success")
     return redirect(url_for('listar_usuarios'))
@@ -560,12 +785,11 @@ def desativar_usuario(id):
     if not admin_required():
         return redirect(url_for('listar_usuarios'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE usuarios SET ativo=FALSE WHERE id=%s", (id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conexao() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE usuarios SET ativo=FALSE WHERE id=%s", (id,))
+        conn.commit()
+        cur.close()
 
     flash("Usuário desativado com sucesso!", "success")
     return redirect(url_for('listar_usuarios'))
@@ -579,11 +803,6 @@ def logout():
     flash('Você saiu do sistema.', 'success')
     return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(query, params)
-    return cur.fetchone()[0]
-
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+# Benchmark dos filtros de busca (f_pedido, f_cliente, f_nota) por tamanho de tabela.
+#
+# Cria um schema separado com dados sintéticos, mede os predicados antigos
+# (ILIKE '%x%' sem índice) e os de busca.py após aplicar migrations/0001_busca_trigram.sql.
+#
+#   DB_NAME=... DB_USER=... python benchmarks/busca_trigram.py 10000 100000 1000000
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db import get_db_connection
+from busca import filtro_numero, filtro_nome
+
+SCHEMA = "bench_busca"
+REPETICOES = 5
+MIGRATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations', '0001_busca_trigram.sql')
+
+CONSULTA = """
+    SELECT p.id FROM pedidos_teste p
+    LEFT JOIN notas_fiscais_teste n ON p.id_nf = n.id
+    WHERE 1=1 {filtro}
+    ORDER BY p.data_pedido DESC, p.id DESC LIMIT 12
+"""
+
+CASOS = [
+    ("f_pedido", "p.n_pedido", "4217", filtro_numero),
+    ("f_nota", "n.n_nota", "98765", filtro_numero),
+    ("f_cliente", "n.nome_cliente", "Bicicletas Sul", filtro_nome),
+]
+
+
+def criar_dados(cur, linhas):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"SET search_path = {SCHEMA}, public")
+    cur.execute("""
+        CREATE TABLE notas_fiscais_teste (id SERIAL PRIMARY KEY, n_nota INTEGER, nome_cliente TEXT);
+        CREATE TABLE pedidos_teste (id SERIAL PRIMARY KEY, n_pedido INTEGER, id_nf INTEGER, data_pedido DATE);
+    """)
+    cur.execute("""
+        INSERT INTO notas_fiscais_teste (n_nota, nome_cliente)
+        SELECT 100000 + g, 'Cliente ' || md5(g::text) || CASE WHEN g %% 997 = 0 THEN ' Bicicletas Sul' ELSE '' END
+        FROM generate_series(1, %s) g
+    """, (linhas,))
+    cur.execute("""
+        INSERT INTO pedidos_teste (n_pedido, id_nf, data_pedido)
+        SELECT g, g, DATE '2020-01-01' + (g %% 2000)
+        FROM generate_series(1, %s) g
+    """, (linhas,))
+    cur.execute("CREATE INDEX ON pedidos_teste (data_pedido DESC, id DESC)")
+    cur.execute("ANALYZE")
+
+
+def medir(cur, sql, params):
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def main(tamanhos):
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+    print(f"{'linhas':>10} {'filtro':>10} {'antigo (ms)':>12} {'indexado (ms)':>14}")
+    try:
+        for linhas in tamanhos:
+            criar_dados(cur, linhas)
+            antigos = {}
+            for nome, coluna, valor, _ in CASOS:
+                coluna_texto = coluna if nome == "f_cliente" else f"CAST({coluna} AS TEXT)"
+                antigos[nome] = medir(cur, CONSULTA.format(filtro=f" AND {coluna_texto} ILIKE %s"),
+                                      [f"%{valor}%"])
+            with open(MIGRATION) as f:
+                cur.execute(f.read())
+            cur.execute("ANALYZE")
+            for nome, coluna, valor, filtro in CASOS:
+                sql, params = filtro(coluna, valor)
+                novo = medir(cur, CONSULTA.format(filtro=sql), params)
+                print(f"{linhas:>10} {nome:>10} {antigos[nome]:>12.2f} {novo:>14.2f}")
+    finally:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,259 @@
+# Teste de carga das rotas de pedidos, pelo test client do Flask ou contra um gunicorn real.
+#
+# Gera um JSON por execução em benchmarks/resultados/ com p50/p95/p99, vazão e pico
+# de RSS; use benchmarks/comparar.py para comparar duas execuções.
+#
+#   python benchmarks/dados_sinteticos.py 1m --confirmar
+#   python benchmarks/carga.py --modo flask --requisicoes 200 --concorrencia 4
+#   python benchmarks/carga.py --modo gunicorn --workers 4 --requisicoes 500 --concorrencia 16
+
+import argparse
+import http.cookiejar
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+from dados_sinteticos import USUARIO_BENCH, SENHA_BENCH
+
+# (nome, url, fração das requisições) — exportações são bem mais pesadas e rodam menos vezes
+CENARIOS = [
+    ('order_tracking', '/order_tracking', 1.0),
+    ('order_tracking_pagina_5', '/order_tracking?page=5', 0.5),
+    ('order_tracking_filtro_cliente', '/order_tracking?f_cliente=Cliente+123', 0.5),
+    ('pedidos', '/pedidos', 1.0),
+    ('pedidos_filtro_data', '/pedidos?f_data_ini=2024-01-01&f_data_fim=2024-03-31', 0.5),
+    ('exportar_pedidos_csv', '/exportar_pedidos?formato=csv&f_data_ini=2024-01-01&f_data_fim=2024-01-31', 0.05),
+    ('exportar_pedidos_xlsx', '/exportar_pedidos?f_data_ini=2024-01-01&f_data_fim=2024-01-31', 0.05),
+]
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def resumir(tempos, erros, duracao):
+    ms = [t * 1000 for t in tempos]
+    return {
+        'requisicoes': len(tempos) + erros,
+        'erros': erros,
+        'p50_ms': percentil(ms, 50),
+        'p95_ms': percentil(ms, 95),
+        'p99_ms': percentil(ms, 99),
+        'media_ms': statistics.mean(ms) if ms else None,
+        'vazao_rps': len(tempos) / duracao if duracao else None,
+    }
+
+
+def executar_cenario(fazer_requisicao, url, total, concorrencia):
+    tempos = []
+    erros = 0
+    lock = threading.Lock()
+
+    def uma(_):
+        nonlocal erros
+        inicio = time.perf_counter()
+        ok = fazer_requisicao(url)
+        duracao = time.perf_counter() - inicio
+        with lock:
+            if ok:
+                tempos.append(duracao)
+            else:
+                erros += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(uma, range(total)))
+    return resumir(tempos, erros, time.perf_counter() - inicio)
+
+
+# --- Flask test client (mesmo processo) -------------------------------------------
+
+def cliente_flask():
+    import app as aplicacao
+    clientes = threading.local()
+
+    def requisicao(url):
+        if not hasattr(clientes, 'c'):
+            clientes.c = aplicacao.app.test_client()
+            with clientes.c.session_transaction() as s:
+                s['usuario'] = 'Benchmark'
+                s['email'] = USUARIO_BENCH
+                s['perfil'] = 'admin'
+        resposta = clientes.c.get(url)
+        resposta.get_data()
+        return resposta.status_code == 200
+
+    return requisicao, None
+
+
+# --- gunicorn (processos reais) ------------------------------------------------------
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _rss_arvore_kb(pid):
+    # Soma do RSS do master e dos workers (filhos diretos), lida de /proc
+    total = 0
+    pids = [pid]
+    for nome in os.listdir('/proc'):
+        if nome.isdigit():
+            try:
+                with open(f'/proc/{nome}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(nome))
+            except (OSError, ValueError, IndexError):
+                pass
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for linha in f:
+                    if linha.startswith('VmRSS:'):
+                        total += int(linha.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def cliente_gunicorn(workers, extra_args):
+    porta = _porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{porta}', *extra_args, 'app:app'],
+        cwd=RAIZ
+    )
+    base = f'http://127.0.0.1:{porta}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + '/', timeout=1).read()
+            break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        processo.terminate()
+        raise RuntimeError('gunicorn não respondeu')
+
+    pico = {'kb': 0}
+    parar = threading.Event()
+
+    def amostrar_rss():
+        while not parar.is_set():
+            pico['kb'] = max(pico['kb'], _rss_arvore_kb(processo.pid))
+            time.sleep(0.2)
+
+    threading.Thread(target=amostrar_rss, daemon=True).start()
+
+    # Login uma vez só (fora da medição); o cookie de sessão do Flask é reaproveitado por todas as threads
+    cookies = http.cookiejar.CookieJar()
+    dados = urllib.parse.urlencode({'email': USUARIO_BENCH, 'senha': SENHA_BENCH}).encode()
+    urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies)).open(base + '/', dados, timeout=30).read()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+
+    def requisicao(url):
+        try:
+            with opener.open(base + url, timeout=300) as resposta:
+                while resposta.read(65536):
+                    pass
+                return resposta.status == 200 and not resposta.geturl().rstrip('/').endswith(str(porta))
+        except OSError:
+            return False
+
+    def encerrar():
+        parar.set()
+        processo.terminate()
+        processo.wait(timeout=30)
+        return pico['kb']
+
+    return requisicao, encerrar
+
+
+def _total_pedidos():
+    from db import get_db_connection
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM pedidos_teste")
+    total = cur.fetchone()[0]
+    conn.close()
+    return total
+
+
+def _versao():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=RAIZ, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modo', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--requisicoes', type=int, default=100, help='requisições do cenário de peso 1.0')
+    parser.add_argument('--concorrencia', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4, help='workers do gunicorn')
+    parser.add_argument('--gunicorn-arg', action='append', default=[], help='argumento extra para o gunicorn')
+    parser.add_argument('--cenarios', help='nomes separados por vírgula (padrão: todos)')
+    parser.add_argument('--saida', default=os.path.join(RAIZ, 'benchmarks', 'resultados'))
+    args = parser.parse_args()
+
+    cenarios = CENARIOS
+    if args.cenarios:
+        escolhidos = set(args.cenarios.split(','))
+        cenarios = [c for c in CENARIOS if c[0] in escolhidos]
+
+    if args.modo == 'flask':
+        requisicao, encerrar = cliente_flask()
+    else:
+        requisicao, encerrar = cliente_gunicorn(args.workers, args.gunicorn_arg)
+
+    resultado = {
+        'versao': _versao(),
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'modo': args.modo,
+        'workers': args.workers if args.modo == 'gunicorn' else 1,
+        'concorrencia': args.concorrencia,
+        'pedidos_no_banco': _total_pedidos(),
+        'cenarios': {},
+    }
+    try:
+        for nome, url, peso in cenarios:
+            total = max(1, int(args.requisicoes * peso))
+            # Aquecimento: conexões do pool, cache de referências, imports preguiçosos
+            requisicao(url)
+            resultado['cenarios'][nome] = executar_cenario(requisicao, url, total, args.concorrencia)
+            r = resultado['cenarios'][nome]
+            print(f"{nome:32} n={r['requisicoes']:5} erros={r['erros']:3} "
+                  f"p50={r['p50_ms'] or 0:8.1f}ms p95={r['p95_ms'] or 0:8.1f}ms "
+                  f"p99={r['p99_ms'] or 0:8.1f}ms {r['vazao_rps'] or 0:7.1f} req/s", flush=True)
+    finally:
+        pico_kb = encerrar() if encerrar else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    resultado['rss_pico_mb'] = round(pico_kb / 1024, 1)
+    print(f"pico de RSS: {resultado['rss_pico_mb']} MB")
+
+    os.makedirs(args.saida, exist_ok=True)
+    arquivo = os.path.join(args.saida, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.modo}.json")
+    with open(arquivo, 'w') as f:
+        json.dump(resultado, f, indent=2)
+    print(f"resultado salvo em {arquivo}")
+
+
+if __name__ == "__main__":
+    main()
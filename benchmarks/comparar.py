@@ -0,0 +1,61 @@
+# Compara duas execuções de benchmarks/carga.py e aponta regressões.
+#
+#   python benchmarks/comparar.py resultados/antes.json resultados/depois.json --limite 10
+#
+# Sai com código 1 se algum cenário piorar p50/p95/p99 (ou vazão) além do limite em %.
+
+import argparse
+import json
+import sys
+
+METRICAS = [('p50_ms', False), ('p95_ms', False), ('p99_ms', False), ('vazao_rps', True)]
+
+
+def variacao(antes, depois):
+    if not antes or depois is None:
+        return None
+    return (depois - antes) / antes * 100
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('antes')
+    parser.add_argument('depois')
+    parser.add_argument('--limite', type=float, default=10.0, help='piora máxima tolerada em %%')
+    args = parser.parse_args()
+
+    with open(args.antes) as f:
+        antes = json.load(f)
+    with open(args.depois) as f:
+        depois = json.load(f)
+
+    print(f"antes:  {antes.get('versao')} ({antes.get('pedidos_no_banco')} pedidos, {antes.get('modo')})")
+    print(f"depois: {depois.get('versao')} ({depois.get('pedidos_no_banco')} pedidos, {depois.get('modo')})")
+    regressoes = []
+    for nome, r_depois in depois['cenarios'].items():
+        r_antes = antes['cenarios'].get(nome)
+        if not r_antes:
+            continue
+        colunas = []
+        for metrica, maior_melhor in METRICAS:
+            v = variacao(r_antes.get(metrica), r_depois.get(metrica))
+            if v is None:
+                colunas.append(f"{metrica}=    n/d")
+                continue
+            piora = -v if maior_melhor else v
+            marca = ' !' if piora > args.limite else '  '
+            if piora > args.limite:
+                regressoes.append((nome, metrica, v))
+            colunas.append(f"{metrica}={v:+7.1f}%{marca}")
+        print(f"{nome:32} " + ' '.join(colunas))
+
+    rss_v = variacao(antes.get('rss_pico_mb'), depois.get('rss_pico_mb'))
+    if rss_v is not None:
+        print(f"{'rss_pico_mb':32} {rss_v:+7.1f}%")
+    if regressoes:
+        print(f"\n{len(regressoes)} regressão(ões) acima de {args.limite}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
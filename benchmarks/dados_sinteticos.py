@@ -0,0 +1,113 @@
+# Gera dados sintéticos para benchmark em um Postgres local.
+#
+# ATENÇÃO: apaga o conteúdo de pedidos_teste, notas_fiscais_teste, situacoes,
+# status_logistico_teste e log_pedidos do banco apontado por DB_NAME/DB_HOST/...
+#
+#   DB_NAME=order_bench DB_USER=postgres python benchmarks/dados_sinteticos.py 1m --confirmar
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.security import generate_password_hash
+from db import get_db_connection
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+TAMANHOS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+LOTE = 1_000_000
+
+USUARIO_BENCH = 'bench@localhost'
+SENHA_BENCH = 'bench'
+
+
+def gerar(linhas):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # Tabelas e a versão de dados usada pelo cache das listagens
+    for arquivo in ('0000_esquema_base.sql', '0002_versao_dados.sql', '0010_versao_dados_sem_lock.sql'):
+        with open(os.path.join(MIGRATIONS, arquivo)) as f:
+            cur.execute(f.read())
+    cur.execute("""
+        TRUNCATE pedidos_teste, notas_fiscais_teste, situacoes, status_logistico_teste, log_pedidos
+        RESTART IDENTITY
+    """)
+    cur.execute("""
+        INSERT INTO status_logistico_teste (descricao, cor) VALUES
+            ('Aguardando Envio', 'warning'), ('Em Trânsito', 'info'), ('Entregue', 'success'), ('Atrasado', 'danger')
+    """)
+    cur.execute("""
+        INSERT INTO situacoes (situacao) VALUES
+            ('Atendido'), ('02 Faturado MMVB'), ('Em aberto'), ('01 E-Bikes'), ('Cancelado')
+    """)
+    cur.execute("""
+        INSERT INTO usuarios (nome, email, senha, perfil, ativo) VALUES ('Benchmark', %s, %s, 'admin', TRUE)
+        ON CONFLICT (email) DO UPDATE SET senha = EXCLUDED.senha, perfil = 'admin', ativo = TRUE
+    """, (USUARIO_BENCH, generate_password_hash(SENHA_BENCH)))
+    conn.commit()
+
+    # Em lotes para não segurar uma transação gigante nos tamanhos maiores
+    for inicio in range(1, linhas + 1, LOTE):
+        fim = min(inicio + LOTE - 1, linhas)
+        cur.execute("""
+            INSERT INTO notas_fiscais_teste (n_nota, nome_cliente)
+            SELECT 100000 + g, 'Cliente ' || (g %% 50000) || ' ' || substr(md5(g::text), 1, 8)
+            FROM generate_series(%s, %s) g
+        """, (inicio, fim))
+        # ~80% entregues, pedidos espalhados pelos últimos 5 anos, algumas datas nulas
+        cur.execute("""
+            INSERT INTO pedidos_teste (n_pedido, status_logistico_id, id_nf, id_situacao, data_pedido,
+                                       data_expedicao, data_previsao, data_entrega, transportadora,
+                                       cod_rastreamento, frete)
+            SELECT g,
+                   CASE WHEN r < 0.8 THEN 3 WHEN r < 0.9 THEN 2 WHEN r < 0.97 THEN 1 ELSE 4 END,
+                   g,
+                   1 + (g %% 5),
+                   d,
+                   CASE WHEN g %% 10 = 0 THEN NULL ELSE d + 2 END,
+                   d + 7,
+                   CASE WHEN r < 0.8 THEN d + 6 END,
+                   'Transportadora ' || (g %% 12),
+                   'BR' || lpad(g::text, 11, '0'),
+                   ((g %% 400) + 19.9)::text
+            FROM (
+                SELECT g, random() AS r, CURRENT_DATE - (g %% 1825) AS d
+                FROM generate_series(%s, %s) g
+            ) x
+        """, (inicio, fim))
+        conn.commit()
+        print(f"  {fim}/{linhas} pedidos", flush=True)
+
+    # Com as tabelas já particionadas (0009_particionamento.sql), as linhas de anos sem partição
+    # foram para a partição padrão: cria as partições que faltam e as move para elas
+    cur.execute("SELECT to_regclass('particionamento') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("SELECT manter_particoes(tabela) FROM particionamento")
+        conn.commit()
+
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE pedidos_teste")
+    cur.execute("VACUUM ANALYZE notas_fiscais_teste")
+    cur.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('tamanho', choices=sorted(TAMANHOS) + ['custom'])
+    parser.add_argument('--linhas', type=int, help='número de pedidos quando tamanho=custom')
+    parser.add_argument('--confirmar', action='store_true', help='confirma que as tabelas podem ser apagadas')
+    args = parser.parse_args()
+    if not args.confirmar:
+        parser.error(f"isto apaga os pedidos de {os.environ.get('DB_NAME')}; rode novamente com --confirmar")
+    linhas = args.linhas if args.tamanho == 'custom' else TAMANHOS[args.tamanho]
+    inicio = time.perf_counter()
+    gerar(linhas)
+    print(f"{linhas} pedidos gerados em {time.perf_counter() - inicio:.1f}s")
+    print(f"login do benchmark: {USUARIO_BENCH} / {SENHA_BENCH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Mede o custo de importar o app (o que cada worker do gunicorn paga sem preload_app):
+# tempo de `import app` e RSS do processo, num interpretador novo a cada rodada. Com
+# --orcamento-ms / --orcamento-mb sai com código 1 se a mediana passar do orçamento, para
+# segurar o tempo de boot conforme o app cresce.
+#
+#   python benchmarks/inicializacao.py
+#   python benchmarks/inicializacao.py --rodadas 10 --orcamento-ms 400 --orcamento-mb 60
+#   python benchmarks/inicializacao.py --detalhar     # módulos mais lentos (python -X importtime)
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Roda no processo filho; 'ansiosa' importa também o que o app só carrega no primeiro uso,
+# para comparar com o comportamento antigo
+_MEDIR = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+if sys.argv[1] == 'ansiosa':
+    import pandas, openpyxl
+duracao = time.perf_counter() - inicio
+rss = 0
+with open('/proc/self/status') as f:
+    for linha in f:
+        if linha.startswith('VmRSS:'):
+            rss = int(linha.split()[1])
+pesados = [m for m in ('pandas', 'numpy', 'openpyxl', 'pyarrow', 'gevent') if m in sys.modules]
+print(json.dumps({'ms': duracao * 1000, 'rss_kb': rss, 'modulos': len(sys.modules), 'pesados': pesados}))
+"""
+
+
+def medir(modo):
+    saida = subprocess.run([sys.executable, '-c', _MEDIR, modo], cwd=RAIZ, check=True,
+                           capture_output=True, text=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def mais_lentos(quantidade):
+    # -X importtime escreve no stderr "import time: self | cumulative | módulo" (em µs)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=RAIZ, check=True,
+                            capture_output=True, text=True).stderr
+    modulos = []
+    for linha in stderr.splitlines():
+        partes = linha.split('|')
+        if len(partes) == 3 and partes[1].strip().isdigit():
+            # Só os importados diretamente pelo app (um nível de indentação abaixo dele), com o
+            # tempo acumulado, que já inclui os dependentes de cada um
+            nome = partes[2].strip()
+            if len(partes[2]) - len(partes[2].lstrip()) == 3:
+                modulos.append((int(partes[1]) / 1000, nome))
+    return sorted(modulos, reverse=True)[:quantidade]
+
+
+def resumir(rodadas):
+    return {
+        'ms_mediana': statistics.median(r['ms'] for r in rodadas),
+        'ms_min': min(r['ms'] for r in rodadas),
+        'rss_mb_mediana': statistics.median(r['rss_kb'] for r in rodadas) / 1024,
+        'modulos': rodadas[-1]['modulos'],
+        'pesados': rodadas[-1]['pesados'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rodadas', type=int, default=5)
+    parser.add_argument('--orcamento-ms', type=float, help='tempo máximo (mediana) de import app')
+    parser.add_argument('--orcamento-mb', type=float, help='RSS máximo (mediana) depois de import app')
+    parser.add_argument('--detalhar', action='store_true', help='lista os imports mais lentos')
+    parser.add_argument('--saida', default=os.path.join(RAIZ, 'benchmarks', 'resultados'))
+    args = parser.parse_args()
+
+    resultado = {'data': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0], 'modos': {}}
+    for modo in ('preguicosa', 'ansiosa'):
+        medir(modo)  # aquece o cache de bytecode e do sistema de arquivos
+        resumo = resumir([medir(modo) for _ in range(args.rodadas)])
+        resultado['modos'][modo] = resumo
+        print(f"{modo:11} {resumo['ms_mediana']:8.0f}ms (mín {resumo['ms_min']:.0f})  "
+              f"{resumo['rss_mb_mediana']:6.1f}MB  {resumo['modulos']} módulos  "
+              f"pesados: {', '.join(resumo['pesados']) or '-'}", flush=True)
+
+    if args.detalhar:
+        resultado['mais_lentos'] = mais_lentos(15)
+        for ms, nome in resultado['mais_lentos']:
+            print(f"  {ms:8.1f}ms  {nome}")
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(args.saida, time.strftime('inicializacao_%Y%m%d_%H%M%S.json'))
+    with open(caminho, 'w') as f:
+        json.dump(resultado, f, indent=2)
+    print(f"resultado salvo em {caminho}")
+
+    preguicosa = resultado['modos']['preguicosa']
+    estouros = []
+    if args.orcamento_ms is not None and preguicosa['ms_mediana'] > args.orcamento_ms:
+        estouros.append(f"tempo {preguicosa['ms_mediana']:.0f}ms > {args.orcamento_ms:.0f}ms")
+    if args.orcamento_mb is not None and preguicosa['rss_mb_mediana'] > args.orcamento_mb:
+        estouros.append(f"RSS {preguicosa['rss_mb_mediana']:.1f}MB > {args.orcamento_mb:.1f}MB")
+    if estouros:
+        print("orçamento de inicialização estourado: " + '; '.join(estouros))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
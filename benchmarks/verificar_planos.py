@@ -0,0 +1,97 @@
+# Roda EXPLAIN (ANALYZE) nas consultas das listagens e dos indicadores e aponta as que
+# caem em Seq Scan numa tabela grande (mais de --limiar linhas estimadas em pg_class).
+# Sai com código 1 se encontrar alguma, para poder rodar no CI contra um banco de benchmark.
+#
+#   python benchmarks/dados_sinteticos.py 1m --confirmar
+#   python migracoes.py
+#   python benchmarks/verificar_planos.py --limiar 100000
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db import conexao, consultas_listagem, _estimar_linhas, LIMIAR_CONTAGEM_ESTIMADA
+import app as aplicacao
+from app import SITUACOES_ORDER_TRACKING, SITUACOES_PEDIDOS
+
+# Cenários que leem a tabela inteira por definição: o tempo é exibido, o Seq Scan não é erro
+VARREDURA_ESPERADA = {'indicadores'}
+
+
+def cenarios(conn):
+    # (nome, sql, params): as consultas que as telas realmente fazem
+    hoje = date.today()
+    per_page = 31
+    trimestre = dict(data_ini=hoje - timedelta(days=90), data_fim=hoje)
+    listagens = [
+        ('order_tracking', dict(situacoes=SITUACOES_ORDER_TRACKING)),
+        ('order_tracking_status', dict(situacoes=SITUACOES_ORDER_TRACKING, f_status='Em Trânsito')),
+        ('order_tracking_periodo', dict(situacoes=SITUACOES_ORDER_TRACKING, **trimestre)),
+        ('pedidos', dict(situacoes=SITUACOES_PEDIDOS)),
+        ('pedidos_periodo', dict(situacoes=SITUACOES_PEDIDOS, **trimestre)),
+        ('pedidos_status_periodo', dict(situacoes=SITUACOES_PEDIDOS, f_status='Entregue', **trimestre)),
+        ('pedidos_numero', dict(situacoes=SITUACOES_PEDIDOS, f_pedido='12345')),
+    ]
+    for nome, filtros in listagens:
+        consultas = consultas_listagem(limit=per_page, offset=0, **filtros)
+        yield nome, *consultas['pagina']
+        # Sem filtros as telas usam a estimativa do planejador quando ela passa do limiar
+        # (paginacao.paginar_pedidos) e a contagem exata nem roda
+        if len(filtros) > 1 or _estimar_linhas(conn, *consultas['estimativa']) < LIMIAR_CONTAGEM_ESTIMADA:
+            yield nome + '_com_total', *consultas['com_total']
+    # Página seguinte pelo cursor (data_pedido, id) de um pedido qualquer
+    consultas = consultas_listagem(limit=per_page, cursor=('prox', hoje - timedelta(days=400), 1),
+                                   situacoes=SITUACOES_PEDIDOS)
+    yield 'pedidos_cursor', *consultas['pagina']
+
+    # Os indicadores leem todos os pedidos de propósito (ver VARREDURA_ESPERADA)
+    yield 'indicadores', aplicacao.SQL_INDICADORES, None
+
+
+def _nos(plano):
+    yield plano
+    for filho in plano.get('Plans', ()):
+        yield from _nos(filho)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limiar', type=int, default=100_000,
+                        help='tabelas com mais linhas que isso não podem ser lidas por Seq Scan')
+    parser.add_argument('--verbose', action='store_true', help='imprime o plano das consultas com problema')
+    args = parser.parse_args()
+
+    problemas = 0
+    with conexao() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p', 'm')")
+        linhas_tabela = dict(cur.fetchall())
+        for nome, sql, params in cenarios(conn):
+            cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+            resultado = cur.fetchone()[0]
+            if isinstance(resultado, str):
+                resultado = json.loads(resultado)
+            plano = resultado[0]
+            varreduras = [n['Relation Name'] for n in _nos(plano['Plan'])
+                          if n['Node Type'] == 'Seq Scan' and linhas_tabela.get(n['Relation Name'], 0) > args.limiar
+                          and nome not in VARREDURA_ESPERADA]
+            situacao = 'SEQ SCAN em ' + ', '.join(sorted(set(varreduras))) if varreduras else 'ok'
+            print(f"{nome:36} {plano['Execution Time']:10.1f}ms  {situacao}", flush=True)
+            if varreduras:
+                problemas += 1
+                if args.verbose:
+                    print(json.dumps(plano['Plan'], indent=2, default=str))
+        conn.rollback()
+        cur.close()
+
+    if problemas:
+        print(f"{problemas} consulta(s) com Seq Scan em tabela com mais de {args.limiar} linhas")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import re
+
+# Busca por similaridade de trigramas no nome do cliente (requer migrations/0001_busca_trigram.sql)
+BUSCA_SIMILARIDADE = os.environ.get("BUSCA_SIMILARIDADE", "1") == "1"
+
+_NUMERICO = re.compile(r'^\d+$')
+
+
+def _escapar_like(valor):
+    return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def filtro_numero(coluna, valor):
+    # Entrada só com dígitos: prefixo, servido pelo índice btree text_pattern_ops.
+    # Qualquer outra coisa: substring, servida pelo índice GIN de trigramas.
+    valor = (valor or '').strip()
+    if not valor:
+        return "", []
+    if _NUMERICO.match(valor):
+        return f" AND CAST({coluna} AS TEXT) LIKE %s", [valor + '%']
+    return f" AND CAST({coluna} AS TEXT) ILIKE %s", [f"%{_escapar_like(valor)}%"]
+
+
+def filtro_nome(coluna, valor):
+    valor = (valor or '').strip()
+    if not valor:
+        return "", []
+    if not BUSCA_SIMILARIDADE:
+        return f" AND {coluna} ILIKE %s", [f"%{_escapar_like(valor)}%"]
+    # Substring ou similaridade de palavra (tolera erros de digitação); ambos usam o índice GIN
+    return f" AND ({coluna} ILIKE %s OR %s <%% {coluna})", [f"%{_escapar_like(valor)}%", valor]
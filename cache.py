@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+import time
+
+
+class CacheTTL:
+    # Cache em memória do processo; cada entrada expira após `ttl` segundos.
+    # Em vários workers do gunicorn cada um tem o seu, então a invalidação
+    # explícita só vale para o processo que a fez; os demais dependem do TTL.
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave, carregar):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item and item[0] > agora:
+                return item[1]
+        valor = carregar()
+        with self._lock:
+            self._dados[chave] = (agora + self.ttl, valor)
+        return valor
+
+    def invalidar(self, chave=None):
+        with self._lock:
+            if chave is None:
+                self._dados.clear()
+            else:
+                self._dados.pop(chave, None)
+
+
+class CacheLRU:
+    # Cache limitado por quantidade de itens e por bytes; ao passar de qualquer
+    # um dos limites descarta os itens usados há mais tempo.
+
+    def __init__(self, max_itens, max_bytes):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._dados = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            self._dados.move_to_end(chave)
+            return item[0]
+
+    def guardar(self, chave, valor, tamanho):
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            antigo = self._dados.pop(chave, None)
+            if antigo is not None:
+                self._bytes -= antigo[1]
+            self._dados[chave] = (valor, tamanho)
+            self._bytes += tamanho
+            while len(self._dados) > self.max_itens or self._bytes > self.max_bytes:
+                _, (_, tamanho_removido) = self._dados.popitem(last=False)
+                self._bytes -= tamanho_removido
+
+    def invalidar(self):
+        with self._lock:
+            self._dados.clear()
+            self._bytes = 0
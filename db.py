@@ -1,29 +1,324 @@
+import contextvars
+import json
+import logging
 import os
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from psycopg2.extras import RealDictCursor
 from datetime import date
+from busca import filtro_numero, filtro_nome
+from instrumentacao import INSTRUMENTACAO, ConexaoMedida, medir
+from cache import CacheTTL
+from paralelo import CONSULTAS_PARALELAS, em_paralelo
 
-def get_db_connection():
-    conn = psycopg2.connect(
+# Em workers gevent (gunicorn -k gevent, usados pelas atualizações ao vivo) o psycopg2
+# precisa ceder o loop enquanto espera o banco; sem gevent/psycogreen nada muda
+# (o gevent só é consultado se já foi importado, para não carregá-lo nos workers síncronos)
+_gevent_monkey = sys.modules.get('gevent.monkey')
+if _gevent_monkey is not None and _gevent_monkey.is_module_patched('socket'):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+logger = logging.getLogger(__name__)
+
+# Pool de conexões por processo (configurável via variáveis de ambiente)
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+# Conexões paradas há mais tempo que isso recebem um "SELECT 1" antes de serem entregues
+DB_POOL_PING_IDLE = float(os.environ.get("DB_POOL_PING_IDLE", 30))
+
+# Réplica de leitura opcional. DB_READ_HOST, DB_READ_PORT, DB_READ_NAME, DB_READ_USER e
+# DB_READ_PASSWORD substituem os valores do primário. Listagens, contagens, indicadores e
+# exportações usam conexao(leitura=True), que vai para a réplica se ela responde, está com
+# atraso até DB_REPLICA_ATRASO_MAX segundos e já tem as escritas do usuário (exigir_lsn).
+# Caso contrário a leitura vai para o primário. Exportações longas na réplica pedem
+# hot_standby_feedback=on para não serem canceladas por conflito com a recuperação.
+DB_READ = {chave: os.environ.get("DB_READ_" + chave.upper()) for chave in ('host', 'port', 'name', 'user', 'password')}
+REPLICA = bool(DB_READ['host'] or DB_READ['port'])
+DB_REPLICA_ATRASO_MAX = float(os.environ.get("DB_REPLICA_ATRASO_MAX", 30))
+# Intervalo entre verificações de estado/atraso da réplica, e espera após uma falha
+DB_REPLICA_VERIFICAR = float(os.environ.get("DB_REPLICA_VERIFICAR", 1))
+DB_REPLICA_ESPERA = float(os.environ.get("DB_REPLICA_ESPERA", 30))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.environ.get("DB_REPLICA_CONNECT_TIMEOUT", 3))
+
+# Um pool (e um semáforo) por alvo: 'primario' e, se configurada, 'replica'
+_pools = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+_ultimo_uso = {}
+# Pools herdados do processo pai após um fork: mantidos vivos para que o
+# coletor de lixo não feche sockets que ainda pertencem ao master do gunicorn
+_pools_herdados = []
+
+_replica = {'disponivel': False, 'lsn': None, 'verificar_em': 0.0}
+_replica_lock = threading.Lock()
+# LSN do primário que as leituras desta requisição precisam enxergar (read-your-writes)
+_lsn_minimo = contextvars.ContextVar('lsn_minimo', default=None)
+
+
+def _parametros_conexao(alvo='primario'):
+    parametros = dict(
         dbname=os.environ.get("DB_NAME"),
         user=os.environ.get("DB_USER"),
         password=os.environ.get("DB_PASSWORD"),
         host=os.environ.get("DB_HOST"),
         port=os.environ.get("DB_PORT", 5432)
     )
+    if alvo == 'replica':
+        parametros.update({'dbname' if chave == 'name' else chave: valor
+                           for chave, valor in DB_READ.items() if valor})
+        parametros['connect_timeout'] = DB_REPLICA_CONNECT_TIMEOUT
+    if INSTRUMENTACAO:
+        parametros['connection_factory'] = ConexaoMedida
+    return parametros
+
+
+def get_db_connection():
+    conn = psycopg2.connect(**_parametros_conexao())
     return conn
 
-def get_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None, f_status=None,
-                limit=None, offset=None, situacoes=None):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    query = """
-        SELECT
+
+def _descartar_herdados(pid):
+    # Chamada com _pool_lock
+    global _pool_pid
+    _pools_herdados.extend(pool for pool, _ in _pools.values())
+    _pools.clear()
+    _ultimo_uso.clear()
+    _pool_pid = pid
+
+
+def apos_fork():
+    # post_fork do gunicorn (gunicorn.conf.py): o worker deixa de lado o que veio do master
+    # logo ao nascer, em vez de só perceber a troca de pid na primeira consulta
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _descartar_herdados(os.getpid())
+
+
+def _get_pool(alvo='primario'):
+    # Devolve (pool, semáforo) do alvo, recriados após um fork
+    pid = os.getpid()
+    if _pool_pid == pid and alvo in _pools:
+        return _pools[alvo]
+    with _pool_lock:
+        if _pool_pid != pid:
+            _descartar_herdados(pid)
+        if alvo not in _pools:
+            pool = pg_pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **_parametros_conexao(alvo))
+            _pools[alvo] = (pool, threading.BoundedSemaphore(DB_POOL_MAX))
+    return _pools[alvo]
+
+
+def fechar_pool():
+    global _pool_pid
+    with _pool_lock:
+        if _pool_pid == os.getpid():
+            for pool, _ in _pools.values():
+                pool.closeall()
+        _pools.clear()
+        _pool_pid = None
+        _ultimo_uso.clear()
+
+
+def _conexao_saudavel(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _ultimo_uso.get(id(conn), 0) < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _obter_conexao(pool):
+    # Tenta algumas vezes: após um restart do Postgres todas as conexões
+    # ociosas do pool estão mortas e são descartadas uma a uma
+    for _ in range(DB_POOL_MAX + 1):
+        conn = pool.getconn()
+        if _conexao_saudavel(conn):
+            return conn
+        _ultimo_uso.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("Não foi possível obter uma conexão válida com o banco.")
+
+
+def _devolver_conexao(pool, conn, descartar=False):
+    if not descartar and not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            descartar = True
+    if descartar or conn.closed:
+        _ultimo_uso.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    else:
+        _ultimo_uso[id(conn)] = time.monotonic()
+        pool.putconn(conn)
+
+
+def _lsn(texto):
+    # '16/B374D848' -> inteiro comparável
+    if not texto:
+        return None
+    alto, baixo = texto.split('/')
+    return (int(alto, 16) << 32) + int(baixo, 16)
+
+
+def _verificar_replica():
+    try:
+        with _conexao_em('replica') as conn:
+            cur = conn.cursor()
+            # Sem WAL pendente de aplicar o atraso é zero, mesmo com o primário parado há horas
+            cur.execute("""
+                SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text,
+                       CASE WHEN pg_last_wal_receive_lsn() IS NOT DISTINCT FROM pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                       END
+            """)
+            em_recuperacao, lsn, atraso = cur.fetchone()
+            cur.close()
+    except (psycopg2.Error, pg_pool.PoolError) as e:
+        logger.warning("Réplica de leitura indisponível, lendo do primário: %s", e)
+        return {'disponivel': False, 'lsn': None, 'verificar_em': time.monotonic() + DB_REPLICA_ESPERA}
+    if not em_recuperacao:
+        # Réplica promovida: não dá para saber se tem as escritas do primário atual
+        logger.warning("Réplica de leitura não está em recuperação; lendo do primário")
+        return {'disponivel': False, 'lsn': None, 'verificar_em': time.monotonic() + DB_REPLICA_ESPERA}
+    if atraso > DB_REPLICA_ATRASO_MAX:
+        logger.warning("Réplica de leitura %.0fs atrasada; lendo do primário", atraso)
+    return {'disponivel': atraso <= DB_REPLICA_ATRASO_MAX, 'lsn': _lsn(lsn),
+            'verificar_em': time.monotonic() + DB_REPLICA_VERIFICAR}
+
+
+def _estado_replica():
+    if time.monotonic() >= _replica['verificar_em']:
+        with _replica_lock:
+            if time.monotonic() >= _replica['verificar_em']:
+                _replica.update(_verificar_replica())
+    return _replica
+
+
+def _marcar_replica_indisponivel():
+    with _replica_lock:
+        _replica.update(disponivel=False, verificar_em=time.monotonic() + DB_REPLICA_ESPERA)
+    # As conexões ociosas do pool também caíram: quando a réplica voltar o pool é recriado.
+    # Quem ainda usa uma conexão do pool antigo a devolve normalmente a ele.
+    with _pool_lock:
+        _pools.pop('replica', None)
+
+
+class FalhaReplica(psycopg2.OperationalError):
+    # A conexão com a réplica caiu no meio de uma leitura; a réplica já foi marcada como
+    # indisponível e a mesma leitura pode ser repetida (vai para o primário)
+    pass
+
+
+def com_failover(funcao):
+    # Repete uma vez, no primário, leituras interrompidas por queda da réplica
+    @wraps(funcao)
+    def executar(*args, **kwargs):
+        try:
+            return funcao(*args, **kwargs)
+        except FalhaReplica:
+            return funcao(*args, **kwargs)
+    return executar
+
+
+def alvo_leitura():
+    # 'replica' ou 'primario': para onde vão as leituras deste contexto agora
+    if not REPLICA:
+        return 'primario'
+    estado = _estado_replica()
+    if not estado['disponivel']:
+        return 'primario'
+    minimo = _lsn_minimo.get()
+    if minimo is not None and (estado['lsn'] is None or estado['lsn'] < minimo):
+        return 'primario'
+    return 'replica'
+
+
+def exigir_lsn(lsn):
+    # Leituras deste contexto (requisição) só vão para a réplica depois que ela aplicar lsn
+    _lsn_minimo.set(_lsn(lsn))
+
+
+def lsn_atual():
+    # LSN do primário após uma escrita, para o read-your-writes; None sem réplica configurada
+    if not REPLICA:
+        return None
+    with conexao() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_current_wal_lsn()::text")
+        lsn = cur.fetchone()[0]
+        cur.close()
+    return lsn
+
+
+@contextmanager
+def _conexao_em(alvo):
+    pool, semaforo = _get_pool(alvo)
+    if not semaforo.acquire(timeout=DB_POOL_TIMEOUT):
+        raise pg_pool.PoolError("Tempo esgotado aguardando conexão livre no pool.")
+    conn = None
+    try:
+        with medir('db_conexao'):
+            conn = _obter_conexao(pool)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            _devolver_conexao(pool, conn, descartar=True)
+            conn = None
+            raise
+    finally:
+        if conn is not None:
+            _devolver_conexao(pool, conn)
+        semaforo.release()
+
+
+@contextmanager
+def conexao(leitura=False, alvo=None):
+    # leitura=True: só consultas, que podem ir para a réplica (ver alvo_leitura);
+    # alvo força 'primario' ou 'replica'
+    alvo = alvo or (alvo_leitura() if leitura else 'primario')
+    if alvo == 'replica':
+        pilha = ExitStack()
+        try:
+            conn = pilha.enter_context(_conexao_em('replica'))
+        except (psycopg2.OperationalError, pg_pool.PoolError) as e:
+            # Réplica caiu desde a última verificação: esta leitura vai para o primário
+            logger.warning("Falha ao conectar na réplica de leitura: %s", e)
+            _marcar_replica_indisponivel()
+        else:
+            with pilha:
+                try:
+                    yield conn
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    if not isinstance(e, FalhaReplica):
+                        logger.warning("Conexão com a réplica de leitura caiu: %s", e)
+                        _marcar_replica_indisponivel()
+                        raise FalhaReplica(str(e)) from e
+                    raise
+            return
+    with _conexao_em('primario') as conn:
+        yield conn
+
+
+COLUNAS_PEDIDOS = """
             p.id,
             p.n_pedido AS "Pedido",
-            s.descricao AS "status_descricao",
-            s.cor AS "status_cor",
+            p.status_logistico_id,
             n.n_nota AS "Nota_Fiscal",
             n.nome_cliente AS "Cliente",
             p.data_pedido,
@@ -33,44 +328,334 @@ def get_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_n
             p.transportadora,
             p.cod_rastreamento,
             p.frete,
-            sit.situacao AS "situacao_comercial"
+            p.id_situacao
+"""
+
+JOINS_PEDIDOS = """
         FROM pedidos_teste p
-        LEFT JOIN status_logistico_teste s ON p.status_logistico_id = s.id
         LEFT JOIN notas_fiscais_teste n ON p.id_nf = n.id
-        LEFT JOIN situacoes sit ON p.id_situacao = sit.id
-        WHERE 1=1
-    """
+"""
+
+# Com PEDIDOS_RESUMO=1 as listagens, contagens e exportações leem de pedidos_resumo
+# (migrations/0005_pedidos_resumo.sql), já com nota, status e situação, e os atrasos
+# saem da consulta em vez de status_pedidos.derivar_status
+PEDIDOS_RESUMO = os.environ.get("PEDIDOS_RESUMO", "0") == "1"
 
+COLUNAS_RESUMO = """
+            p.id,
+            p.n_pedido AS "Pedido",
+            p.status_logistico_id,
+            p.n_nota AS "Nota_Fiscal",
+            p.nome_cliente AS "Cliente",
+            p.data_pedido,
+            p.data_expedicao,
+            p.data_previsao,
+            p.data_entrega,
+            p.transportadora,
+            p.cod_rastreamento,
+            p.frete,
+            p.id_situacao,
+            p.status_cor,
+            p.situacao_comercial,
+            CASE
+                WHEN p.atraso_entrega_desde < CURRENT_DATE THEN p.status_descricao
+                WHEN p.atraso_previsao_desde < CURRENT_DATE THEN 'Atrasado'
+                ELSE p.status_efetivo
+            END AS status_descricao,
+            COALESCE(p.atraso_entrega_desde < CURRENT_DATE, FALSE) AS entrega_atrasada,
+            COALESCE(p.atraso_expedicao_desde < CURRENT_DATE, FALSE)
+                AND NOT COALESCE(p.atraso_entrega_desde < CURRENT_DATE, FALSE)
+                AND NOT COALESCE(p.atraso_previsao_desde < CURRENT_DATE, FALSE) AS expedicao_atrasada
+"""
+
+if PEDIDOS_RESUMO:
+    COLUNAS_LISTAGEM, JOINS_LISTAGEM = COLUNAS_RESUMO, " FROM pedidos_resumo p"
+    COLUNA_CLIENTE, COLUNA_NOTA = "p.nome_cliente", "p.n_nota"
+else:
+    COLUNAS_LISTAGEM, JOINS_LISTAGEM = COLUNAS_PEDIDOS, JOINS_PEDIDOS
+    COLUNA_CLIENTE, COLUNA_NOTA = "n.nome_cliente", "n.n_nota"
+
+# data_pedido dos pedidos sem data (migrations/0012_data_pedido_obrigatoria.sql): fica no banco,
+# que não aceita a data nula, e sai das consultas e das edições como None (ver decorar_pedidos)
+SEM_DATA = date(1900, 1, 1)
+
+# Acima deste número de linhas estimadas o total da listagem vem do EXPLAIN e não de um COUNT(*)
+LIMIAR_CONTAGEM_ESTIMADA = int(os.environ.get("LIMIAR_CONTAGEM_ESTIMADA", 100000))
+
+
+def _filtros_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None, f_status=None,
+                     situacoes=None):
+    # Status e situação são resolvidos para ids pelo cache de referências,
+    # sem precisar das tabelas status_logistico_teste/situacoes no join
+    from referencias import ids_status, ids_situacoes
+
+    query = " WHERE 1=1"
     params = []
 
     if situacoes:
-        query += " AND sit.situacao = ANY(%s)"
-        params.append(situacoes)
-
-    if f_pedido:
-        query += " AND CAST(p.n_pedido AS TEXT) ILIKE %s"
-        params.append(f"%{f_pedido}%")
-    if f_cliente:
-        query += " AND n.nome_cliente ILIKE %s"
-        params.append(f"%{f_cliente}%")
-    if f_nota:
-        query += " AND CAST(n.n_nota AS TEXT) ILIKE %s"
-        params.append(f"%{f_nota}%")
+        query += " AND p.id_situacao = ANY(%s)"
+        params.append(ids_situacoes(situacoes))
+
+    for filtro, coluna, valor in ((filtro_numero, "p.n_pedido", f_pedido),
+                                  (filtro_nome, COLUNA_CLIENTE, f_cliente),
+                                  (filtro_numero, COLUNA_NOTA, f_nota)):
+        sql, valores = filtro(coluna, valor)
+        query += sql
+        params.extend(valores)
     if f_status and f_status != "Todos":
-        query += " AND s.descricao = %s"
-        params.append(f_status)
-    if data_ini and data_fim:
-        query += " AND p.data_pedido BETWEEN %s AND %s"
-        params.extend([data_ini, data_fim])
+        query += " AND p.status_logistico_id = ANY(%s)"
+        params.append(ids_status(f_status))
+    # Cada limite vale sozinho. Com pedidos_teste particionada por data_pedido
+    # (migrations/0009_particionamento.sql) só as partições do período são lidas
+    if data_ini:
+        query += " AND p.data_pedido >= %s"
+        params.append(data_ini)
+    if data_fim:
+        query += " AND p.data_pedido <= %s"
+        params.append(data_fim)
+        if not data_ini:
+            query += " AND p.data_pedido > %s"
+            params.append(SEM_DATA)
+
+    return query, params
+
+
+def _pagina_pedidos(limit=None, offset=None, cursor=None):
+    # Paginação por cursor (keyset) em (data_pedido, id): cursor = (direcao, data_pedido, id).
+    # A direção 'ant' percorre a ordenação inversa e a lista é revertida por quem chamou.
+    query = ""
+    params = []
+    direcao = None
+    if cursor:
+        direcao, cursor_data, cursor_id = cursor
+        # Pedido sem data: exibido com data nula, no banco com SEM_DATA
+        cursor_data = cursor_data or SEM_DATA
+        # O limite só de data_pedido, redundante com o da tupla, é o que permite ao
+        # Postgres descartar as partições fora da página (a tupla não serve para isso)
+        if direcao == 'ant':
+            query += " AND (p.data_pedido, p.id) > (%s, %s) AND p.data_pedido >= %s"
+        else:
+            query += " AND (p.data_pedido, p.id) < (%s, %s) AND p.data_pedido <= %s"
+        params.extend([cursor_data, cursor_id, cursor_data])
+
+    if direcao == 'ant':
+        ordem = " ORDER BY {0}data_pedido ASC, {0}id ASC"
+    else:
+        ordem = " ORDER BY {0}data_pedido DESC, {0}id DESC"
+
+    limite = ""
+    limite_params = []
+    if limit is not None and cursor:
+        limite = " LIMIT %s"
+        limite_params.append(limit)
+    elif limit is not None and offset is not None:
+        limite = " LIMIT %s OFFSET %s"
+        limite_params.extend([limit, offset])
+
+    return query, params, ordem, limite, limite_params, direcao
+
+
+def decorar_pedidos(pedidos, resumo=PEDIDOS_RESUMO):
+    # Prepara as linhas de pedidos para as telas e a exportação: listagem, exportação e o
+    # RETURNING das edições passam todos por aqui. resumo: linhas de pedidos_resumo, que já
+    # trazem os textos de status/situação
+    for p in pedidos:
+        if p['data_pedido'] == SEM_DATA:
+            p['data_pedido'] = None
+    if resumo:
+        return pedidos
+    # Import local: referencias usa conexao() deste módulo
+    import referencias
+    return referencias.decorar_pedidos(pedidos)
+
+
+def consultas_listagem(limit=None, offset=None, cursor=None, **filtros):
+    # SQL da listagem: a página, o total, a página com o total (CTE) e a base da estimativa do total.
+    # Também usado por benchmarks/verificar_planos.py para conferir os planos.
+    where, params = _filtros_pedidos(**filtros)
+    where_pagina, params_pagina, ordem, limite, limite_params, direcao = _pagina_pedidos(limit, offset, cursor)
+    pagina = "SELECT" + COLUNAS_LISTAGEM + JOINS_LISTAGEM + where + where_pagina + ordem.format("p.") + limite
+    params_pagina = params + params_pagina + limite_params
+    # O total é calculado sem o predicado do cursor; o LEFT JOIN garante
+    # uma linha mesmo quando a página vem vazia
+    com_total = ("WITH total AS (SELECT COUNT(*) AS total_registros" + JOINS_LISTAGEM + where + "),"
+                 " pagina AS (" + pagina + ")"
+                 " SELECT pagina.*, total.total_registros FROM total LEFT JOIN pagina ON TRUE"
+                 + ordem.format("pagina."))
+    return {
+        'pagina': (pagina, params_pagina),
+        'com_total': (com_total, params + params_pagina),
+        'total': ("SELECT COUNT(*)" + JOINS_LISTAGEM + where, params),
+        'estimativa': ("SELECT 1" + JOINS_LISTAGEM + where, params),
+        'direcao': direcao,
+    }
+
+
+@com_failover
+def get_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None, f_status=None,
+                limit=None, offset=None, situacoes=None, cursor=None):
+    consultas = consultas_listagem(limit, offset, cursor, data_ini=data_ini, data_fim=data_fim, f_pedido=f_pedido,
+                                   f_cliente=f_cliente, f_nota=f_nota, f_status=f_status, situacoes=situacoes)
 
-    query += " ORDER BY p.data_pedido DESC, p.id DESC"
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(*consultas['pagina'])
+        pedidos = cur.fetchall()
+        cur.close()
+    if consultas['direcao'] == 'ant':
+        pedidos.reverse()
+    return decorar_pedidos(pedidos)
 
-    if limit is not None and offset is not None:
-        query += " LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
 
-    cur.execute(query, params)
-    pedidos = cur.fetchall()
+@com_failover
+def count_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None, f_status=None,
+                  situacoes=None):
+    where, params = _filtros_pedidos(data_ini, data_fim, f_pedido, f_cliente, f_nota, f_status, situacoes)
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*)" + JOINS_LISTAGEM + where, params)
+        total = cur.fetchone()[0]
+        cur.close()
+    return total
+
+
+@com_failover
+def limites_data_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None,
+                         f_status=None, situacoes=None):
+    # (menor data_pedido, maior data_pedido, há pedidos sem data) dentro dos filtros; as
+    # datas são dos pedidos com data
+    where, params = _filtros_pedidos(data_ini, data_fim, f_pedido, f_cliente, f_nota, f_status, situacoes)
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(p.data_pedido), MAX(p.data_pedido)" + JOINS_LISTAGEM + where
+                    + " AND p.data_pedido > %s", params + [SEM_DATA])
+        menor, maior = cur.fetchone()
+        cur.execute("SELECT EXISTS (SELECT 1" + JOINS_LISTAGEM + where + " AND p.data_pedido = %s)",
+                    params + [SEM_DATA])
+        sem_data = cur.fetchone()[0]
+        cur.close()
+    return menor, maior, sem_data
+
+
+def get_pedidos_por_ids(ids):
+    if not ids:
+        return []
+    with conexao() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT" + COLUNAS_LISTAGEM + JOINS_LISTAGEM + " WHERE p.id = ANY(%s)", (list(ids),))
+        pedidos = cur.fetchall()
+        cur.close()
+    return decorar_pedidos(pedidos)
+
+
+def _estimar_linhas(conn, query, params):
+    cur = conn.cursor()
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plano = cur.fetchone()[0]
     cur.close()
-    conn.close()
-    return pedidos
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return int(plano[0]['Plan']['Plan Rows'])
+
+
+@com_failover
+def _consultar(query, params, cursor_factory=RealDictCursor):
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor(cursor_factory=cursor_factory)
+        cur.execute(query, params)
+        linhas = cur.fetchall()
+        cur.close()
+    return linhas
+
+
+def _contar(query, params):
+    return _consultar(query, params, cursor_factory=None)[0][0]
+
+
+@com_failover
+def _estimar(query, params):
+    with conexao(leitura=True) as conn:
+        return _estimar_linhas(conn, query, params)
+
+
+def get_pedidos_com_total(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None,
+                          f_status=None, limit=None, offset=None, situacoes=None, cursor=None,
+                          contagem_estimada=False):
+    # Retorna (pedidos, total). Por padrão vão numa única consulta; com CONSULTAS_PARALELAS=1 a
+    # página e o total são feitos ao mesmo tempo em conexões separadas (paralelo.em_paralelo),
+    # cada um no seu snapshot: uma escrita entre os dois pode deixar o total diferente do que a
+    # página mostra, até a próxima requisição. Com contagem_estimada=True o EXPLAIN vem antes:
+    # se a estimativa do planejador passa de LIMIAR_CONTAGEM_ESTIMADA ela é o total e só a
+    # página é consultada; abaixo disso segue o caminho normal (a contagem exata é barata).
+    consultas = consultas_listagem(limit, offset, cursor, data_ini=data_ini, data_fim=data_fim, f_pedido=f_pedido,
+                                   f_cliente=f_cliente, f_nota=f_nota, f_status=f_status, situacoes=situacoes)
+    pagina = lambda: _consultar(*consultas['pagina'])
+
+    estimativa = _estimar(*consultas['estimativa']) if contagem_estimada else 0
+    if estimativa >= LIMIAR_CONTAGEM_ESTIMADA:
+        pedidos, total = pagina(), estimativa
+    elif CONSULTAS_PARALELAS:
+        pedidos, total = em_paralelo(pagina, lambda: _contar(*consultas['total']))
+    else:
+        pedidos = _consultar(*consultas['com_total'])
+        total = pedidos[0]['total_registros'] if pedidos else 0
+        pedidos = [p for p in pedidos if p['id'] is not None]
+        for p in pedidos:
+            del p['total_registros']
+    if consultas['direcao'] == 'ant':
+        pedidos.reverse()
+    return decorar_pedidos(pedidos), total
+
+
+def iterar_pedidos(data_ini=None, data_fim=None, f_pedido=None, f_cliente=None, f_nota=None, f_status=None,
+                   situacoes=None, tamanho_lote=2000, particao=None):
+    # Cursor nomeado (server-side): o Postgres entrega as linhas em lotes e a
+    # memória do processo não cresce com o tamanho do resultado.
+    # particao: (inicio, fim) de data_pedido, inclusive; (None, None) são os pedidos sem data
+    where, params = _filtros_pedidos(data_ini, data_fim, f_pedido, f_cliente, f_nota, f_status, situacoes)
+    if particao == (None, None):
+        where += " AND p.data_pedido = %s"
+        params = params + [SEM_DATA]
+    elif particao is not None:
+        where += " AND p.data_pedido BETWEEN %s AND %s"
+        params = params + list(particao)
+    query = "SELECT" + COLUNAS_LISTAGEM + JOINS_LISTAGEM + where + " ORDER BY p.data_pedido DESC, p.id DESC"
+
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor(name='iterar_pedidos', cursor_factory=RealDictCursor)
+        cur.itersize = tamanho_lote
+        cur.execute(query, params)
+        while True:
+            lote = cur.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            yield decorar_pedidos(lote)
+        cur.close()
+
+
+# Versão dos dados (migrations/0002_versao_dados.sql e 0010_versao_dados_sem_lock.sql):
+# incrementada por trigger a cada escrita em pedidos_teste/notas_fiscais_teste, sem lock
+# entre as escritas. Lida no máximo uma vez a cada VERSAO_DADOS_TTL segundos por processo.
+VERSAO_DADOS_TTL = float(os.environ.get("VERSAO_DADOS_TTL", 1))
+_cache_versao = CacheTTL(VERSAO_DADOS_TTL)
+
+
+@com_failover
+def _ler_versao_dados(alvo):
+    with conexao(alvo=alvo) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT versao, atualizado_em FROM versao_dados_atual")
+        versao = cur.fetchone()
+        cur.close()
+    return versao
+
+
+def versao_dados():
+    # Lida do mesmo alvo das listagens, para que o conteúdo em cache nunca seja mais antigo
+    # que a versão usada na chave
+    alvo = alvo_leitura()
+    return _cache_versao.obter(alvo, lambda: _ler_versao_dados(alvo))
+
+
+def invalidar_versao_dados():
+    _cache_versao.invalidar()
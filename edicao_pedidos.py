@@ -0,0 +1,253 @@
+import csv
+import io
+import itertools
+import os
+from datetime import date, datetime
+from psycopg2.extras import RealDictCursor, execute_values
+from db import COLUNAS_PEDIDOS, decorar_pedidos
+from referencias import status_logisticos
+from historico_pedidos import diferencas, registrar_alteracoes
+
+
+# Limite de linhas por atualização em lote (um único UPDATE numa transação)
+LOTE_MAX_LINHAS = int(os.environ.get('LOTE_MAX_LINHAS', 5000))
+
+
+def _status(valor):
+    # Aceita o id ou a descrição do status (planilhas costumam trazer o texto)
+    status = status_logisticos()
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        texto = str(valor or '').strip().lower()
+        valor = next((id_ for id_, s in status.items() if s['descricao'].lower() == texto), None)
+    if valor not in status:
+        raise ValueError('Status inválido.')
+    return valor
+
+
+def _data(valor):
+    if valor in (None, ''):
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    valor = str(valor).strip()
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ValueError('Data inválida (use AAAA-MM-DD ou DD/MM/AAAA).')
+
+
+def _texto(maximo):
+    def converter(valor):
+        if valor is None:
+            return None
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)
+        valor = str(valor).strip()
+        if len(valor) > maximo:
+            raise ValueError(f'Máximo de {maximo} caracteres.')
+        return valor or None
+    return converter
+
+
+# Campos que podem ser alterados pela edição de pedidos e como cada valor é validado
+CAMPOS_EDITAVEIS = {
+    'status_logistico_id': _status,
+    'data_expedicao': _data,
+    'data_previsao': _data,
+    'data_entrega': _data,
+    'transportadora': _texto(80),
+    'cod_rastreamento': _texto(80),
+    'frete': _texto(20),
+}
+TIPOS_SQL = {
+    'status_logistico_id': 'integer',
+    'data_expedicao': 'date',
+    'data_previsao': 'date',
+    'data_entrega': 'date',
+    'transportadora': 'text',
+    'cod_rastreamento': 'text',
+    'frete': 'text',
+}
+# Como os pedidos de um lote são identificados: id interno ou número do pedido
+CHAVES_LOTE = {'id': 'id', 'pedido': 'n_pedido'}
+
+
+def validar_alteracoes(dados):
+    # Devolve (alteracoes, erros); só os campos presentes em dados são considerados
+    alteracoes, erros = {}, {}
+    for campo, valor in dados.items():
+        converter = CAMPOS_EDITAVEIS.get(campo)
+        if converter is None:
+            erros[campo] = 'Campo não editável.'
+            continue
+        try:
+            alteracoes[campo] = converter(valor)
+        except ValueError as e:
+            erros[campo] = str(e)
+    return alteracoes, erros
+
+
+def atualizar_pedido(conn, pedido_id, alteracoes, usuario):
+    # Um único UPDATE ... RETURNING grava os campos enviados e devolve a linha nova (com os
+    # dados da nota) junto dos valores antigos, travados com FOR UPDATE. Os logs de todas as
+    # colunas alteradas vão num só INSERT. O commit fica por conta de quem chama.
+    campos = list(alteracoes)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(f"""
+        WITH antigo AS (
+            SELECT * FROM pedidos_teste WHERE id = %s FOR UPDATE
+        )
+        UPDATE pedidos_teste p SET {', '.join(f'{c} = %s' for c in campos)}
+        FROM antigo
+        LEFT JOIN notas_fiscais_teste n ON antigo.id_nf = n.id
+        WHERE p.id = antigo.id
+        RETURNING {COLUNAS_PEDIDOS}, {', '.join(f'antigo.{c} AS "antigo_{c}"' for c in campos)}
+    """, [pedido_id] + [alteracoes[c] for c in campos])
+    pedido = cur.fetchone()
+    if pedido is None:
+        cur.close()
+        return None, []
+
+    antigos = {c: pedido.pop(f'antigo_{c}') for c in campos}
+    alteracoes = diferencas(pedido['id'], pedido['Pedido'], antigos, pedido, campos)
+    registrar_alteracoes(cur, alteracoes, usuario)
+    cur.close()
+    return decorar_pedidos([dict(pedido)], resumo=False)[0], [a[2] for a in alteracoes]
+
+
+def atualizar_pedidos_em_lote(conn, chave, linhas, campos, usuario, manter_vazios=False):
+    # linhas: {valor_da_chave: {campo: valor}} com os mesmos campos em todas. Um único
+    # UPDATE ... FROM (VALUES ...) grava tudo e devolve os valores antigos para o log;
+    # com manter_vazios, None deixa o valor atual intacto (células vazias de planilha).
+    # O commit fica por conta de quem chama.
+    coluna_chave = CHAVES_LOTE[chave]
+    novo = (lambda c: f'COALESCE(a.novo_{c}, a.{c})') if manter_vazios else (lambda c: f'a.novo_{c}')
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    resultado = execute_values(cur, f"""
+        WITH d (chave, {', '.join(campos)}) AS (VALUES %s),
+        a AS (
+            SELECT p.id, d.chave, {', '.join(f'p.{c}, d.{c} AS novo_{c}' for c in campos)}
+            FROM pedidos_teste p
+            JOIN d ON p.{coluna_chave} = d.chave
+            FOR UPDATE OF p
+        )
+        UPDATE pedidos_teste p SET {', '.join(f'{c} = {novo(c)}' for c in campos)}
+        FROM a
+        WHERE p.id = a.id
+        RETURNING p.id, p.n_pedido, a.chave, {', '.join(f'p.{c}, a.{c} AS "antigo_{c}"' for c in campos)}
+    """, [[valor] + [linhas[valor].get(c) for c in campos] for valor in linhas],
+        template='(' + ', '.join(['%s::integer'] + [f'%s::{TIPOS_SQL[c]}' for c in campos]) + ')',
+        page_size=len(linhas), fetch=True)
+
+    alteracoes = []
+    alterados = {}
+    for r in resultado:
+        mudou = diferencas(r['id'], r['n_pedido'], {c: r[f'antigo_{c}'] for c in campos}, r, campos)
+        if mudou:
+            alterados[r['id']] = [m[2] for m in mudou]
+            alteracoes.extend(mudou)
+    registrar_alteracoes(cur, alteracoes, usuario)
+    cur.close()
+    encontrados = {r['chave'] for r in resultado}
+    return {
+        'atualizados': sorted(r['id'] for r in resultado),
+        'alterados': alterados,
+        'nao_encontrados': [valor for valor in linhas if valor not in encontrados],
+    }
+
+
+# Cabeçalhos aceitos na planilha de atualização em lote, além dos nomes dos campos
+ALIASES_PLANILHA = {
+    'n_pedido': 'pedido',
+    'status': 'status_logistico_id',
+    'status_descricao': 'status_logistico_id',
+    'rastreamento': 'cod_rastreamento',
+    'rastreio': 'cod_rastreamento',
+}
+
+
+def iterar_planilha(arquivo, nome_arquivo):
+    # Linhas (tuplas) de um CSV (';' ou ',', UTF-8) ou XLSX, lidas aos poucos do arquivo
+    # binário, sem carregar a planilha inteira na memória
+    if nome_arquivo.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    primeira = texto.readline()
+    yield from csv.reader(itertools.chain([primeira], texto), delimiter=';' if ';' in primeira else ',')
+
+
+def _linhas_planilha(dados, nome_arquivo):
+    return list(iterar_planilha(io.BytesIO(dados), nome_arquivo))
+
+
+def cabecalho_planilha(valores):
+    # Devolve (cabecalho, campos, erros) a partir da primeira linha da planilha
+    cabecalho = [str(c or '').strip().lower().replace(' ', '_') for c in valores]
+    cabecalho = [ALIASES_PLANILHA.get(c, c) for c in cabecalho]
+    erros = [f'Coluna desconhecida: {c}' for c in cabecalho if c and c != 'pedido' and c not in CAMPOS_EDITAVEIS]
+    if 'pedido' not in cabecalho:
+        erros.append("A planilha precisa da coluna 'pedido'.")
+    campos = [c for c in cabecalho if c in CAMPOS_EDITAVEIS]
+    if not campos:
+        erros.append('Nenhum campo para alterar.')
+    return cabecalho, campos, erros
+
+
+def validar_linha_planilha(cabecalho, campos, valores):
+    # Devolve (pedido, alteracoes, erros) de uma linha, ou None se ela estiver vazia.
+    # Células vazias ficam de fora: o valor atual do pedido é mantido.
+    registro = dict(zip(cabecalho, valores))
+    if all(v in (None, '') for v in registro.values()):
+        return None
+    try:
+        pedido = int(float(str(registro.get('pedido')).strip()))
+    except (ValueError, OverflowError):
+        return None, {}, {'pedido': 'Pedido inválido.'}
+    # n_pedido é integer: um número fora da faixa derrubaria o COPY/UPDATE do arquivo inteiro
+    if not -2 ** 31 <= pedido < 2 ** 31:
+        return None, {}, {'pedido': 'Pedido inválido.'}
+    alteracoes, erros = validar_alteracoes({c: registro.get(c) for c in campos
+                                            if registro.get(c) not in (None, '')})
+    return pedido, alteracoes, erros
+
+
+def ler_planilha_lote(dados, nome_arquivo):
+    # CSV (';' ou ',') ou XLSX com a coluna 'pedido' e os campos a alterar.
+    # Devolve (linhas, campos, erros) no formato de atualizar_pedidos_em_lote.
+    try:
+        planilha = _linhas_planilha(dados, nome_arquivo)
+    except (UnicodeDecodeError, csv.Error, OSError, ValueError, KeyError):
+        return {}, [], ['Arquivo ilegível: envie um CSV (UTF-8) ou XLSX.']
+    if not planilha:
+        return {}, [], ['Planilha vazia.']
+
+    cabecalho, campos, erros = cabecalho_planilha(planilha[0])
+    if erros:
+        return {}, [], erros
+
+    linhas = {}
+    for numero, valores in enumerate(planilha[1:], start=2):
+        resultado = validar_linha_planilha(cabecalho, campos, valores)
+        if resultado is None:
+            continue
+        pedido, alteracoes, invalidos = resultado
+        if pedido is None:
+            erros.append(f'Linha {numero}: pedido inválido.')
+            continue
+        erros.extend(f'Linha {numero}, {c}: {msg}' for c, msg in invalidos.items())
+        linhas[pedido] = alteracoes
+    if len(linhas) > LOTE_MAX_LINHAS:
+        erros.append(f'Máximo de {LOTE_MAX_LINHAS} pedidos por arquivo.')
+    return linhas, campos, erros
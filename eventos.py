@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import queue
+import select
+import sys
+import threading
+import time
+from db import get_db_connection
+
+# Atualizações ao vivo do order tracking (Server-Sent Events). Cada processo mantém uma
+# única conexão em LISTEN (migrations/0004_eventos_pedidos.sql), aberta só quando o
+# primeiro navegador se conecta, e repassa as notificações a todas as conexões SSE.
+# Com dados parados o custo é um ping por conexão a cada EVENTOS_PING segundos.
+#
+# Só em workers gevent (GUNICORN_WORKER_CLASS=gevent), onde cada conexão SSE é só um
+# greenlet. Em workers síncronos cada conexão prenderia um worker inteiro: a página não abre
+# o EventSource e confere os cards exibidos a cada EVENTOS_POLLING segundos.
+CANAL = 'pedidos_alterados'
+EVENTOS_PING = float(os.environ.get('EVENTOS_PING', 15))
+EVENTOS_AGRUPAR = float(os.environ.get('EVENTOS_AGRUPAR', 0.5))
+EVENTOS_FILA = int(os.environ.get('EVENTOS_FILA', 100))
+EVENTOS_POLLING = float(os.environ.get('EVENTOS_POLLING', 30))
+
+logger = logging.getLogger(__name__)
+
+_assinantes = {}
+_assinantes_lock = threading.Lock()
+_escuta_pid = None
+_ao_alterar = []
+_indicadores = None
+
+
+def ao_vivo():
+    # Sem importar o gevent: se ninguém o importou, nada foi patcheado
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def iniciar_eventos(ao_alterar=(), indicadores=None):
+    # ao_alterar: funções chamadas a cada lote de alterações (ex.: invalidar caches locais,
+    # inclusive de escritas feitas por outros processos); indicadores: função que devolve
+    # o payload do evento 'indicadores', calculado uma vez por lote e processo
+    global _indicadores
+    _ao_alterar.extend(ao_alterar)
+    _indicadores = indicadores
+
+
+def _publicar(evento, dados, so_indicadores=False):
+    with _assinantes_lock:
+        filas = [f for f, quer_indicadores in _assinantes.items() if quer_indicadores or not so_indicadores]
+    for fila in filas:
+        try:
+            fila.put_nowait((evento, dados))
+        except queue.Full:
+            # Cliente muito atrasado: descarta o acumulado e pede para recarregar tudo
+            with fila.mutex:
+                fila.queue.clear()
+            fila.put_nowait(('pedidos', {'ids': None}))
+
+
+def _ler_ids(conn, ids):
+    # Devolve False se alguma notificação veio sem ids (alteração grande)
+    completo = True
+    conn.poll()
+    while conn.notifies:
+        notificacao = conn.notifies.pop(0)
+        try:
+            lista = json.loads(notificacao.payload).get('ids')
+        except ValueError:
+            lista = None
+        if lista is None:
+            completo = False
+        else:
+            ids.update(lista)
+    return completo
+
+
+def _processar(ids):
+    for funcao in _ao_alterar:
+        funcao()
+    _publicar('pedidos', {'ids': sorted(ids) if ids is not None else None})
+    with _assinantes_lock:
+        alguem_quer = any(_assinantes.values())
+    if _indicadores and alguem_quer:
+        _publicar('indicadores', _indicadores(), so_indicadores=True)
+
+
+def _escutar():
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection()
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CANAL}")
+            cur.close()
+            while True:
+                if select.select([conn], [], [], EVENTOS_PING) == ([], [], []):
+                    continue
+                ids = set()
+                completo = _ler_ids(conn, ids)
+                # Agrupa rajadas (edição em lote, importação) num único evento
+                time.sleep(EVENTOS_AGRUPAR)
+                completo = _ler_ids(conn, ids) and completo
+                if ids or not completo:
+                    _processar(ids if completo else None)
+        except Exception:
+            logger.exception("Falha na escuta de %s; reconectando", CANAL)
+            if conn is not None and not conn.closed:
+                conn.close()
+            time.sleep(5)
+            # Notificações podem ter se perdido enquanto a conexão estava caída
+            try:
+                _processar(None)
+            except Exception:
+                logger.exception("Falha ao publicar atualização após reconexão")
+
+
+def _garantir_escuta():
+    global _escuta_pid
+    with _assinantes_lock:
+        if _escuta_pid == os.getpid():
+            return
+        _escuta_pid = os.getpid()
+        # Assinantes herdados do processo pai não existem neste processo
+        _assinantes.clear()
+    threading.Thread(target=_escutar, name='eventos-pedidos', daemon=True).start()
+
+
+def fluxo_eventos(indicadores=False):
+    # Gerador de text/event-stream para uma conexão; indicadores=True também recebe os contadores
+    _garantir_escuta()
+    fila = queue.Queue(maxsize=EVENTOS_FILA)
+    with _assinantes_lock:
+        _assinantes[fila] = indicadores
+    try:
+        yield "retry: 1000\n\n"
+        while True:
+            try:
+                evento, dados = fila.get(timeout=EVENTOS_PING)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield f"event: {evento}\ndata: {json.dumps(dados)}\n\n"
+    finally:
+        with _assinantes_lock:
+            _assinantes.pop(fila, None)
@@ -0,0 +1,331 @@
+import contextvars
+import csv
+import importlib.util
+import io
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from db import DB_POOL_MAX, iterar_pedidos, limites_data_pedidos
+from status_pedidos import derivar_status
+
+TAMANHO_LOTE = int(os.environ.get("EXPORTACAO_LOTE", 2000))
+
+COLUNAS_EXPORTACAO = [
+    'Cliente',
+    'Nota_Fiscal',
+    'data_pedido',
+    'data_expedicao',
+    'data_previsao',
+    'data_entrega',
+    'transportadora',
+    'cod_rastreamento',
+    'frete',
+    'status_descricao',
+    'situacao_comercial',
+]
+COLUNAS_DATA = ['data_pedido', 'data_expedicao', 'data_previsao', 'data_entrega']
+
+
+def lotes_exportacao(filtros, hoje=None, progresso=None):
+    # pandas e openpyxl são importados no primeiro uso (ver gunicorn.conf.py)
+    import pandas as pd
+    hoje = hoje or date.today()
+    linhas = 0
+    for lote in iterar_pedidos(tamanho_lote=TAMANHO_LOTE, **filtros):
+        linhas += len(lote)
+        if progresso:
+            progresso(linhas)
+        yield _formatar(derivar_status(pd.DataFrame(lote), hoje=hoje)[COLUNAS_EXPORTACAO])
+
+
+def _formatar(df):
+    import pandas as pd
+    # Formatar datas para string dd/mm/yyyy
+    for col in COLUNAS_DATA:
+        df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%d/%m/%Y')
+    df = df.astype(object)
+    return df.where(df.notna(), None)
+
+
+def gerar_csv(filtros, progresso=None):
+    # Cada lote vira um pedaço da resposta assim que sai do banco.
+    # BOM + ';' para o Excel em pt-BR abrir o arquivo direto.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(COLUNAS_EXPORTACAO)
+    yield '\ufeff' + buffer.getvalue()
+    for df in lotes_exportacao(filtros, progresso=progresso):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(df.itertuples(index=False, name=None))
+        yield buffer.getvalue()
+
+
+def gerar_xlsx(filtros, destino=None, progresso=None):
+    # Workbook write-only: as linhas vão para disco conforme são adicionadas,
+    # então a memória fica constante; o arquivo só pode ser enviado depois do save.
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Pedidos')
+    ws.append(COLUNAS_EXPORTACAO)
+    for df in lotes_exportacao(filtros, progresso=progresso):
+        for linha in df.itertuples(index=False, name=None):
+            ws.append(linha)
+    arquivo = destino or tempfile.TemporaryFile()
+    wb.save(arquivo)
+    if destino is None:
+        arquivo.seek(0)
+    return arquivo
+
+
+# --- Exportação paralela --------------------------------------------------------------
+#
+# Para exportações grandes (relatórios de fim de ano sobre todo o histórico): o período é
+# dividido em partições de data_pedido, cada partição é lida por uma thread com uma conexão
+# do pool e os lotes são processados (derivar_status + formatação) num pool de processos.
+# O arquivo é montado na ordem das partições, que é a da listagem (data_pedido DESC, id DESC).
+#
+# Cada leitora segura uma conexão do pool pela partição inteira, inclusive enquanto espera a
+# gravação. EXPORTACAO_CONEXOES é o máximo por exportação e EXPORTACAO_CONEXOES_PROCESSO o
+# total no processo, somando as exportações simultâneas (EXPORTACAO_WORKERS jobs, ver
+# jobs_exportacao.py): o resto do pool (DB_POOL_MAX) fica para as páginas.
+EXPORTACAO_CONEXOES = int(os.environ.get("EXPORTACAO_CONEXOES", 1))
+EXPORTACAO_CONEXOES_PROCESSO = int(os.environ.get("EXPORTACAO_CONEXOES_PROCESSO", max(1, DB_POOL_MAX // 2)))
+EXPORTACAO_PROCESSOS = int(os.environ.get("EXPORTACAO_PROCESSOS", os.cpu_count() or 1))
+EXPORTACAO_PARTICOES = int(os.environ.get("EXPORTACAO_PARTICOES", 16))
+# Abaixo deste número de pedidos a exportação roda numa partição só, sem pool de processos
+EXPORTACAO_PARALELA_MINIMO = int(os.environ.get("EXPORTACAO_PARALELA_MINIMO", 50000))
+# Lotes lidos e ainda não gravados por partição; limita a memória quando a gravação atrasa
+EXPORTACAO_LOTES_ADIANTADOS = int(os.environ.get("EXPORTACAO_LOTES_ADIANTADOS", 4))
+
+_processos = None
+_processos_pid = None
+_processos_lock = threading.Lock()
+_conexoes_livres = threading.BoundedSemaphore(EXPORTACAO_CONEXOES_PROCESSO)
+
+
+def parquet_disponivel():
+    # Sem importar o pyarrow, que é pesado e só é usado nas exportações Parquet
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _schema_parquet():
+    import pyarrow as pa
+    return pa.schema([
+        ('Cliente', pa.string()),
+        ('Nota_Fiscal', pa.int64()),
+        ('data_pedido', pa.date32()),
+        ('data_expedicao', pa.date32()),
+        ('data_previsao', pa.date32()),
+        ('data_entrega', pa.date32()),
+        ('transportadora', pa.string()),
+        ('cod_rastreamento', pa.string()),
+        ('frete', pa.string()),
+        ('status_descricao', pa.string()),
+        ('situacao_comercial', pa.string()),
+    ])
+
+
+def _processar_lote(colunas, registros, hoje, formato):
+    # Roda nos processos do pool: devolve (linhas, dados prontos para gravar no formato)
+    import pandas as pd
+    df = derivar_status(pd.DataFrame.from_records(registros, columns=colunas), hoje=hoje)[COLUNAS_EXPORTACAO]
+    if formato == 'parquet':
+        import pyarrow as pa
+        # Parquet mantém as datas tipadas em vez do texto dd/mm/yyyy
+        df = df.astype(object)
+        return len(df), pa.Table.from_pandas(df.where(df.notna(), None), schema=_schema_parquet(),
+                                             preserve_index=False)
+    linhas = list(_formatar(df).itertuples(index=False, name=None))
+    if formato == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=';').writerows(linhas)
+        return len(linhas), buffer.getvalue()
+    return len(linhas), linhas
+
+
+def _cooperativo():
+    # Em workers gevent o pool de processos não convive com o monkey patching
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def _pool_processos():
+    global _processos, _processos_pid
+    if EXPORTACAO_PROCESSOS <= 1 or _cooperativo():
+        return None
+    with _processos_lock:
+        if _processos is None or _processos_pid != os.getpid():
+            # spawn: os filhos não herdam as conexões nem as threads do processo web
+            _processos = ProcessPoolExecutor(max_workers=EXPORTACAO_PROCESSOS,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            _processos_pid = os.getpid()
+    return _processos
+
+
+def _descartar_pool_processos():
+    global _processos
+    with _processos_lock:
+        if _processos is not None and _processos_pid == os.getpid():
+            _processos.shutdown(wait=False, cancel_futures=True)
+            _processos = None
+
+
+def particoes_exportacao(filtros, quantidade):
+    # Faixas de data_pedido (inicio, fim), da mais recente para a mais antiga; os pedidos
+    # sem data (db.SEM_DATA) vêm depois, como no ORDER BY data_pedido DESC
+    menor, maior, sem_data = limites_data_pedidos(**filtros)
+    particoes = []
+    if menor is not None:
+        passo = math.ceil(((maior - menor).days + 1) / quantidade)
+        fim = maior
+        while fim >= menor:
+            inicio = max(menor, fim - timedelta(days=passo - 1))
+            particoes.append((inicio, fim))
+            fim = inicio - timedelta(days=1)
+    if sem_data:
+        particoes.append((None, None))
+    return particoes
+
+
+def _reservar_conexoes(quantidade, progresso=None):
+    # Espera só pela primeira conexão; as demais, até quantidade, se estiverem livres agora.
+    # Uma exportação nunca espera segurando outra, então as simultâneas não se travam.
+    # Enquanto espera, progresso(0) mantém o job ativo (jobs_exportacao.EXPORTACAO_JOB_INATIVO).
+    while not _conexoes_livres.acquire(timeout=5):
+        if progresso:
+            progresso(0)
+    reservadas = 1
+    while reservadas < quantidade and _conexoes_livres.acquire(blocking=False):
+        reservadas += 1
+    return reservadas
+
+
+def _submeter(processos, *args):
+    if processos is not None:
+        return processos.submit(_processar_lote, *args)
+    futuro = Future()
+    try:
+        futuro.set_result(_processar_lote(*args))
+    except Exception as e:
+        futuro.set_exception(e)
+    return futuro
+
+
+def _ler_particao(filtros, particao, fila, processos, hoje, formato, cancelado):
+    # Thread leitora: entrega na fila os futuros dos lotes, em ordem, e None no fim
+    def entregar(item):
+        while not cancelado.is_set():
+            try:
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    lotes = iterar_pedidos(tamanho_lote=TAMANHO_LOTE, particao=particao, **filtros)
+    try:
+        for lote in lotes:
+            # Tuplas em vez de dicionários: menos para serializar até os processos
+            colunas = list(lote[0])
+            registros = [tuple(r[c] for c in colunas) for r in lote]
+            if not entregar(_submeter(processos, colunas, registros, hoje, formato)):
+                return
+    except Exception as e:
+        erro = Future()
+        erro.set_exception(e)
+        entregar(erro)
+        return
+    finally:
+        lotes.close()
+    entregar(None)
+
+
+class _Gravador:
+    # Grava o arquivo final no formato pedido, lote a lote, na ordem em que os recebe
+    def __init__(self, formato, caminho):
+        self.formato = formato
+        self.caminho = caminho
+        if formato == 'csv':
+            self.arquivo = open(caminho, 'w', encoding='utf-8', newline='')
+            self.arquivo.write('\ufeff')
+            csv.writer(self.arquivo, delimiter=';').writerow(COLUNAS_EXPORTACAO)
+        elif formato == 'parquet':
+            import pyarrow.parquet as pq
+            self.arquivo = pq.ParquetWriter(caminho, _schema_parquet())
+        else:
+            from openpyxl import Workbook
+            self.arquivo = Workbook(write_only=True)
+            self.planilha = self.arquivo.create_sheet('Pedidos')
+            self.planilha.append(COLUNAS_EXPORTACAO)
+
+    def gravar(self, dados):
+        if self.formato == 'csv':
+            self.arquivo.write(dados)
+        elif self.formato == 'parquet':
+            self.arquivo.write_table(dados)
+        else:
+            for linha in dados:
+                self.planilha.append(linha)
+
+    def fechar(self):
+        if self.formato == 'xlsx':
+            self.arquivo.save(self.caminho)
+        else:
+            self.arquivo.close()
+
+
+def exportar_paralelo(filtros, formato, caminho, progresso=None, total=None, hoje=None):
+    # Grava a exportação em caminho; formato: 'csv', 'xlsx' ou 'parquet' (requer pyarrow)
+    hoje = hoje or date.today()
+    if total is not None and total < EXPORTACAO_PARALELA_MINIMO:
+        particoes, processos, conexoes = [None], None, 1
+    else:
+        particoes = particoes_exportacao(filtros, EXPORTACAO_PARTICOES)
+        processos, conexoes = _pool_processos(), EXPORTACAO_CONEXOES
+
+    conexoes = _reservar_conexoes(min(conexoes, len(particoes)), progresso)
+    try:
+        return _exportar(filtros, formato, caminho, particoes, processos, conexoes, progresso, hoje)
+    finally:
+        for _ in range(conexoes):
+            _conexoes_livres.release()
+
+
+def _exportar(filtros, formato, caminho, particoes, processos, conexoes, progresso, hoje):
+    gravador = _Gravador(formato, caminho)
+    cancelado = threading.Event()
+    leitores = ThreadPoolExecutor(max_workers=conexoes, thread_name_prefix='exportacao-leitura')
+    linhas = 0
+    try:
+        # Partições enviadas em ordem: as que estão sendo lidas são sempre as primeiras
+        # ainda não gravadas, então a gravação nunca espera uma partição que não começou
+        filas = []
+        for particao in particoes:
+            fila = queue.Queue(maxsize=EXPORTACAO_LOTES_ADIANTADOS)
+            filas.append(fila)
+            # Cópia do contexto: o LSN mínimo do job (db.exigir_lsn) vale também para os leitores
+            leitores.submit(contextvars.copy_context().run, _ler_particao, filtros, particao, fila, processos,
+                            hoje, formato, cancelado)
+        for fila in filas:
+            while (futuro := fila.get()) is not None:
+                quantidade, dados = futuro.result()
+                gravador.gravar(dados)
+                linhas += quantidade
+                if progresso:
+                    progresso(linhas)
+    except BrokenProcessPool:
+        _descartar_pool_processos()
+        raise
+    finally:
+        cancelado.set()
+        leitores.shutdown(wait=True, cancel_futures=True)
+        gravador.fechar()
+    return linhas
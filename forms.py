@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import HiddenField, StringField, DateField, SelectField
 from wtforms.validators import DataRequired, Optional, Length
 
@@ -11,3 +12,6 @@ class EditPedidoForm(FlaskForm):
     transportadora = StringField('Transportadora', validators=[Length(max=80)])
     cod_rastreamento = StringField('Rastreamento', validators=[Length(max=80)])
     frete = StringField('Frete', validators=[Length(max=20)])
+
+class ImportarLoteForm(FlaskForm):
+    arquivo = FileField('Arquivo', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'])])
@@ -0,0 +1,52 @@
+# Configuração do gunicorn, lida automaticamente quando ele roda a partir desta pasta:
+#
+#   gunicorn app:app
+#   GUNICORN_WORKER_CLASS=gevent GUNICORN_WORKERS=2 gunicorn app:app
+#
+# Com preload_app o app é importado uma vez no master e os workers nascem por fork já com
+# ele carregado: o boot de cada worker fica quase instantâneo e as páginas de memória do
+# código importado são compartilhadas (copy-on-write) em vez de repetidas por worker.
+# pandas e openpyxl são importados só no primeiro uso (status_pedidos, exportacao); com
+# preload e PRECARREGAR_DEPENDENCIAS=1 o master os importa antes do fork para que os
+# workers também os compartilhem.
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+PRECARREGAR_DEPENDENCIAS = os.environ.get('PRECARREGAR_DEPENDENCIAS', '1') == '1'
+
+if preload_app and worker_class == 'gevent':
+    # O worker gevent só aplica o monkey patching depois do fork; com o app já importado
+    # no master, locks e sockets criados na importação ficariam sem patch. Por isso a
+    # classe do worker vem de GUNICORN_WORKER_CLASS e não de -k na linha de comando.
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def on_starting(server):
+    # Antes dos workers: os workers deste master somam as métricas só entre eles
+    # (instrumentacao.METRICAS_DIR)
+    import instrumentacao
+    instrumentacao.limpar_metricas()
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    if PRECARREGAR_DEPENDENCIAS:
+        import pandas  # noqa: F401
+        import openpyxl  # noqa: F401
+    # O master não atende requisições: nenhuma conexão aberta na importação deve
+    # chegar aos workers
+    import db
+    db.fechar_pool()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import db
+        db.apos_fork()
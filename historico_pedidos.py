@@ -0,0 +1,45 @@
+import os
+from psycopg2.extras import RealDictCursor, execute_values
+from db import conexao
+
+# Diário de alterações dos pedidos (log_pedidos): uma linha por coluna alterada, gravada
+# na mesma transação da escrita. A consulta por pedido usa idx_log_pedidos_pedido
+# (migrations/0003_historico_pedidos.sql) e pagina por id, sem OFFSET.
+HISTORICO_POR_PAGINA = int(os.environ.get('HISTORICO_POR_PAGINA', 50))
+
+
+def diferencas(pedido_id, numero_pedido, antigos, novos, campos):
+    # [(id_pedido, numero_pedido, campo, valor_antigo, valor_novo)] das colunas que mudaram
+    return [(pedido_id, numero_pedido, c, antigos[c], novos[c]) for c in campos if antigos[c] != novos[c]]
+
+
+def registrar_alteracoes(cur, alteracoes, usuario):
+    # Todas as diferenças num só INSERT, no cursor (e na transação) de quem alterou.
+    # Valores guardados como str(), igual às linhas antigas ('None' para vazio).
+    if alteracoes:
+        execute_values(cur, """
+            INSERT INTO log_pedidos (id_pedido, numero_pedido, campo, valor_antigo, valor_novo, usuario)
+            VALUES %s
+        """, [(id_, numero, campo, str(antigo), str(novo), usuario)
+              for id_, numero, campo, antigo, novo in alteracoes], page_size=len(alteracoes))
+
+
+def historico_pedido(pedido_id, antes=None, limite=HISTORICO_POR_PAGINA):
+    # Mais recentes primeiro. As edições de um pedido são serializadas pelo FOR UPDATE,
+    # então a ordem do id é a ordem real das alterações. Devolve (linhas, proximo).
+    filtro, params = "", [pedido_id]
+    if antes:
+        filtro, params = " AND id < %s", params + [antes]
+    with conexao() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(f"""
+            SELECT id, campo, valor_antigo, valor_novo, usuario, data_alteracao
+            FROM log_pedidos
+            WHERE id_pedido = %s{filtro}
+            ORDER BY id DESC
+            LIMIT %s
+        """, params + [limite + 1])
+        linhas = cur.fetchall()
+        cur.close()
+    proximo = linhas[limite - 1]['id'] if len(linhas) > limite else None
+    return linhas[:limite], proximo
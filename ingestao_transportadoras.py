@@ -0,0 +1,248 @@
+import argparse
+import csv
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from db import get_db_connection
+from edicao_pedidos import CAMPOS_EDITAVEIS, TIPOS_SQL, iterar_planilha, cabecalho_planilha, validar_linha_planilha
+
+# Arquivos diários das transportadoras (CSV/XLSX com pedido, código de rastreio, datas de
+# expedição e entrega...). O arquivo é lido linha a linha, validado com as mesmas regras da
+# edição (edicao_pedidos.CAMPOS_EDITAVEIS) e enviado por COPY para uma tabela temporária;
+# daí um único UPDATE grava os pedidos que mudaram e um único INSERT registra o log.
+# Ao contrário da atualização em lote da tela, linhas com erro não impedem as demais:
+# ficam na tabela temporária com o motivo e voltam no relatório.
+#
+#   python ingestao_transportadoras.py arquivo.csv --usuario transportadora --relatorio erros.csv
+#   python ingestao_transportadoras.py arquivo.xlsx --simular
+TABELA = 'ingestao_rastreio'
+# Relatórios de erros das ingestões feitas pela tela, para download
+INGESTAO_DIR = os.environ.get("INGESTAO_DIR", os.path.join(tempfile.gettempdir(), "order_tracking_ingestao"))
+INGESTAO_RELATORIO_TTL = int(os.environ.get("INGESTAO_RELATORIO_TTL", 86400))
+# A cada quantas linhas lidas o progresso é informado (ver jobs_ingestao.py)
+INGESTAO_PROGRESSO = int(os.environ.get('INGESTAO_PROGRESSO', 10000))
+# Tamanho aproximado (em caracteres) de cada bloco de CSV enviado ao COPY
+INGESTAO_BLOCO = int(os.environ.get('INGESTAO_BLOCO', 1 << 16))
+COLUNAS = list(CAMPOS_EDITAVEIS)
+
+
+class _FonteCopy:
+    # Objeto lido pelo copy_expert: gera o CSV das linhas sob demanda, um bloco por read()
+    def __init__(self, registros):
+        self._registros = registros
+        self._buffer = io.StringIO()
+        self._escritor = csv.writer(self._buffer, lineterminator='\n')
+
+    def read(self, tamanho=-1):
+        tamanho = tamanho if tamanho and tamanho > 0 else INGESTAO_BLOCO
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        for registro in self._registros:
+            self._escritor.writerow(registro)
+            if self._buffer.tell() >= tamanho:
+                break
+        return self._buffer.getvalue()
+
+
+def _registros(planilha, cabecalho, campos, resumo, progresso=None):
+    # (linha, pedido, colunas..., erro) de cada linha não vazia; None vira NULL no COPY
+    for numero, valores in enumerate(planilha, start=2):
+        resultado = validar_linha_planilha(cabecalho, campos, valores)
+        if resultado is None:
+            continue
+        pedido, alteracoes, erros = resultado
+        resumo['linhas'] += 1
+        if progresso and resumo['linhas'] % INGESTAO_PROGRESSO == 0:
+            progresso(resumo['linhas'])
+        erro = '; '.join(f'{c}: {msg}' if c != 'pedido' else msg for c, msg in erros.items()) or None
+        yield [numero, pedido] + [alteracoes.get(c) for c in COLUNAS] + [erro]
+
+
+def _texto(tabela, coluna):
+    # Mesmo formato de historico_pedidos.registrar_alteracoes (str() do valor Python)
+    if TIPOS_SQL[coluna] == 'date':
+        return f"COALESCE(to_char({tabela}.{coluna}, 'YYYY-MM-DD'), 'None')"
+    return f"COALESCE({tabela}.{coluna}::text, 'None')"
+
+
+def _marcar_erros(cur):
+    # Pedido repetido no arquivo: vale a última linha
+    cur.execute(f"""
+        UPDATE {TABELA} i SET erro = 'Pedido repetido no arquivo; vale a linha ' || u.linha
+        FROM (
+            SELECT pedido, max(linha) AS linha FROM {TABELA}
+            WHERE erro IS NULL GROUP BY pedido HAVING count(*) > 1
+        ) u
+        WHERE i.pedido = u.pedido AND i.linha < u.linha AND i.erro IS NULL
+    """)
+    cur.execute(f"""
+        UPDATE {TABELA} i SET erro = 'Pedido não encontrado.'
+        WHERE erro IS NULL AND NOT EXISTS (SELECT 1 FROM pedidos_teste p WHERE p.n_pedido = i.pedido)
+    """)
+
+
+def _aplicar(cur, campos, usuario):
+    # Só os pedidos em que algum campo muda são travados e atualizados; células vazias
+    # (NULL na tabela temporária) mantêm o valor atual. Devolve (pedidos, alterações).
+    novo = {c: f'COALESCE(i.{c}, p.{c})' for c in campos}
+    cur.execute(f"""
+        WITH a AS (
+            SELECT p.id, {', '.join(f'p.{c}, {novo[c]} AS novo_{c}' for c in campos)}
+            FROM pedidos_teste p
+            JOIN {TABELA} i ON i.pedido = p.n_pedido
+            WHERE i.erro IS NULL
+              AND ({', '.join(f'p.{c}' for c in campos)}) IS DISTINCT FROM ({', '.join(novo.values())})
+            FOR UPDATE OF p
+        ),
+        u AS (
+            UPDATE pedidos_teste p SET {', '.join(f'{c} = a.novo_{c}' for c in campos)}
+            FROM a
+            WHERE p.id = a.id
+            RETURNING p.id, p.n_pedido, {', '.join(f"{_texto('p', c)} AS {c}, {_texto('a', c)} AS antigo_{c}"
+                                                   for c in campos)}
+        ),
+        l AS (
+            INSERT INTO log_pedidos (id_pedido, numero_pedido, campo, valor_antigo, valor_novo, usuario)
+            SELECT u.id, u.n_pedido, x.campo, x.antigo, x.novo, %s
+            FROM u CROSS JOIN LATERAL (VALUES {', '.join(f"('{c}', u.antigo_{c}, u.{c})" for c in campos)})
+                AS x (campo, antigo, novo)
+            WHERE x.antigo <> x.novo
+            RETURNING 1
+        )
+        SELECT (SELECT count(*) FROM u), (SELECT count(*) FROM l)
+    """, (usuario,))
+    return cur.fetchone()
+
+
+_CHAVE_VALIDA = re.compile(r'^[0-9a-f]{32}$')
+
+
+def caminho_relatorio(chave):
+    if not _CHAVE_VALIDA.match(chave or ''):
+        return None
+    return os.path.join(INGESTAO_DIR, f"{chave}.csv")
+
+
+def novo_relatorio():
+    # Devolve (chave, caminho) de um relatório novo, apagando os vencidos
+    os.makedirs(INGESTAO_DIR, exist_ok=True)
+    limite = time.time() - INGESTAO_RELATORIO_TTL
+    for nome in os.listdir(INGESTAO_DIR):
+        caminho = os.path.join(INGESTAO_DIR, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+    chave = uuid.uuid4().hex
+    return chave, caminho_relatorio(chave)
+
+
+def _escrever_relatorio(conn, relatorio):
+    # Cursor no servidor: as linhas rejeitadas vêm em blocos, sem ir todas para a memória
+    escritor = csv.writer(relatorio, delimiter=';', lineterminator='\n')
+    escritor.writerow(['linha', 'pedido', 'erro'])
+    cur = conn.cursor(name='relatorio_ingestao')
+    cur.itersize = 5000
+    cur.execute(f"SELECT linha, pedido, erro FROM {TABELA} WHERE erro IS NOT NULL ORDER BY linha")
+    for registro in cur:
+        escritor.writerow(registro)
+    cur.close()
+
+
+def ingerir_arquivo(conn, arquivo, nome_arquivo, usuario, relatorio=None, progresso=None):
+    # arquivo: binário aberto (upload ou disco). Grava na transação de conn; o commit
+    # fica por conta de quem chama. Com relatorio (arquivo texto), escreve nele o CSV
+    # linha;pedido;erro das linhas rejeitadas. progresso(linhas lidas) é chamado durante
+    # a leitura. Devolve o resumo da ingestão.
+    resumo = {'linhas': 0, 'erros': 0, 'processados': 0, 'alterados': 0, 'alteracoes': 0,
+              'amostra_erros': [], 'erros_arquivo': []}
+    planilha = iterar_planilha(arquivo, nome_arquivo)
+    try:
+        primeira = next(planilha, None)
+        if primeira is None:
+            resumo['erros_arquivo'] = ['Planilha vazia.']
+            return resumo
+        cabecalho, campos, erros = cabecalho_planilha(primeira)
+        if erros:
+            resumo['erros_arquivo'] = erros
+            return resumo
+
+        cur = conn.cursor()
+        # Temporária: não passa pelo WAL, é só desta conexão e some no fim da transação
+        cur.execute(f"""
+            CREATE TEMP TABLE {TABELA} (
+                linha INTEGER,
+                pedido INTEGER,
+                {', '.join(f'{c} {TIPOS_SQL[c]}' for c in COLUNAS)},
+                erro TEXT
+            ) ON COMMIT DROP
+        """)
+        registros = _registros(planilha, cabecalho, campos, resumo, progresso)
+        if psycopg2.extensions.get_wait_callback() is None:
+            cur.copy_expert(f"COPY {TABELA} FROM STDIN WITH (FORMAT csv)", _FonteCopy(registros))
+        else:
+            # O psycopg2 não faz COPY com o wait callback do psycogreen (workers gevent):
+            # INSERTs de várias linhas, ainda lendo o arquivo aos poucos
+            execute_values(cur, f"INSERT INTO {TABELA} VALUES %s", registros, page_size=1000)
+    except (UnicodeDecodeError, csv.Error, OSError, ValueError, KeyError):
+        conn.rollback()
+        resumo['erros_arquivo'] = ['Arquivo ilegível: envie um CSV (UTF-8) ou XLSX.']
+        return resumo
+
+    # Tabelas temporárias não passam pelo autovacuum: sem estatísticas o planejador
+    # escolheria laços aninhados para juntar 100 mil linhas
+    cur.execute(f"ANALYZE {TABELA}")
+    _marcar_erros(cur)
+    cur.execute(f"SELECT count(*) FILTER (WHERE erro IS NULL), count(*) FILTER (WHERE erro IS NOT NULL) FROM {TABELA}")
+    resumo['processados'], resumo['erros'] = cur.fetchone()
+    if resumo['processados']:
+        resumo['alterados'], resumo['alteracoes'] = _aplicar(cur, campos, usuario)
+    if resumo['erros']:
+        cur.execute(f"SELECT linha, pedido, erro FROM {TABELA} WHERE erro IS NOT NULL ORDER BY linha LIMIT 5")
+        resumo['amostra_erros'] = cur.fetchall()
+    cur.close()
+    if relatorio is not None:
+        _escrever_relatorio(conn, relatorio)
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingestão de arquivos de rastreio das transportadoras')
+    parser.add_argument('arquivo', help='CSV (; ou ,) ou XLSX com a coluna pedido e os campos a alterar')
+    parser.add_argument('--usuario', default='ingestao', help='usuário gravado no log dos pedidos')
+    parser.add_argument('--relatorio', help='grava aqui o CSV das linhas rejeitadas')
+    parser.add_argument('--simular', action='store_true', help='valida e conta, mas desfaz as alterações')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    relatorio = open(args.relatorio, 'w', encoding='utf-8', newline='') if args.relatorio else None
+    try:
+        with open(args.arquivo, 'rb') as arquivo:
+            resumo = ingerir_arquivo(conn, arquivo, args.arquivo, args.usuario, relatorio)
+        if args.simular:
+            conn.rollback()
+        else:
+            conn.commit()
+    finally:
+        if relatorio is not None:
+            relatorio.close()
+        conn.close()
+
+    if resumo['erros_arquivo']:
+        sys.exit('Arquivo rejeitado: ' + '; '.join(resumo['erros_arquivo']))
+    print(f"{resumo['linhas']} linha(s): {resumo['processados']} pedido(s) encontrados, "
+          f"{resumo['alterados']} alterado(s) ({resumo['alteracoes']} campo(s)), {resumo['erros']} com erro"
+          + (' [simulação, nada foi gravado]' if args.simular else ''))
+    for linha, pedido, erro in resumo['amostra_erros']:
+        print(f"  linha {linha} (pedido {pedido}): {erro}")
+
+
+if __name__ == "__main__":
+    main()
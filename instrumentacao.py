@@ -0,0 +1,244 @@
+import glob
+import hmac
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context, request, session
+from psycopg2.extensions import connection as _connection, cursor as _cursor
+
+# Medição de tempo por requisição (fases e consultas SQL), cabeçalho Server-Timing e
+# endpoint /metrics no formato texto do Prometheus. INSTRUMENTACAO=0 desliga tudo.
+INSTRUMENTACAO = os.environ.get('INSTRUMENTACAO', '1') == '1'
+CONSULTA_LENTA_MS = float(os.environ.get('INSTRUMENTACAO_CONSULTA_LENTA_MS', 500))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Os histogramas são de cada processo: cada worker grava os seus em METRICAS_DIR (no máximo a
+# cada METRICAS_INTERVALO segundos, ao fim de uma requisição) e /metrics soma os arquivos de
+# todos os workers do mesmo master, inclusive dos que já terminaram, para que os contadores
+# não voltem para trás entre uma coleta e outra. O master do gunicorn apaga os arquivos de
+# execuções anteriores ao iniciar (gunicorn.conf.py).
+METRICAS_DIR = os.environ.get('METRICAS_DIR', os.path.join(tempfile.gettempdir(), 'order_tracking_metricas'))
+METRICAS_INTERVALO = float(os.environ.get('METRICAS_INTERVALO', 5))
+# /metrics responde a administradores logados e a quem enviar "Authorization: Bearer <token>"
+# (no Prometheus: authorization.credentials do scrape_config). Sem token, só administradores.
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+logger = logging.getLogger(__name__)
+
+_histogramas = {}
+_histogramas_lock = threading.Lock()
+# Processo dono dos histogramas: após o fork os workers descartam a cópia herdada do master
+_processo = {'pid': None, 'arquivo': None, 'gravado': 0.0}
+
+
+def _grupo_metricas():
+    # Workers do mesmo master; fora do gunicorn, o próprio processo
+    return os.environ.get('METRICAS_GRUPO') or str(os.getpid())
+
+
+def _verificar_processo():
+    if _processo['pid'] != os.getpid():
+        _histogramas.clear()
+        _processo.update(pid=os.getpid(), gravado=0.0, arquivo=os.path.join(
+            METRICAS_DIR, f"{_grupo_metricas()}-{os.getpid()}-{int(time.time() * 1000)}.json"))
+
+
+def observar(metrica, labels, segundos):
+    chave = (metrica, tuple(sorted(labels.items())))
+    with _histogramas_lock:
+        _verificar_processo()
+        h = _histogramas.get(chave)
+        if h is None:
+            h = _histogramas[chave] = {'buckets': [0] * len(BUCKETS), 'soma': 0.0, 'total': 0}
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                h['buckets'][i] += 1
+        h['soma'] += segundos
+        h['total'] += 1
+
+
+def _registrar_fase(nome, segundos):
+    if has_app_context():
+        fases = g.setdefault('fases', {})
+        fases[nome] = fases.get(nome, 0.0) + segundos
+    observar('order_tracking_fase_duracao_segundos', {'fase': nome}, segundos)
+
+
+@contextmanager
+def medir(nome):
+    if not INSTRUMENTACAO:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registrar_fase(nome, time.perf_counter() - inicio)
+
+
+def normalizar_sql(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = re.sub(r'\s+', ' ', str(sql)).strip()
+    # Literais não parametrizados também viram '?', para agrupar consultas equivalentes
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    return re.sub(r'\b\d+\b', '?', sql)
+
+
+def _registrar_consulta(sql, segundos):
+    _registrar_fase('db_consulta', segundos)
+    if has_app_context():
+        g.setdefault('consultas', []).append((normalizar_sql(sql), segundos))
+    if segundos * 1000 >= CONSULTA_LENTA_MS:
+        logger.warning("Consulta lenta (%.1f ms): %s", segundos * 1000, normalizar_sql(sql))
+
+
+class _CursorMedido:
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registrar_consulta(query, time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _registrar_consulta(query, time.perf_counter() - inicio)
+
+
+_classes_medidas = {}
+
+
+def _cursor_medido(classe):
+    medida = _classes_medidas.get(classe)
+    if medida is None:
+        medida = _classes_medidas[classe] = type('Medido' + classe.__name__, (_CursorMedido, classe), {})
+    return medida
+
+
+class ConexaoMedida(_connection):
+    # Conexão do pool cujos cursores (de qualquer cursor_factory) medem execute()
+
+    def cursor(self, *args, **kwargs):
+        classe = kwargs.get('cursor_factory') or self.cursor_factory or _cursor
+        kwargs['cursor_factory'] = _cursor_medido(classe)
+        return super().cursor(*args, **kwargs)
+
+
+def gravar_metricas():
+    with _histogramas_lock:
+        _verificar_processo()
+        dados = [[m, labels, h] for (m, labels), h in _histogramas.items()]
+        arquivo = _processo['arquivo']
+        _processo['gravado'] = time.monotonic()
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    temporario = f"{arquivo}.{threading.get_ident()}"
+    with open(temporario, 'w') as f:
+        json.dump(dados, f)
+    os.replace(temporario, arquivo)
+
+
+def limpar_metricas():
+    # Chamado pelo master do gunicorn antes dos workers: descarta os arquivos de outras execuções
+    os.environ['METRICAS_GRUPO'] = str(os.getpid())
+    for arquivo in glob.glob(os.path.join(METRICAS_DIR, '*.json')):
+        try:
+            os.remove(arquivo)
+        except OSError:
+            pass
+
+
+def _combinar_metricas():
+    gravar_metricas()
+    combinados = {}
+    for arquivo in glob.glob(os.path.join(METRICAS_DIR, f'{_grupo_metricas()}-*.json')):
+        try:
+            with open(arquivo) as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metrica, labels, h in dados:
+            chave = (metrica, tuple(tuple(l) for l in labels))
+            c = combinados.setdefault(chave, {'buckets': [0] * len(BUCKETS), 'soma': 0.0, 'total': 0})
+            c['buckets'] = [a + b for a, b in zip(c['buckets'], h['buckets'])]
+            c['soma'] += h['soma']
+            c['total'] += h['total']
+    return combinados
+
+
+def _texto_metricas():
+    linhas = []
+    histogramas = _combinar_metricas()
+    itens = sorted(histogramas.items())
+    for metrica in sorted({m for m, _ in histogramas}):
+        linhas.append(f"# TYPE {metrica} histogram")
+        for (nome, labels), h in itens:
+            if nome != metrica:
+                continue
+            base = ','.join(f'{k}="{v}"' for k, v in labels)
+            sep = ',' if base else ''
+            for limite, qtd in zip(BUCKETS, h['buckets']):
+                linhas.append(f'{metrica}_bucket{{{base}{sep}le="{limite}"}} {qtd}')
+            linhas.append(f'{metrica}_bucket{{{base}{sep}le="+Inf"}} {h["total"]}')
+            linhas.append(f'{metrica}_sum{{{base}}} {h["soma"]:.6f}')
+            linhas.append(f'{metrica}_count{{{base}}} {h["total"]}')
+    return '\n'.join(linhas) + '\n'
+
+
+def _acesso_metricas():
+    if session.get('perfil') == 'admin':
+        return True
+    autorizacao = request.headers.get('Authorization', '')
+    return bool(METRICAS_TOKEN) and hmac.compare_digest(autorizacao.encode(), f'Bearer {METRICAS_TOKEN}'.encode())
+
+
+def iniciar_instrumentacao(app):
+    if not INSTRUMENTACAO:
+        return
+
+    from flask import before_render_template, template_rendered
+
+    @app.before_request
+    def _inicio_requisicao():
+        g.inicio_requisicao = time.perf_counter()
+
+    def _inicio_template(sender, template, context, **extra):
+        g.inicio_template = time.perf_counter()
+
+    def _fim_template(sender, template, context, **extra):
+        inicio = g.pop('inicio_template', None)
+        if inicio is not None:
+            _registrar_fase('template', time.perf_counter() - inicio)
+
+    before_render_template.connect(_inicio_template, app, weak=False)
+    template_rendered.connect(_fim_template, app, weak=False)
+
+    @app.after_request
+    def _fim_requisicao(response):
+        inicio = g.get('inicio_requisicao')
+        if inicio is None:
+            return response
+        total = time.perf_counter() - inicio
+        observar('order_tracking_requisicao_duracao_segundos',
+                 {'rota': request.endpoint or 'desconhecida', 'metodo': request.method,
+                  'status': str(response.status_code)}, total)
+        partes = [f'{nome};dur={segundos * 1000:.1f}' for nome, segundos in g.get('fases', {}).items()]
+        partes.append(f'db_consultas;desc="{len(g.get("consultas", []))} consultas"')
+        partes.append(f'total;dur={total * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(partes)
+        if time.monotonic() - _processo['gravado'] >= METRICAS_INTERVALO:
+            gravar_metricas()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if not _acesso_metricas():
+            return app.response_class('Acesso negado.\n', status=403, mimetype='text/plain')
+        return app.response_class(_texto_metricas(), mimetype='text/plain; version=0.0.4')
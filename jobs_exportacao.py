@@ -0,0 +1,138 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from db import count_pedidos
+from exportacao import exportar_paralelo, parquet_disponivel
+
+# Exportações em segundo plano: o arquivo é gerado por uma thread em disco local e o
+# estado do job fica em <chave>.json no mesmo diretório, para que qualquer worker do
+# gunicorn consiga responder o status e servir o download.
+EXPORTACAO_DIR = os.environ.get("EXPORTACAO_DIR", os.path.join(tempfile.gettempdir(), "order_tracking_exports"))
+EXPORTACAO_TTL = int(os.environ.get("EXPORTACAO_TTL", 600))
+# Exportações simultâneas por processo; as conexões que elas ocupam juntas são limitadas
+# por exportacao.EXPORTACAO_CONEXOES_PROCESSO
+EXPORTACAO_WORKERS = int(os.environ.get("EXPORTACAO_WORKERS", 2))
+# Job sem atualização de progresso há mais tempo que isso é considerado abandonado
+EXPORTACAO_JOB_INATIVO = int(os.environ.get("EXPORTACAO_JOB_INATIVO", 120))
+
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+FORMATOS = ['xlsx', 'csv'] + (['parquet'] if parquet_disponivel() else [])
+
+_CHAVE_VALIDA = re.compile(r'^[0-9a-f]{40}$')
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=EXPORTACAO_WORKERS, thread_name_prefix='exportacao')
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def chave_exportacao(filtros, formato):
+    # A data entra na chave porque os atrasos dependem do dia em que o arquivo foi gerado
+    bruto = json.dumps({'filtros': filtros, 'formato': formato, 'dia': date.today().isoformat()},
+                       sort_keys=True)
+    return hashlib.sha1(bruto.encode()).hexdigest()
+
+
+def _caminho(chave, extensao):
+    return os.path.join(EXPORTACAO_DIR, f"{chave}.{extensao}")
+
+
+def ler_job(chave):
+    if not _CHAVE_VALIDA.match(chave or ''):
+        return None
+    try:
+        with open(_caminho(chave, 'json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_job(chave, **campos):
+    job = ler_job(chave) or {}
+    job.update(campos, chave=chave, atualizado=time.time())
+    temporario = _caminho(chave, f'json.{os.getpid()}.{threading.get_ident()}')
+    with open(temporario, 'w') as f:
+        json.dump(job, f)
+    os.replace(temporario, _caminho(chave, 'json'))
+    return job
+
+
+def arquivo_job(chave):
+    job = ler_job(chave)
+    if not job or job.get('status') != 'pronto':
+        return None
+    caminho = _caminho(chave, job['formato'])
+    return caminho if os.path.exists(caminho) else None
+
+
+def _reaproveitavel(job):
+    agora = time.time()
+    if job.get('status') == 'pronto':
+        return agora - job.get('concluido', 0) < EXPORTACAO_TTL and arquivo_job(job['chave']) is not None
+    if job.get('status') in ('pendente', 'processando'):
+        return agora - job.get('atualizado', 0) < EXPORTACAO_JOB_INATIVO
+    return False
+
+
+def _limpar_antigos():
+    limite = time.time() - max(EXPORTACAO_TTL, EXPORTACAO_JOB_INATIVO) * 2
+    for nome in os.listdir(EXPORTACAO_DIR):
+        caminho = os.path.join(EXPORTACAO_DIR, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _executar(chave, filtros, formato):
+    destino = _caminho(chave, formato)
+    parcial = f"{destino}.{os.getpid()}.parcial"
+    try:
+        total = count_pedidos(**filtros)
+        _gravar_job(chave, status='processando', total=total)
+        # Exportações grandes são lidas e processadas em paralelo (ver exportacao.exportar_paralelo)
+        exportar_paralelo(filtros, formato, parcial, progresso=lambda linhas: _gravar_job(chave, linhas=linhas),
+                          total=total)
+        os.replace(parcial, destino)
+        _gravar_job(chave, status='pronto', concluido=time.time())
+    except Exception as e:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        _gravar_job(chave, status='erro', erro=str(e))
+
+
+def iniciar_exportacao(filtros, formato='xlsx', usuario=None):
+    if formato not in FORMATOS:
+        formato = 'xlsx'
+    os.makedirs(EXPORTACAO_DIR, exist_ok=True)
+    chave = chave_exportacao(filtros, formato)
+    job = ler_job(chave)
+    if job and _reaproveitavel(job):
+        return job
+
+    _limpar_antigos()
+    job = _gravar_job(chave, status='pendente', formato=formato, filtros=filtros, usuario=usuario,
+                      linhas=0, total=None, erro=None, criado=time.time())
+    # Com uma cópia do contexto: o LSN da última escrita do usuário (db.exigir_lsn) vale
+    # também para as leituras da exportação, que não vão para uma réplica atrasada
+    _get_executor().submit(contextvars.copy_context().run, _executar, chave, filtros, formato)
+    return job
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db import conexao
+from ingestao_transportadoras import INGESTAO_DIR, caminho_relatorio, ingerir_arquivo, novo_relatorio
+
+# Ingestões de arquivos de transportadora enviados pela tela, em segundo plano: um arquivo
+# de 100 mil linhas leva dezenas de segundos e prenderia o worker do gunicorn (e estouraria
+# o timeout dele). O upload é salvo em INGESTAO_DIR e ingerido por uma thread; o estado do
+# job fica em <chave>.json no mesmo diretório, para que qualquer worker responda o status,
+# e o relatório de erros é o <chave>.csv de ingestao_transportadoras.novo_relatorio.
+# Cada ingestão ocupa uma conexão do pool até o fim.
+INGESTAO_WORKERS = int(os.environ.get("INGESTAO_WORKERS", 1))
+# Job sem atualização há mais tempo que isso é considerado abandonado (o UPDATE final de
+# um arquivo grande não informa progresso)
+INGESTAO_JOB_INATIVO = int(os.environ.get("INGESTAO_JOB_INATIVO", 600))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=INGESTAO_WORKERS, thread_name_prefix='ingestao')
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _caminho(chave, extensao):
+    return os.path.join(INGESTAO_DIR, f"{chave}.{extensao}")
+
+
+def ler_ingestao(chave):
+    if caminho_relatorio(chave) is None:
+        return None
+    try:
+        with open(_caminho(chave, 'json')) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    parado = time.time() - job.get('atualizado', 0) > INGESTAO_JOB_INATIVO
+    if job.get('status') in ('pendente', 'processando') and parado:
+        job.update(status='erro', erro='Importação interrompida; envie o arquivo novamente.')
+    return job
+
+
+def _gravar_job(chave, **campos):
+    try:
+        with open(_caminho(chave, 'json')) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        job = {}
+    job.update(campos, chave=chave, atualizado=time.time())
+    temporario = _caminho(chave, f'json.{os.getpid()}.{threading.get_ident()}')
+    with open(temporario, 'w') as f:
+        json.dump(job, f)
+    os.replace(temporario, _caminho(chave, 'json'))
+    return job
+
+
+def _executar(chave, nome_arquivo, usuario, ao_concluir):
+    entrada = _caminho(chave, 'entrada')
+    relatorio = caminho_relatorio(chave)
+    try:
+        _gravar_job(chave, status='processando')
+        with open(relatorio, 'w', encoding='utf-8', newline='') as saida, open(entrada, 'rb') as arquivo, \
+                conexao() as conn:
+            resumo = ingerir_arquivo(conn, arquivo, nome_arquivo, usuario, saida,
+                                     progresso=lambda linhas: _gravar_job(chave, linhas=linhas))
+            conn.commit()
+        if resumo['erros_arquivo'] or not resumo['erros']:
+            os.remove(relatorio)
+        if resumo['alterados'] and ao_concluir:
+            ao_concluir()
+        _gravar_job(chave, status='pronto', concluido=time.time(), linhas=resumo['linhas'], resumo=resumo,
+                    relatorio=bool(resumo['erros'] and not resumo['erros_arquivo']))
+    except Exception as e:
+        if os.path.exists(relatorio):
+            os.remove(relatorio)
+        _gravar_job(chave, status='erro', erro=str(e))
+    finally:
+        if os.path.exists(entrada):
+            os.remove(entrada)
+
+
+def iniciar_ingestao(arquivo, nome_arquivo, usuario, ao_concluir=None):
+    # arquivo: upload do Flask (FileStorage). ao_concluir() é chamado na thread do job
+    # depois do commit, se algum pedido mudou. A thread não recebe o contexto da requisição
+    # (a ingestão só usa o primário, e a requisição já terá terminado).
+    chave, _ = novo_relatorio()
+    arquivo.save(_caminho(chave, 'entrada'))
+    job = _gravar_job(chave, status='pendente', arquivo=nome_arquivo, usuario=usuario, linhas=0, erro=None,
+                      criado=time.time())
+    _get_executor().submit(_executar, chave, nome_arquivo, usuario, ao_concluir)
+    return job
@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import os
+import re
+import sys
+from db import get_db_connection
+
+# Aplica os arquivos migrations/NNNN_*.sql ainda não aplicados, em ordem, registrando cada
+# um em schema_migracoes. Cada arquivo roda numa transação própria; os que usam
+# CREATE INDEX CONCURRENTLY (que não pode rodar dentro de transação) rodam em autocommit.
+#
+#   python migracoes.py              aplica as pendentes
+#   python migracoes.py --status     lista aplicadas e pendentes
+#   python migracoes.py --registrar 0003 0004
+#                                    marca como aplicadas migrações já rodadas à mão
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+_ARQUIVO = re.compile(r'^(\d{4})_.+\.sql$')
+
+
+def migracoes_disponiveis():
+    # [(versao, caminho)] em ordem de versão
+    arquivos = []
+    for nome in sorted(os.listdir(MIGRATIONS)):
+        m = _ARQUIVO.match(nome)
+        if m:
+            arquivos.append((m.group(1), os.path.join(MIGRATIONS, nome)))
+    return arquivos
+
+
+def _ler(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        sql = f.read()
+    return sql, hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+
+def _garantir_tabela(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao TEXT PRIMARY KEY,
+            arquivo TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+    conn.commit()
+    cur.close()
+
+
+def migracoes_aplicadas(conn):
+    _garantir_tabela(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT versao, checksum FROM schema_migracoes")
+    aplicadas = dict(cur.fetchall())
+    cur.close()
+    # Não deixa transação aberta: as migrações com CONCURRENTLY trocam para autocommit
+    conn.rollback()
+    return aplicadas
+
+
+def _registrar(cur, versao, caminho, checksum):
+    cur.execute("""
+        INSERT INTO schema_migracoes (versao, arquivo, checksum) VALUES (%s, %s, %s)
+        ON CONFLICT (versao) DO UPDATE SET arquivo = EXCLUDED.arquivo, checksum = EXCLUDED.checksum
+    """, (versao, os.path.basename(caminho), checksum))
+
+
+def _comandos(sql):
+    # Separa o arquivo em comandos (';' no fim da linha, fora de blocos $$ ... $$), já que
+    # vários comandos num só execute rodam numa transação implícita
+    comandos, atual = [], []
+    for linha in sql.splitlines():
+        atual.append(linha)
+        if linha.rstrip().endswith(';') and '\n'.join(atual).count('$$') % 2 == 0:
+            comandos.append('\n'.join(atual))
+            atual = []
+    if '\n'.join(atual).strip():
+        comandos.append('\n'.join(atual))
+    return comandos
+
+
+def aplicar(conn, versao, caminho):
+    sql, checksum = _ler(caminho)
+    if 'CONCURRENTLY' in sql.upper():
+        # Cada comando é efetivado sozinho; arquivos assim devem ser idempotentes
+        # (IF NOT EXISTS), já que uma falha no meio não desfaz os anteriores
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            for comando in _comandos(sql):
+                cur.execute(comando)
+            _registrar(cur, versao, caminho, checksum)
+            cur.close()
+        finally:
+            conn.autocommit = False
+        return
+    cur = conn.cursor()
+    try:
+        cur.execute(sql)
+        _registrar(cur, versao, caminho, checksum)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def migrar(conn):
+    # Aplica as pendentes e devolve as versões aplicadas nesta execução
+    aplicadas = migracoes_aplicadas(conn)
+    novas = []
+    for versao, caminho in migracoes_disponiveis():
+        if versao in aplicadas:
+            continue
+        print(f"aplicando {os.path.basename(caminho)}", flush=True)
+        aplicar(conn, versao, caminho)
+        novas.append(versao)
+    return novas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrações do banco (migrations/NNNN_*.sql)')
+    parser.add_argument('--status', action='store_true', help='lista migrações aplicadas e pendentes')
+    parser.add_argument('--registrar', nargs='+', metavar='VERSAO',
+                        help='marca versões como aplicadas sem executá-las')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        disponiveis = migracoes_disponiveis()
+        if args.status:
+            aplicadas = migracoes_aplicadas(conn)
+            for versao, caminho in disponiveis:
+                checksum = _ler(caminho)[1]
+                if versao not in aplicadas:
+                    situacao = 'pendente'
+                elif aplicadas[versao] != checksum:
+                    situacao = 'aplicada (arquivo alterado depois)'
+                else:
+                    situacao = 'aplicada'
+                print(f"{os.path.basename(caminho):40} {situacao}")
+        elif args.registrar:
+            _garantir_tabela(conn)
+            caminhos = dict(disponiveis)
+            desconhecidas = [v for v in args.registrar if v not in caminhos]
+            if desconhecidas:
+                sys.exit(f"versões inexistentes: {', '.join(desconhecidas)}")
+            cur = conn.cursor()
+            for versao in args.registrar:
+                _registrar(cur, versao, caminhos[versao], _ler(caminhos[versao])[1])
+            conn.commit()
+            cur.close()
+        else:
+            novas = migrar(conn)
+            print(f"{len(novas)} migração(ões) aplicada(s)" if novas else "banco já atualizado")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
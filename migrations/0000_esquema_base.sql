@@ -0,0 +1,53 @@
+-- Tabelas do sistema, para bancos novos; em bancos existentes não altera nada
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    nome TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    senha TEXT NOT NULL,
+    perfil TEXT NOT NULL,
+    ativo BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS status_logistico_teste (
+    id SERIAL PRIMARY KEY,
+    descricao TEXT NOT NULL,
+    cor TEXT
+);
+
+CREATE TABLE IF NOT EXISTS situacoes (
+    id SERIAL PRIMARY KEY,
+    situacao TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS notas_fiscais_teste (
+    id SERIAL PRIMARY KEY,
+    n_nota INTEGER,
+    nome_cliente TEXT
+);
+
+CREATE TABLE IF NOT EXISTS pedidos_teste (
+    id SERIAL PRIMARY KEY,
+    n_pedido INTEGER,
+    status_logistico_id INTEGER,
+    id_nf INTEGER,
+    id_situacao INTEGER,
+    data_pedido DATE,
+    data_expedicao DATE,
+    data_previsao DATE,
+    data_entrega DATE,
+    transportadora VARCHAR(80),
+    cod_rastreamento VARCHAR(80),
+    frete VARCHAR(20)
+);
+
+CREATE TABLE IF NOT EXISTS log_pedidos (
+    id SERIAL PRIMARY KEY,
+    id_pedido INTEGER,
+    numero_pedido INTEGER,
+    campo TEXT,
+    valor_antigo TEXT,
+    valor_novo TEXT,
+    usuario TEXT,
+    data_alteracao TIMESTAMP DEFAULT now()
+);
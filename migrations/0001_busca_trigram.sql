@@ -0,0 +1,18 @@
+-- Índices para os filtros f_pedido, f_cliente e f_nota (ver busca.py)
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Número do pedido / nota: prefixo (entrada numérica) e substring (demais entradas)
+CREATE INDEX IF NOT EXISTS idx_pedidos_n_pedido_prefixo
+    ON pedidos_teste ((CAST(n_pedido AS TEXT)) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_pedidos_n_pedido_trgm
+    ON pedidos_teste USING gin ((CAST(n_pedido AS TEXT)) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_notas_n_nota_prefixo
+    ON notas_fiscais_teste ((CAST(n_nota AS TEXT)) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_notas_n_nota_trgm
+    ON notas_fiscais_teste USING gin ((CAST(n_nota AS TEXT)) gin_trgm_ops);
+
+-- Nome do cliente: ILIKE '%x%' e similaridade de palavra (<%)
+CREATE INDEX IF NOT EXISTS idx_notas_nome_cliente_trgm
+    ON notas_fiscais_teste USING gin (nome_cliente gin_trgm_ops);
@@ -0,0 +1,27 @@
+-- Contador de versão dos dados de pedidos, usado no ETag/Last-Modified das listagens
+-- e para invalidar o cache de fragmentos renderizados (ver respostas.py)
+
+CREATE TABLE IF NOT EXISTS versao_dados (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    versao BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO versao_dados (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Escritas feitas fora do app (integrações, scripts) também invalidam os caches
+CREATE OR REPLACE FUNCTION incrementar_versao_dados() RETURNS trigger AS $$
+BEGIN
+    UPDATE versao_dados SET versao = versao + 1, atualizado_em = now() WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_versao_pedidos ON pedidos_teste;
+CREATE TRIGGER trg_versao_pedidos
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pedidos_teste
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_dados();
+
+DROP TRIGGER IF EXISTS trg_versao_notas ON notas_fiscais_teste;
+CREATE TRIGGER trg_versao_notas
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON notas_fiscais_teste
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_dados();
@@ -0,0 +1,5 @@
+-- Histórico por pedido (ver historico_pedidos.py): WHERE id_pedido = ? ORDER BY id DESC LIMIT n.
+-- CONCURRENTLY para não travar as escritas em log_pedidos; rodar fora de transação (psql -f).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_log_pedidos_pedido
+    ON log_pedidos (id_pedido, id DESC);
@@ -0,0 +1,36 @@
+-- Notificação (LISTEN/NOTIFY) das alterações em pedidos_teste, usada pelas atualizações
+-- ao vivo do order tracking (ver eventos.py). Uma notificação por comando, entregue no
+-- commit, com até 500 ids; acima disso "ids" vai nulo e os clientes atualizam o que exibem.
+
+CREATE OR REPLACE FUNCTION notificar_pedidos_alterados() RETURNS trigger AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM linhas_antigas LIMIT 501) x;
+    ELSE
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM linhas_novas LIMIT 501) x;
+    END IF;
+    IF ids IS NOT NULL THEN
+        PERFORM pg_notify('pedidos_alterados', json_build_object(
+            'ids', CASE WHEN cardinality(ids) > 500 THEN NULL ELSE ids END)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tabelas de transição só admitem um evento por trigger
+DROP TRIGGER IF EXISTS trg_eventos_pedidos_insert ON pedidos_teste;
+CREATE TRIGGER trg_eventos_pedidos_insert
+    AFTER INSERT ON pedidos_teste REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_pedidos_alterados();
+
+DROP TRIGGER IF EXISTS trg_eventos_pedidos_update ON pedidos_teste;
+CREATE TRIGGER trg_eventos_pedidos_update
+    AFTER UPDATE ON pedidos_teste REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_pedidos_alterados();
+
+DROP TRIGGER IF EXISTS trg_eventos_pedidos_delete ON pedidos_teste;
+CREATE TRIGGER trg_eventos_pedidos_delete
+    AFTER DELETE ON pedidos_teste REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_pedidos_alterados();
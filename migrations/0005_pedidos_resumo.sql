@@ -0,0 +1,156 @@
+-- Modelo de leitura desnormalizado das listagens (PEDIDOS_RESUMO=1, ver db.py): pedido,
+-- nota, status e situação já juntos, mais as datas a partir das quais o pedido conta como
+-- atrasado. Mantido por triggers na mesma transação de cada escrita (só as linhas afetadas);
+-- reconstruir_pedidos_resumo() refaz tudo.
+--
+-- As regras são as de status_pedidos.derivar_status; o que depende do dia (comparar com
+-- CURRENT_DATE) fica para a consulta, já que a tabela não muda quando o dia vira.
+
+CREATE TABLE IF NOT EXISTS pedidos_resumo (
+    id INTEGER PRIMARY KEY,
+    n_pedido INTEGER,
+    id_nf INTEGER,
+    n_nota INTEGER,
+    nome_cliente TEXT,
+    status_logistico_id INTEGER,
+    status_descricao TEXT,
+    status_cor TEXT,
+    id_situacao INTEGER,
+    situacao_comercial TEXT,
+    data_pedido DATE,
+    data_expedicao DATE,
+    data_previsao DATE,
+    data_entrega DATE,
+    transportadora VARCHAR(80),
+    cod_rastreamento VARCHAR(80),
+    frete VARCHAR(20),
+    -- Status após a regra de situação comercial ('Aguardando Envio'), antes das datas
+    status_efetivo TEXT,
+    -- Atrasado quando a data é anterior a hoje; NULL quando a regra não se aplica
+    atraso_entrega_desde DATE,
+    atraso_previsao_desde DATE,
+    atraso_expedicao_desde DATE
+);
+
+CREATE OR REPLACE VIEW pedidos_resumo_fonte AS
+SELECT
+    x.*,
+    CASE WHEN x.status_efetivo = 'Aguardando Envio' THEN x.data_previsao END AS atraso_previsao_desde,
+    CASE WHEN x.status_efetivo = 'Aguardando Envio' THEN x.data_expedicao END AS atraso_expedicao_desde
+FROM (
+    SELECT
+        p.id, p.n_pedido, p.id_nf, n.n_nota, n.nome_cliente,
+        p.status_logistico_id, s.descricao AS status_descricao, s.cor AS status_cor,
+        p.id_situacao, si.situacao AS situacao_comercial,
+        p.data_pedido, p.data_expedicao, p.data_previsao, p.data_entrega,
+        p.transportadora, p.cod_rastreamento, p.frete,
+        CASE
+            WHEN lower(btrim(si.situacao)) IN ('atendido', '02 faturado mmvb')
+                 AND COALESCE(s.descricao, '') IN ('', 'Aguardando Envio')
+            THEN 'Aguardando Envio'
+            ELSE s.descricao
+        END AS status_efetivo,
+        CASE WHEN s.descricao IS DISTINCT FROM 'Entregue' THEN p.data_entrega END AS atraso_entrega_desde
+    FROM pedidos_teste p
+    LEFT JOIN notas_fiscais_teste n ON n.id = p.id_nf
+    LEFT JOIN status_logistico_teste s ON s.id = p.status_logistico_id
+    LEFT JOIN situacoes si ON si.id = p.id_situacao
+) x;
+
+-- pedidos_resumo_fonte tem as colunas na mesma ordem da tabela
+CREATE OR REPLACE FUNCTION atualizar_pedidos_resumo(ids INTEGER[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM pedidos_resumo WHERE id = ANY(ids);
+    INSERT INTO pedidos_resumo SELECT * FROM pedidos_resumo_fonte WHERE id = ANY(ids);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION reconstruir_pedidos_resumo() RETURNS void AS $$
+BEGIN
+    -- DELETE em vez de TRUNCATE: as leituras continuam vendo a versão anterior até o commit
+    DELETE FROM pedidos_resumo;
+    INSERT INTO pedidos_resumo SELECT * FROM pedidos_resumo_fonte;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Um trigger por tabela/evento (tabelas de transição só admitem um evento); a função
+-- descobre quais pedidos foram afetados pelo nome da tabela
+CREATE OR REPLACE FUNCTION resumo_pedidos_trigger() RETURNS trigger AS $$
+DECLARE
+    alterados INTEGER[];
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id) INTO alterados FROM linhas_antigas;
+    ELSE
+        SELECT array_agg(id) INTO alterados FROM linhas_novas;
+    END IF;
+    IF alterados IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_TABLE_NAME = 'pedidos_teste' THEN
+        ids := alterados;
+    ELSIF TG_TABLE_NAME = 'notas_fiscais_teste' THEN
+        SELECT array_agg(id) INTO ids FROM pedidos_teste WHERE id_nf = ANY(alterados);
+    ELSIF TG_TABLE_NAME = 'status_logistico_teste' THEN
+        SELECT array_agg(id) INTO ids FROM pedidos_teste WHERE status_logistico_id = ANY(alterados);
+    ELSE
+        SELECT array_agg(id) INTO ids FROM pedidos_teste WHERE id_situacao = ANY(alterados);
+    END IF;
+
+    IF ids IS NOT NULL THEN
+        PERFORM atualizar_pedidos_resumo(ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tabela TEXT;
+BEGIN
+    FOREACH tabela IN ARRAY ARRAY['pedidos_teste', 'notas_fiscais_teste', 'status_logistico_teste', 'situacoes'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_resumo_insert ON %I', tabela);
+        EXECUTE format('CREATE TRIGGER trg_resumo_insert AFTER INSERT ON %I REFERENCING NEW TABLE AS linhas_novas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION resumo_pedidos_trigger()', tabela);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_resumo_update ON %I', tabela);
+        EXECUTE format('CREATE TRIGGER trg_resumo_update AFTER UPDATE ON %I REFERENCING NEW TABLE AS linhas_novas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION resumo_pedidos_trigger()', tabela);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_resumo_delete ON %I', tabela);
+        EXECUTE format('CREATE TRIGGER trg_resumo_delete AFTER DELETE ON %I REFERENCING OLD TABLE AS linhas_antigas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION resumo_pedidos_trigger()', tabela);
+    END LOOP;
+END;
+$$;
+
+-- Usados pelos triggers para achar os pedidos de uma nota / status / situação
+CREATE INDEX IF NOT EXISTS idx_pedidos_id_nf ON pedidos_teste (id_nf);
+CREATE INDEX IF NOT EXISTS idx_pedidos_status ON pedidos_teste (status_logistico_id);
+CREATE INDEX IF NOT EXISTS idx_pedidos_situacao ON pedidos_teste (id_situacao);
+
+-- Listagens: ordenação (data_pedido, id) com e sem o filtro de situação, que as duas telas sempre usam
+CREATE INDEX IF NOT EXISTS idx_resumo_data ON pedidos_resumo (data_pedido DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_resumo_situacao_data ON pedidos_resumo (id_situacao, data_pedido DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_resumo_status ON pedidos_resumo (status_logistico_id);
+CREATE INDEX IF NOT EXISTS idx_resumo_n_pedido_prefixo
+    ON pedidos_resumo ((CAST(n_pedido AS TEXT)) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_resumo_n_nota_prefixo
+    ON pedidos_resumo ((CAST(n_nota AS TEXT)) text_pattern_ops);
+
+-- Busca por substring/similaridade, como em 0001_busca_trigram.sql, quando o pg_trgm existe
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS idx_resumo_n_pedido_trgm
+            ON pedidos_resumo USING gin ((CAST(n_pedido AS TEXT)) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_resumo_n_nota_trgm
+            ON pedidos_resumo USING gin ((CAST(n_nota AS TEXT)) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_resumo_nome_cliente_trgm
+            ON pedidos_resumo USING gin (nome_cliente gin_trgm_ops);
+    END IF;
+END;
+$$;
+
+SELECT reconstruir_pedidos_resumo();
+ANALYZE pedidos_resumo;
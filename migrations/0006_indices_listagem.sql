@@ -0,0 +1,31 @@
+-- Índices dos caminhos de acesso das listagens e dos indicadores
+-- (conferidos por benchmarks/verificar_planos.py)
+
+-- Ordenação padrão (data_pedido DESC, id DESC), paginação por cursor e filtro de período
+CREATE INDEX IF NOT EXISTS idx_pedidos_data ON pedidos_teste (data_pedido DESC, id DESC);
+
+-- Filtros de situação (sempre usado pelas telas) e de status, já na ordem da listagem;
+-- substituem os índices simples criados em 0005 para os triggers do resumo
+CREATE INDEX IF NOT EXISTS idx_pedidos_situacao_data ON pedidos_teste (id_situacao, data_pedido DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_pedidos_status_data ON pedidos_teste (status_logistico_id, data_pedido DESC, id DESC);
+DROP INDEX IF EXISTS idx_pedidos_situacao;
+DROP INDEX IF EXISTS idx_pedidos_status;
+
+-- Indicadores de atraso: só pedidos não entregues. O predicado usa o id de 'Entregue'
+-- como literal, igual à consulta de app.SQL_ATRASOS. Num banco ainda sem status cadastrados
+-- nada é criado; basta rodar este arquivo de novo depois (psql -f), é idempotente.
+DO $$
+DECLARE
+    entregue INTEGER;
+BEGIN
+    SELECT min(id) INTO entregue FROM status_logistico_teste WHERE descricao = 'Entregue';
+    IF entregue IS NOT NULL THEN
+        EXECUTE format('CREATE INDEX IF NOT EXISTS idx_pedidos_atraso_entrega ON pedidos_teste (data_entrega) '
+                       'WHERE status_logistico_id <> %s', entregue);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS idx_pedidos_atraso_expedicao ON pedidos_teste (data_expedicao) '
+                       'WHERE status_logistico_id <> %s', entregue);
+    END IF;
+END;
+$$;
+
+ANALYZE pedidos_teste;
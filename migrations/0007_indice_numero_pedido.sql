@@ -0,0 +1,5 @@
+-- Pedidos por número: atualização em lote por planilha (edicao_pedidos.atualizar_pedidos_em_lote)
+-- e ingestão dos arquivos das transportadoras (ingestao_transportadoras.py), que juntam o
+-- arquivo com pedidos_teste por n_pedido. CONCURRENTLY para não travar as escritas.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pedidos_n_pedido ON pedidos_teste (n_pedido);
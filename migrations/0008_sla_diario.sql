@@ -0,0 +1,196 @@
+-- Indicadores de prazo logístico (ver sla.py): agregados por dia do pedido e transportadora
+-- em sla_diario, e por mês em sla_mensal, para que períodos longos somem poucas linhas.
+-- Mantidos pelos triggers de pedidos_teste na mesma transação da escrita: cada alteração
+-- recalcula os meses/transportadoras afetados. reconstruir_sla() refaz tudo (por exemplo
+-- depois de renomear o status 'Entregue').
+--
+-- Os tempos (em dias) também vão como histogramas: histograma[i + 1] = pedidos com i dias, e a
+-- última posição acumula os de 60 dias ou mais. Histogramas se somam entre dias e meses,
+-- então os percentis de qualquer período saem dos agregados sem voltar aos pedidos.
+
+CREATE TABLE IF NOT EXISTS sla_diario (
+    dia DATE NOT NULL,
+    -- '' para pedidos sem transportadora
+    transportadora TEXT NOT NULL,
+    pedidos INTEGER NOT NULL,
+    -- data_pedido -> data_expedicao
+    expedidos INTEGER NOT NULL,
+    soma_expedicao INTEGER NOT NULL,
+    hist_expedicao INTEGER[] NOT NULL,
+    -- data_pedido -> data_entrega, só dos entregues
+    entregues INTEGER NOT NULL,
+    soma_entrega INTEGER NOT NULL,
+    hist_entrega INTEGER[] NOT NULL,
+    -- data_expedicao -> data_entrega, só dos entregues
+    transitos INTEGER NOT NULL,
+    soma_transito INTEGER NOT NULL,
+    hist_transito INTEGER[] NOT NULL,
+    -- Entregues com data_previsao, e quantos deles até a previsão
+    com_previsao INTEGER NOT NULL,
+    no_prazo INTEGER NOT NULL,
+    -- Fretes com valor numérico
+    fretes INTEGER NOT NULL,
+    soma_frete NUMERIC NOT NULL,
+    PRIMARY KEY (dia, transportadora)
+);
+
+-- Mesmas colunas, com o primeiro dia do mês em dia
+CREATE TABLE IF NOT EXISTS sla_mensal (LIKE sla_diario INCLUDING ALL);
+
+CREATE OR REPLACE VIEW sla_pedidos_fonte AS
+SELECT
+    x.dia, x.transportadora,
+    CASE WHEN x.data_expedicao >= x.dia THEN x.data_expedicao - x.dia END AS dias_expedicao,
+    CASE WHEN x.entregue AND x.data_entrega >= x.dia THEN x.data_entrega - x.dia END AS dias_entrega,
+    CASE WHEN x.entregue AND x.data_entrega >= x.data_expedicao THEN x.data_entrega - x.data_expedicao END AS dias_transito,
+    CASE WHEN x.entregue AND x.data_previsao IS NOT NULL THEN x.data_entrega <= x.data_previsao END AS no_prazo,
+    CASE WHEN btrim(x.frete) ~ '^[0-9]+([.,][0-9]+)?$' THEN replace(btrim(x.frete), ',', '.')::numeric END AS frete
+FROM (
+    SELECT
+        p.data_pedido AS dia,
+        COALESCE(p.transportadora, '') AS transportadora,
+        p.data_expedicao, p.data_previsao, p.data_entrega, p.frete,
+        s.descricao IS NOT DISTINCT FROM 'Entregue' AND p.data_entrega IS NOT NULL AS entregue
+    FROM pedidos_teste p
+    LEFT JOIN status_logistico_teste s ON s.id = p.status_logistico_id
+    WHERE p.data_pedido IS NOT NULL
+) x;
+
+-- Laço em plpgsql: bem mais rápido que agrupar com unnest/generate_series a cada chamada
+CREATE OR REPLACE FUNCTION sla_histograma(dias INTEGER[]) RETURNS INTEGER[] AS $$
+DECLARE
+    histograma INTEGER[] := array_fill(0, ARRAY[61]);
+    d INTEGER;
+BEGIN
+    FOREACH d IN ARRAY dias LOOP
+        IF d IS NOT NULL THEN
+            histograma[LEAST(d, 60) + 1] := histograma[LEAST(d, 60) + 1] + 1;
+        END IF;
+    END LOOP;
+    RETURN histograma;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Agregados dos meses/transportadoras informados (arrays paralelos), por dia ou por mês
+CREATE OR REPLACE FUNCTION sla_agregar(meses DATE[], transportadoras TEXT[], mensal BOOLEAN)
+RETURNS SETOF sla_diario AS $$
+    SELECT
+        CASE WHEN mensal THEN date_trunc('month', f.dia)::date ELSE f.dia END,
+        f.transportadora,
+        count(*)::integer,
+        count(f.dias_expedicao)::integer, COALESCE(sum(f.dias_expedicao), 0)::integer,
+        sla_histograma(array_agg(f.dias_expedicao)),
+        count(f.dias_entrega)::integer, COALESCE(sum(f.dias_entrega), 0)::integer,
+        sla_histograma(array_agg(f.dias_entrega)),
+        count(f.dias_transito)::integer, COALESCE(sum(f.dias_transito), 0)::integer,
+        sla_histograma(array_agg(f.dias_transito)),
+        count(f.no_prazo)::integer, (count(*) FILTER (WHERE f.no_prazo))::integer,
+        count(f.frete)::integer, COALESCE(sum(f.frete), 0)
+    FROM sla_pedidos_fonte f
+    JOIN unnest(meses, transportadoras) AS k (mes, transportadora)
+      ON date_trunc('month', f.dia)::date = k.mes AND f.transportadora = k.transportadora
+    -- O intervalo entre o primeiro e o último mês deixa o índice de data_pedido limitar a
+    -- leitura quando são poucos meses; a junção em si é por hash
+    WHERE f.dia >= (SELECT min(m) FROM unnest(meses) AS m)
+      AND f.dia < (SELECT max(m) FROM unnest(meses) AS m) + interval '1 month'
+    GROUP BY 1, 2
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION sla_recalcular(meses DATE[], transportadoras TEXT[]) RETURNS void AS $$
+DECLARE
+    i INTEGER;
+BEGIN
+    -- Um lock por mês/transportadora, sempre na mesma ordem (os arrays vêm ordenados), até o
+    -- fim da transação: duas escritas no mesmo mês se revezam e a segunda recalcula já
+    -- vendo a primeira, em vez de gravar por cima um agregado sem ela
+    FOR i IN 1 .. COALESCE(cardinality(meses), 0) LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('sla'), hashtext(meses[i] || '|' || transportadoras[i]));
+    END LOOP;
+
+    DELETE FROM sla_diario s
+    USING unnest(meses, transportadoras) AS k (mes, transportadora)
+    WHERE date_trunc('month', s.dia)::date = k.mes AND s.transportadora = k.transportadora
+      AND s.dia >= meses[1] AND s.dia < meses[cardinality(meses)] + interval '1 month';
+    INSERT INTO sla_diario SELECT * FROM sla_agregar(meses, transportadoras, false);
+
+    DELETE FROM sla_mensal s
+    USING unnest(meses, transportadoras) AS k (mes, transportadora)
+    WHERE s.dia = k.mes AND s.transportadora = k.transportadora;
+    INSERT INTO sla_mensal SELECT * FROM sla_agregar(meses, transportadoras, true);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION reconstruir_sla() RETURNS void AS $$
+DECLARE
+    meses DATE[];
+    transportadoras TEXT[];
+BEGIN
+    SELECT array_agg(mes ORDER BY mes, transportadora), array_agg(transportadora ORDER BY mes, transportadora)
+    INTO meses, transportadoras
+    FROM (
+        SELECT DISTINCT date_trunc('month', dia)::date AS mes, transportadora FROM sla_pedidos_fonte
+        UNION
+        SELECT dia, transportadora FROM sla_mensal
+    ) x;
+    PERFORM sla_recalcular(meses, transportadoras);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Só as linhas em que muda alguma coluna usada pelos indicadores contam; para cada uma
+-- entram o mês/transportadora de antes e o de depois
+CREATE OR REPLACE FUNCTION sla_pedidos_trigger() RETURNS trigger AS $$
+DECLARE
+    dias DATE[];
+    nomes TEXT[];
+    meses DATE[];
+    transportadoras TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(data_pedido), array_agg(transportadora) INTO dias, nomes FROM linhas_novas;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(data_pedido), array_agg(transportadora) INTO dias, nomes FROM linhas_antigas;
+    ELSE
+        SELECT array_agg(v.data_pedido), array_agg(v.transportadora) INTO dias, nomes
+        FROM linhas_antigas o
+        JOIN linhas_novas n ON n.id = o.id
+        CROSS JOIN LATERAL (VALUES (o.data_pedido, o.transportadora), (n.data_pedido, n.transportadora))
+            AS v (data_pedido, transportadora)
+        WHERE (o.data_pedido, o.transportadora, o.data_expedicao, o.data_previsao, o.data_entrega, o.frete,
+               o.status_logistico_id)
+              IS DISTINCT FROM
+              (n.data_pedido, n.transportadora, n.data_expedicao, n.data_previsao, n.data_entrega, n.frete,
+               n.status_logistico_id);
+    END IF;
+
+    SELECT array_agg(mes ORDER BY mes, transportadora), array_agg(transportadora ORDER BY mes, transportadora)
+    INTO meses, transportadoras
+    FROM (
+        SELECT DISTINCT date_trunc('month', d)::date AS mes, COALESCE(t, '') AS transportadora
+        FROM unnest(dias, nomes) AS a (d, t)
+        WHERE d IS NOT NULL
+    ) x;
+    IF meses IS NOT NULL THEN
+        PERFORM sla_recalcular(meses, transportadoras);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sla_insert ON pedidos_teste;
+CREATE TRIGGER trg_sla_insert
+    AFTER INSERT ON pedidos_teste REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION sla_pedidos_trigger();
+
+DROP TRIGGER IF EXISTS trg_sla_update ON pedidos_teste;
+CREATE TRIGGER trg_sla_update
+    AFTER UPDATE ON pedidos_teste REFERENCING OLD TABLE AS linhas_antigas NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION sla_pedidos_trigger();
+
+DROP TRIGGER IF EXISTS trg_sla_delete ON pedidos_teste;
+CREATE TRIGGER trg_sla_delete
+    AFTER DELETE ON pedidos_teste REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION sla_pedidos_trigger();
+
+SELECT reconstruir_sla();
+ANALYZE sla_diario;
+ANALYZE sla_mensal;
@@ -0,0 +1,213 @@
+-- Particionamento por período (ver particionamento.py): pedidos_teste por data_pedido e
+-- log_pedidos por data_alteracao, uma partição por ano. Filtros de data nas consultas só
+-- leem as partições do período, e partições antigas podem ser arquivadas (desanexadas e
+-- movidas para o schema arquivo), saindo das listagens, indicadores e exportações.
+--
+-- Ano e não mês: sem filtro de data (a listagem padrão) o Postgres lê o início de cada
+-- partição para ordenar por data_pedido, e com a partição padrão não usa o Append ordenado.
+-- Com 5 anos em partições mensais a primeira página de 300 mil pedidos ia de 0,3ms para 8ms;
+-- com anuais, 1ms.
+--
+-- Linhas sem data, ou de períodos sem partição, vão para a partição padrão (<tabela>_padrao);
+-- manter_particoes() cria as partições que faltam, inclusive as dos próximos anos, e move
+-- para elas as linhas da padrão.
+--
+-- Uma tabela comum não vira particionada no lugar: a conversão copia os dados para a tabela
+-- nova e recria views, índices e triggers, com lock exclusivo nas duas tabelas até o fim da
+-- transação. Rodar fora do horário de uso.
+
+CREATE SCHEMA IF NOT EXISTS arquivo;
+
+CREATE TABLE IF NOT EXISTS particionamento (
+    tabela TEXT PRIMARY KEY,
+    coluna TEXT NOT NULL,
+    -- Tamanho de cada partição (unidade do date_trunc): 'month' ou 'year'
+    unidade TEXT NOT NULL CHECK (unidade IN ('month', 'year')),
+    -- Partições mantidas prontas à frente do período atual
+    futuras INTEGER NOT NULL DEFAULT 1
+);
+INSERT INTO particionamento (tabela, coluna, unidade, futuras) VALUES
+    ('pedidos_teste', 'data_pedido', 'year', 1),
+    ('log_pedidos', 'data_alteracao', 'year', 1)
+ON CONFLICT (tabela) DO NOTHING;
+
+-- Partições desanexadas por particionamento.py arquivar; a tabela fica em arquivo.<particao>
+CREATE TABLE IF NOT EXISTS particoes_arquivadas (
+    particao TEXT PRIMARY KEY,
+    tabela TEXT NOT NULL,
+    inicio DATE NOT NULL,
+    fim DATE NOT NULL,
+    linhas BIGINT NOT NULL,
+    arquivada_em TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- Partições anexadas e seus limites [inicio, fim); a padrão vem com inicio e fim nulos
+CREATE OR REPLACE VIEW particoes AS
+SELECT
+    pai.relname::text AS tabela,
+    filho.relname::text AS particao,
+    substring(pg_get_expr(filho.relpartbound, filho.oid) FROM $$FROM \('([^']+)'\)$$)::date AS inicio,
+    substring(pg_get_expr(filho.relpartbound, filho.oid) FROM $$TO \('([^']+)'\)$$)::date AS fim,
+    GREATEST(filho.reltuples, 0)::bigint AS linhas_estimadas
+FROM pg_inherits i
+JOIN pg_class pai ON pai.oid = i.inhparent
+JOIN pg_class filho ON filho.oid = i.inhrelid
+WHERE pai.relkind = 'p' AND pai.relname IN (SELECT tabela FROM particionamento);
+
+-- Cria a partição do período que contém dia, movendo para ela as linhas da partição padrão.
+-- A tabela nova é anexada com ATTACH, que não bloqueia as leituras da tabela particionada.
+CREATE OR REPLACE FUNCTION criar_particao(nome_tabela TEXT, dia DATE) RETURNS TEXT AS $$
+DECLARE
+    cfg particionamento;
+    inicio DATE;
+    fim DATE;
+    particao TEXT;
+BEGIN
+    SELECT * INTO STRICT cfg FROM particionamento WHERE tabela = nome_tabela;
+    inicio := date_trunc(cfg.unidade, dia)::date;
+    fim := (inicio + ('1 ' || cfg.unidade)::interval)::date;
+    particao := nome_tabela || '_p' || to_char(inicio, CASE cfg.unidade WHEN 'year' THEN 'YYYY' ELSE 'YYYY_MM' END);
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', particao, nome_tabela);
+    EXECUTE format('WITH m AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM m',
+                   nome_tabela || '_padrao', cfg.coluna, inicio, cfg.coluna, fim, particao);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   nome_tabela, particao, inicio, fim);
+    RETURN particao;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cria as partições dos períodos com linhas na padrão e dos próximos cfg.futuras períodos.
+-- Períodos arquivados ficam de fora: linhas gravadas depois neles permanecem na padrão.
+CREATE OR REPLACE FUNCTION manter_particoes(nome_tabela TEXT) RETURNS SETOF TEXT AS $$
+DECLARE
+    cfg particionamento;
+    passo INTERVAL;
+    dia DATE;
+BEGIN
+    SELECT * INTO STRICT cfg FROM particionamento WHERE tabela = nome_tabela;
+    passo := ('1 ' || cfg.unidade)::interval;
+    FOR dia IN EXECUTE format($f$
+        SELECT inicio FROM (
+            SELECT DISTINCT date_trunc(%L, %I)::date AS inicio FROM %I WHERE %I IS NOT NULL
+            UNION
+            SELECT generate_series(date_trunc(%L, CURRENT_DATE), date_trunc(%L, CURRENT_DATE) + %L::interval * %s, %L)::date
+        ) x
+        WHERE inicio NOT IN (SELECT inicio FROM particoes WHERE tabela = %L AND inicio IS NOT NULL)
+          AND NOT EXISTS (SELECT 1 FROM particoes_arquivadas a WHERE a.tabela = %L AND x.inicio >= a.inicio AND x.inicio < a.fim)
+        ORDER BY inicio
+    $f$, cfg.unidade, cfg.coluna, nome_tabela || '_padrao', cfg.coluna,
+         cfg.unidade, cfg.unidade, passo, cfg.futuras, passo, nome_tabela, nome_tabela)
+    LOOP
+        RETURN NEXT criar_particao(nome_tabela, dia);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Troca a tabela comum pela particionada com os mesmos dados, views, índices e triggers.
+-- O id deixa de ser PRIMARY KEY (a chave de uma tabela particionada precisa incluir a coluna
+-- de partição, e ela aceita nulos); vira UNIQUE (id, coluna), e continua vindo da sequência.
+CREATE FUNCTION pg_temp.particionar(nome_tabela TEXT) RETURNS void AS $$
+DECLARE
+    cfg particionamento;
+    legado TEXT := nome_tabela || '_legado';
+    views TEXT[][];
+    indices TEXT[];
+    triggers TEXT[];
+    sequencia TEXT;
+    comando TEXT;
+    i INTEGER;
+    menor DATE;
+    maior DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = nome_tabela::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+    SELECT * INTO STRICT cfg FROM particionamento WHERE tabela = nome_tabela;
+
+    -- Definições lidas antes do RENAME, ainda com o nome original da tabela
+    SELECT array_agg(ARRAY[v.oid::regclass::text, pg_get_viewdef(v.oid)])
+    INTO views
+    FROM (
+        SELECT DISTINCT r.ev_class AS oid
+        FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = nome_tabela::regclass
+          AND r.ev_class <> nome_tabela::regclass
+    ) v;
+    SELECT array_agg(pg_get_indexdef(indexrelid)) INTO indices
+    FROM pg_index WHERE indrelid = nome_tabela::regclass AND NOT indisprimary;
+    SELECT array_agg(pg_get_triggerdef(oid)) INTO triggers
+    FROM pg_trigger WHERE tgrelid = nome_tabela::regclass AND NOT tgisinternal;
+    sequencia := pg_get_serial_sequence(nome_tabela, 'id');
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', nome_tabela, legado);
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (%I)',
+                   nome_tabela, legado, cfg.coluna);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I UNIQUE (id, %I)', nome_tabela, nome_tabela || '_id_key', cfg.coluna);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', nome_tabela || '_padrao', nome_tabela);
+
+    -- Partições de todo o período existente antes da cópia, para o INSERT já distribuir as
+    -- linhas (em vez de movê-las depois, partição por partição, a partir da padrão)
+    EXECUTE format('SELECT min(%I)::date, max(%I)::date FROM %I', cfg.coluna, cfg.coluna, legado) INTO menor, maior;
+    IF menor IS NOT NULL THEN
+        PERFORM criar_particao(nome_tabela, d::date)
+        FROM generate_series(date_trunc(cfg.unidade, menor), maior, ('1 ' || cfg.unidade)::interval) d;
+    END IF;
+    PERFORM manter_particoes(nome_tabela);
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', nome_tabela, legado);
+
+    FOR i IN 1 .. COALESCE(array_length(views, 1), 0) LOOP
+        EXECUTE format('CREATE OR REPLACE VIEW %s AS %s', views[i][1], views[i][2]);
+    END LOOP;
+    IF sequencia IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', sequencia, nome_tabela);
+    END IF;
+    EXECUTE format('DROP TABLE %I', legado);
+    FOREACH comando IN ARRAY COALESCE(indices, '{}') LOOP
+        EXECUTE comando;
+    END LOOP;
+    FOREACH comando IN ARRAY COALESCE(triggers, '{}') LOOP
+        EXECUTE comando;
+    END LOOP;
+    EXECUTE format('ANALYZE %I', nome_tabela);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT pg_temp.particionar('pedidos_teste');
+SELECT pg_temp.particionar('log_pedidos');
+
+-- Indicadores de SLA (0008_sla_diario.sql): os meses arquivados ficam congelados nos
+-- agregados. Sem isto reconstruir_sla() os apagaria, e uma escrita num desses meses (que
+-- cai na partição padrão) os recalcularia só com as linhas ainda anexadas.
+CREATE OR REPLACE FUNCTION sla_recalcular(meses DATE[], transportadoras TEXT[]) RETURNS void AS $$
+DECLARE
+    i INTEGER;
+BEGIN
+    SELECT array_agg(k.mes ORDER BY k.mes, k.transportadora), array_agg(k.transportadora ORDER BY k.mes, k.transportadora)
+    INTO meses, transportadoras
+    FROM unnest(meses, transportadoras) AS k (mes, transportadora)
+    WHERE NOT EXISTS (SELECT 1 FROM particoes_arquivadas a
+                      WHERE a.tabela = 'pedidos_teste' AND k.mes >= a.inicio AND k.mes < a.fim);
+    IF meses IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Um lock por mês/transportadora, sempre na mesma ordem (os arrays vêm ordenados), até o
+    -- fim da transação: duas escritas no mesmo mês se revezam e a segunda recalcula já
+    -- vendo a primeira, em vez de gravar por cima um agregado sem ela
+    FOR i IN 1 .. cardinality(meses) LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('sla'), hashtext(meses[i] || '|' || transportadoras[i]));
+    END LOOP;
+
+    DELETE FROM sla_diario s
+    USING unnest(meses, transportadoras) AS k (mes, transportadora)
+    WHERE date_trunc('month', s.dia)::date = k.mes AND s.transportadora = k.transportadora
+      AND s.dia >= meses[1] AND s.dia < meses[cardinality(meses)] + interval '1 month';
+    INSERT INTO sla_diario SELECT * FROM sla_agregar(meses, transportadoras, false);
+
+    DELETE FROM sla_mensal s
+    USING unnest(meses, transportadoras) AS k (mes, transportadora)
+    WHERE s.dia = k.mes AND s.transportadora = k.transportadora;
+    INSERT INTO sla_mensal SELECT * FROM sla_agregar(meses, transportadoras, true);
+END;
+$$ LANGUAGE plpgsql;
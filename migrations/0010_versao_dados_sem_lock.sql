@@ -0,0 +1,47 @@
+-- Versão dos dados sem lock de linha. O UPDATE da linha única de versao_dados (0002) ficava
+-- com o lock da linha até o commit e serializava todas as escritas em pedidos_teste e
+-- notas_fiscais_teste: uma ingestão de transportadora (16s) travava cada edição avulsa.
+-- Agora cada comando só insere uma linha em versao_dados_incrementos, e a versão é
+-- versao_dados.versao mais as linhas de incrementos (view versao_dados_atual).
+--
+-- Não é uma sequência: nextval fica visível antes do commit, e uma listagem lida nesse
+-- intervalo iria para o cache com a versão nova e os dados antigos. A contagem só muda
+-- quando a escrita é efetivada, e cresce a cada commit, em qualquer ordem de commit.
+
+CREATE TABLE IF NOT EXISTS versao_dados_incrementos (
+    id BIGSERIAL PRIMARY KEY,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE VIEW versao_dados_atual AS
+SELECT v.versao + count(i.id) AS versao, GREATEST(v.atualizado_em, max(i.criado_em)) AS atualizado_em
+FROM versao_dados v
+LEFT JOIN versao_dados_incrementos i ON TRUE
+WHERE v.id = 1
+GROUP BY v.versao, v.atualizado_em;
+
+-- Usada pelos triggers e por particionamento.py (DETACH/ATTACH não disparam triggers).
+-- Os incrementos já efetivados são somados a versao_dados e apagados, na mesma transação,
+-- por quem pegar o advisory lock sem esperar: só uma escrita por vez toca a linha de
+-- versao_dados, e as outras seguem sem consolidar.
+CREATE OR REPLACE FUNCTION avancar_versao_dados() RETURNS void AS $$
+BEGIN
+    INSERT INTO versao_dados_incrementos DEFAULT VALUES;
+    IF pg_try_advisory_xact_lock(hashtext('versao_dados')) THEN
+        WITH consolidados AS (
+            DELETE FROM versao_dados_incrementos RETURNING criado_em
+        )
+        UPDATE versao_dados v
+        SET versao = v.versao + c.n, atualizado_em = GREATEST(v.atualizado_em, c.ultimo)
+        FROM (SELECT count(*) AS n, max(criado_em) AS ultimo FROM consolidados) c
+        WHERE v.id = 1;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION incrementar_versao_dados() RETURNS trigger AS $$
+BEGIN
+    PERFORM avancar_versao_dados();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,6 @@
+-- Índices parciais de atraso criados por 0006_indices_listagem.sql (nos bancos que já tinham
+-- o status 'Entregue'). Os indicadores (app.SQL_INDICADORES) leem todos os pedidos numa
+-- passada só e não os usam; só custavam nas escritas.
+
+DROP INDEX IF EXISTS idx_pedidos_atraso_entrega;
+DROP INDEX IF EXISTS idx_pedidos_atraso_expedicao;
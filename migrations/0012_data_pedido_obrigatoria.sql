@@ -0,0 +1,86 @@
+-- Coluna de partição obrigatória (0009_particionamento.sql). A chave única das tabelas
+-- particionadas é UNIQUE (id, coluna), e o Postgres não compara linhas com a coluna nula:
+-- pedidos sem data não passavam por checagem nenhuma. data_pedido (e data_alteracao, em
+-- log_pedidos) passa a NOT NULL, e as linhas sem data recebem a data sentinela 1900-01-01,
+-- que a aplicação exibe e exporta como vazia (db.SEM_DATA) e o SLA ignora.
+--
+-- Mesmo assim a chave só impede o mesmo id repetido na mesma data: a unicidade do id depende
+-- só da sequência.
+--
+-- A sentinela fica na partição padrão (manter_particoes não cria partição para ela): o nulo
+-- de um INSERT é roteado para a padrão antes do trigger preencher_sem_data trocá-lo, e o
+-- Postgres não deixa um trigger BEFORE mudar a partição de um INSERT.
+--
+-- SET NOT NULL lê todas as partições com lock exclusivo na tabela: rodar fora do horário de uso.
+
+-- SLA (0008_sla_diario.sql): pedidos sem data continuam fora dos indicadores. Vem antes do
+-- UPDATE abaixo, que já dispara o recálculo do SLA no mês da sentinela
+CREATE OR REPLACE VIEW sla_pedidos_fonte AS
+SELECT
+    x.dia, x.transportadora,
+    CASE WHEN x.data_expedicao >= x.dia THEN x.data_expedicao - x.dia END AS dias_expedicao,
+    CASE WHEN x.entregue AND x.data_entrega >= x.dia THEN x.data_entrega - x.dia END AS dias_entrega,
+    CASE WHEN x.entregue AND x.data_entrega >= x.data_expedicao THEN x.data_entrega - x.data_expedicao END AS dias_transito,
+    CASE WHEN x.entregue AND x.data_previsao IS NOT NULL THEN x.data_entrega <= x.data_previsao END AS no_prazo,
+    CASE WHEN btrim(x.frete) ~ '^[0-9]+([.,][0-9]+)?$' THEN replace(btrim(x.frete), ',', '.')::numeric END AS frete
+FROM (
+    SELECT
+        p.data_pedido AS dia,
+        COALESCE(p.transportadora, '') AS transportadora,
+        p.data_expedicao, p.data_previsao, p.data_entrega, p.frete,
+        s.descricao IS NOT DISTINCT FROM 'Entregue' AND p.data_entrega IS NOT NULL AS entregue
+    FROM pedidos_teste p
+    LEFT JOIN status_logistico_teste s ON s.id = p.status_logistico_id
+    WHERE p.data_pedido > '1900-01-01'
+) x;
+
+-- TG_ARGV: coluna, sentinela
+CREATE OR REPLACE FUNCTION preencher_sem_data() RETURNS trigger AS $$
+BEGIN
+    IF to_jsonb(NEW) ->> TG_ARGV[0] IS NULL THEN
+        NEW := jsonb_populate_record(NEW, jsonb_build_object(TG_ARGV[0], TG_ARGV[1]));
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    cfg particionamento;
+BEGIN
+    FOR cfg IN SELECT * FROM particionamento ORDER BY tabela LOOP
+        EXECUTE format('UPDATE %I SET %I = %L WHERE %I IS NULL', cfg.tabela, cfg.coluna, '1900-01-01', cfg.coluna);
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL', cfg.tabela, cfg.coluna);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || cfg.tabela || '_sem_data', cfg.tabela);
+        EXECUTE format('CREATE TRIGGER %I BEFORE INSERT OR UPDATE OF %I ON %I FOR EACH ROW '
+                       'EXECUTE FUNCTION preencher_sem_data(%L, %L)',
+                       'trg_' || cfg.tabela || '_sem_data', cfg.coluna, cfg.tabela, cfg.coluna, '1900-01-01');
+    END LOOP;
+END;
+$$;
+
+-- Como em 0009, sem as partições da sentinela
+CREATE OR REPLACE FUNCTION manter_particoes(nome_tabela TEXT) RETURNS SETOF TEXT AS $$
+DECLARE
+    cfg particionamento;
+    passo INTERVAL;
+    dia DATE;
+BEGIN
+    SELECT * INTO STRICT cfg FROM particionamento WHERE tabela = nome_tabela;
+    passo := ('1 ' || cfg.unidade)::interval;
+    FOR dia IN EXECUTE format($f$
+        SELECT inicio FROM (
+            SELECT DISTINCT date_trunc(%L, %I)::date AS inicio FROM %I WHERE %I <> '1900-01-01'
+            UNION
+            SELECT generate_series(date_trunc(%L, CURRENT_DATE), date_trunc(%L, CURRENT_DATE) + %L::interval * %s, %L)::date
+        ) x
+        WHERE inicio NOT IN (SELECT inicio FROM particoes WHERE tabela = %L AND inicio IS NOT NULL)
+          AND NOT EXISTS (SELECT 1 FROM particoes_arquivadas a WHERE a.tabela = %L AND x.inicio >= a.inicio AND x.inicio < a.fim)
+        ORDER BY inicio
+    $f$, cfg.unidade, cfg.coluna, nome_tabela || '_padrao', cfg.coluna,
+         cfg.unidade, cfg.unidade, passo, cfg.futuras, passo, nome_tabela, nome_tabela)
+    LOOP
+        RETURN NEXT criar_particao(nome_tabela, dia);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
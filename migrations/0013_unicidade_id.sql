@@ -0,0 +1,68 @@
+-- Unicidade do id nas tabelas particionadas (0009_particionamento.sql). A chave de uma tabela
+-- particionada precisa incluir a coluna de partição, então UNIQUE (id, coluna) só impedia o
+-- mesmo id repetido na mesma data; as edições (UPDATE ... WHERE id = %s), pedidos_resumo e o
+-- histórico contam com o id único. Cada tabela ganha <tabela>_ids, comum e com o id como
+-- PRIMARY KEY, mantida por triggers de comando: um id repetido falha no INSERT, como falhava
+-- com a PRIMARY KEY original. Mudar o id de uma linha não é permitido.
+--
+-- Ids das partições arquivadas (particionamento.py arquivar) continuam reservados em
+-- <tabela>_ids, para que restaurar não traga repetições.
+--
+-- Ordenação: desde 0012_data_pedido_obrigatoria.sql os pedidos sem data têm a data sentinela
+-- 1900-01-01 e, na listagem (data_pedido DESC), vêm depois dos pedidos com data, não antes.
+
+CREATE OR REPLACE FUNCTION manter_ids() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        EXECUTE format('INSERT INTO %I SELECT id FROM linhas_novas', TG_ARGV[0]);
+    ELSIF TG_OP = 'DELETE' THEN
+        EXECUTE format('DELETE FROM %I i USING linhas_antigas a WHERE i.id = a.id', TG_ARGV[0]);
+    ELSE
+        EXECUTE format('TRUNCATE %I', TG_ARGV[0]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION impedir_troca_id() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'o id de % não pode ser alterado (% -> %)', TG_TABLE_NAME, OLD.id, NEW.id
+        USING ERRCODE = 'check_violation';
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    cfg particionamento;
+    ids TEXT;
+    arquivada TEXT;
+BEGIN
+    FOR cfg IN SELECT * FROM particionamento ORDER BY tabela LOOP
+        ids := cfg.tabela || '_ids';
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I (id INTEGER PRIMARY KEY)', ids);
+        EXECUTE format('TRUNCATE %I', ids);
+        -- Falha aqui se já houver ids repetidos: precisam ser corrigidos antes
+        EXECUTE format('INSERT INTO %I SELECT id FROM %I', ids, cfg.tabela);
+        FOR arquivada IN SELECT particao FROM particoes_arquivadas WHERE tabela = cfg.tabela LOOP
+            EXECUTE format('INSERT INTO %I SELECT id FROM arquivo.%I', ids, arquivada);
+        END LOOP;
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || cfg.tabela || '_ids_insert', cfg.tabela);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS linhas_novas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION manter_ids(%L)',
+                       'trg_' || cfg.tabela || '_ids_insert', cfg.tabela, ids);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || cfg.tabela || '_ids_delete', cfg.tabela);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS linhas_antigas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION manter_ids(%L)',
+                       'trg_' || cfg.tabela || '_ids_delete', cfg.tabela, ids);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || cfg.tabela || '_ids_truncate', cfg.tabela);
+        EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I FOR EACH STATEMENT EXECUTE FUNCTION manter_ids(%L)',
+                       'trg_' || cfg.tabela || '_ids_truncate', cfg.tabela, ids);
+        -- Mudanças de partição (UPDATE da data) não passam pelos triggers acima: o id é o mesmo
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || cfg.tabela || '_id_fixo', cfg.tabela);
+        EXECUTE format('CREATE TRIGGER %I BEFORE UPDATE OF id ON %I FOR EACH ROW '
+                       'WHEN (OLD.id IS DISTINCT FROM NEW.id) EXECUTE FUNCTION impedir_troca_id()',
+                       'trg_' || cfg.tabela || '_id_fixo', cfg.tabela);
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,66 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from db import get_pedidos_com_total
+
+# Links numerados (LIMIT/OFFSET) só são oferecidos nas primeiras páginas;
+# daí em diante a navegação usa apenas os cursores anterior/próximo.
+PAGINAS_NUMERADAS = 5
+
+
+def codificar_cursor(direcao, pedido):
+    data = pedido.get('data_pedido')
+    if isinstance(data, (date, datetime)):
+        data = data.isoformat()
+    bruto = json.dumps([direcao, data, pedido['id']], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    if not token:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direcao, data, pedido_id = json.loads(bruto)
+        if data is not None:
+            datetime.fromisoformat(data)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direcao not in ('prox', 'ant') or not isinstance(pedido_id, int):
+        return None
+    return direcao, data, pedido_id
+
+
+def _filtros_vazios(filtros):
+    return not any(v for k, v in filtros.items() if k not in ('situacoes', 'f_status')) \
+        and filtros.get('f_status') in (None, '', 'Todos')
+
+
+def paginar_pedidos(page, token, per_page, **filtros):
+    cursor = decodificar_cursor(token)
+    # Listagem sem filtros do usuário: total estimado pelo planejador em tabelas grandes
+    contagem_estimada = _filtros_vazios(filtros)
+    if cursor:
+        pedidos, total = get_pedidos_com_total(limit=per_page + 1, cursor=cursor,
+                                               contagem_estimada=contagem_estimada, **filtros)
+    else:
+        pedidos, total = get_pedidos_com_total(limit=per_page + 1, offset=(page - 1) * per_page,
+                                               contagem_estimada=contagem_estimada, **filtros)
+
+    # Busca uma linha a mais para saber se existe página seguinte (ou anterior, no sentido inverso)
+    sobrou = len(pedidos) > per_page
+    if cursor and cursor[0] == 'ant':
+        if sobrou:
+            pedidos = pedidos[1:]
+        tem_anterior, tem_proxima = sobrou, True
+    else:
+        pedidos = pedidos[:per_page]
+        tem_anterior, tem_proxima = (True if cursor else page > 1), sobrou
+
+    navegacao = {
+        'anterior': codificar_cursor('ant', pedidos[0]) if pedidos and tem_anterior else None,
+        'proxima': codificar_cursor('prox', pedidos[-1]) if pedidos and tem_proxima else None,
+        'paginas_numeradas': PAGINAS_NUMERADAS,
+    }
+    return pedidos, total, navegacao
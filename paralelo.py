@@ -0,0 +1,53 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Com CONSULTAS_PARALELAS=1, consultas independentes de uma mesma requisição (ex.: página e
+# total da listagem, indicadores e versão dos dados) rodam ao mesmo tempo, cada uma com sua
+# conexão do pool, e a requisição espera só pela mais lenta. Em workers gevent as threads são
+# greenlets e o psycogreen (ver db.py) deixa as consultas correrem juntas do mesmo jeito.
+#
+# Desligado por padrão: só ganha com o banco em outra máquina ou com CPUs sobrando, e cada
+# requisição passa a ocupar 2 conexões ao mesmo tempo. Ao ligar, DB_POOL_MAX deve cobrir
+# 2 x requisições simultâneas do processo (threads ou greenlets) mais
+# EXPORTACAO_CONEXOES_PROCESSO (exportacao.py); com o padrão de 5, uma requisição por vez.
+CONSULTAS_PARALELAS = os.environ.get('CONSULTAS_PARALELAS', '0') == '1'
+CONSULTAS_PARALELAS_THREADS = int(os.environ.get('CONSULTAS_PARALELAS_THREADS', 8))
+
+_executor = None
+_executor_pid = None
+# Marcado nas tarefas do executor: chamadas aninhadas rodam em sequência, para que uma
+# tarefa nunca fique esperando por outra na fila do mesmo executor
+_no_executor = contextvars.ContextVar('no_executor', default=False)
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=CONSULTAS_PARALELAS_THREADS, thread_name_prefix='consultas')
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _tarefa(funcao):
+    _no_executor.set(True)
+    return funcao()
+
+
+def em_paralelo(*funcoes):
+    # Executa as funções (sem argumentos) e devolve os resultados na mesma ordem. A primeira
+    # roda na própria thread da requisição; as demais no executor, com uma cópia do contexto
+    # (g do Flask, usado pela instrumentação). Uma exceção em qualquer delas é repassada.
+    if not CONSULTAS_PARALELAS or len(funcoes) < 2 or _no_executor.get():
+        return [f() for f in funcoes]
+    executor = _get_executor()
+    futuros = [executor.submit(contextvars.copy_context().run, _tarefa, f) for f in funcoes[1:]]
+    try:
+        primeiro = funcoes[0]()
+    finally:
+        # Mesmo com erro na primeira, espera as demais para não deixar conexões em uso
+        wait(futuros)
+    return [primeiro] + [f.result() for f in futuros]
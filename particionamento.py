@@ -0,0 +1,192 @@
+import argparse
+import os
+import sys
+from datetime import date
+from db import get_db_connection
+
+# Partições de pedidos_teste (por data_pedido) e log_pedidos (por data_alteracao), criadas
+# em migrations/0009_particionamento.sql.
+#
+#   python particionamento.py manter      cria as partições que faltam (agendar, ex. cron diário)
+#   python particionamento.py listar
+#   python particionamento.py arquivar --antes 2024-01-01 [--tabela log_pedidos] [--forcar] [--simular]
+#   python particionamento.py restaurar pedidos_teste_p2022
+#
+# manter cria as partições dos próximos períodos antes que sejam necessárias; até lá, linhas
+# de períodos sem partição ficam na partição padrão e são movidas quando a partição é criada.
+# As linhas sem data ficam sempre na padrão, com a data sentinela 1900-01-01 (db.SEM_DATA,
+# migrations/0012_data_pedido_obrigatoria.sql).
+#
+# arquivar desanexa as partições que terminam até --antes e as move para o schema arquivo:
+# saem das listagens, dos indicadores e das exportações sem que nada seja apagado (para
+# guardar fora do banco: pg_dump -n arquivo). Partições com pedidos ainda não entregues só
+# são arquivadas com --forcar. Os indicadores de SLA dos meses arquivados ficam como estavam.
+# Os ids das linhas arquivadas continuam em <tabela>_ids (migrations/0013_unicidade_id.sql),
+# para que restaurar não traga ids repetidos.
+TABELAS = ('pedidos_teste', 'log_pedidos')
+# Espera máxima pelos locks de DETACH/ATTACH, que bloqueiam as leituras enquanto esperam
+PARTICOES_LOCK_TIMEOUT = os.environ.get('PARTICOES_LOCK_TIMEOUT', '5s')
+
+
+def manter(conn):
+    # [(tabela, partição criada)]
+    cur = conn.cursor()
+    cur.execute("SET LOCAL lock_timeout = %s", (PARTICOES_LOCK_TIMEOUT,))
+    cur.execute("SELECT tabela, manter_particoes(tabela) FROM particionamento ORDER BY tabela")
+    criadas = cur.fetchall()
+    cur.close()
+    conn.commit()
+    return criadas
+
+
+def listar(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT tabela, particao, inicio, fim, linhas_estimadas, NULL FROM particoes
+        UNION ALL
+        SELECT tabela, particao, inicio, fim, linhas, arquivada_em FROM particoes_arquivadas
+        ORDER BY 1, 3 NULLS LAST
+    """)
+    particoes = cur.fetchall()
+    cur.close()
+    conn.rollback()
+    return particoes
+
+
+def _pedidos_alterados(cur):
+    # DETACH/ATTACH não disparam os triggers de pedidos_teste: a versão dos dados (caches e
+    # ETags) e as telas abertas (eventos.py, ids nulos = recarregar tudo) são avisadas aqui
+    cur.execute("SELECT avancar_versao_dados()")
+    cur.execute("SELECT pg_notify('pedidos_alterados', '{\"ids\": null}')")
+
+
+def arquivar(conn, tabela, antes, forcar=False, simular=False):
+    # Uma transação por partição. Devolve [(partição, linhas, motivo se foi mantida)].
+    cur = conn.cursor()
+    cur.execute("SELECT particao, inicio, fim FROM particoes WHERE tabela = %s AND fim <= %s ORDER BY inicio",
+                (tabela, antes))
+    candidatas = cur.fetchall()
+    conn.rollback()
+
+    resultado = []
+    for particao, inicio, fim in candidatas:
+        cur.execute("SET LOCAL lock_timeout = %s", (PARTICOES_LOCK_TIMEOUT,))
+        # SHARE: as escritas nesta partição esperam, as leituras não, até o DETACH
+        cur.execute(f"LOCK TABLE {particao} IN SHARE MODE")
+        cur.execute(f"SELECT count(*) FROM {particao}")
+        linhas = cur.fetchone()[0]
+        if tabela == 'pedidos_teste' and not forcar:
+            cur.execute(f"""
+                SELECT count(*) FROM {particao}
+                WHERE status_logistico_id IS DISTINCT FROM
+                      (SELECT min(id) FROM status_logistico_teste WHERE descricao = 'Entregue')
+            """)
+            abertos = cur.fetchone()[0]
+            if abertos:
+                conn.rollback()
+                resultado.append((particao, linhas, f'{abertos} pedido(s) não entregue(s)'))
+                continue
+
+        cur.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao}")
+        cur.execute(f"ALTER TABLE {particao} SET SCHEMA arquivo")
+        cur.execute("INSERT INTO particoes_arquivadas (particao, tabela, inicio, fim, linhas) VALUES (%s, %s, %s, %s, %s)",
+                    (particao, tabela, inicio, fim, linhas))
+        if tabela == 'pedidos_teste':
+            # pedidos_resumo (0005) é mantido por trigger, que o DETACH não dispara
+            cur.execute(f"DELETE FROM pedidos_resumo r USING arquivo.{particao} a WHERE r.id = a.id")
+            _pedidos_alterados(cur)
+        if simular:
+            conn.rollback()
+        else:
+            conn.commit()
+        resultado.append((particao, linhas, None))
+    cur.close()
+    return resultado
+
+
+def restaurar(conn, particao):
+    # Anexa de novo uma partição arquivada; devolve o número de linhas ou None se não existe
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT a.tabela, a.inicio, a.fim, c.coluna
+        FROM particoes_arquivadas a JOIN particionamento c ON c.tabela = a.tabela
+        WHERE a.particao = %s
+    """, (particao,))
+    linha = cur.fetchone()
+    if linha is None:
+        conn.rollback()
+        return None
+    tabela, inicio, fim, coluna = linha
+
+    cur.execute("SET LOCAL lock_timeout = %s", (PARTICOES_LOCK_TIMEOUT,))
+    # Linhas gravadas no período depois do arquivamento estão na partição padrão
+    cur.execute(f"""
+        WITH m AS (DELETE FROM {tabela}_padrao WHERE {coluna} >= %s AND {coluna} < %s RETURNING *)
+        INSERT INTO arquivo.{particao} SELECT * FROM m
+    """, (inicio, fim))
+    cur.execute(f"ALTER TABLE arquivo.{particao} SET SCHEMA public")
+    cur.execute(f"ALTER TABLE {tabela} ATTACH PARTITION {particao} FOR VALUES FROM (%s) TO (%s)", (inicio, fim))
+    cur.execute("DELETE FROM particoes_arquivadas WHERE particao = %s", (particao,))
+    cur.execute(f"SELECT count(*) FROM {particao}")
+    linhas = cur.fetchone()[0]
+    if tabela == 'pedidos_teste':
+        cur.execute(f"SELECT atualizar_pedidos_resumo(array_agg(id)) FROM {particao}")
+        cur.execute(f"""
+            SELECT sla_recalcular(array_agg(mes ORDER BY mes, transportadora),
+                                  array_agg(transportadora ORDER BY mes, transportadora))
+            FROM (SELECT DISTINCT date_trunc('month', data_pedido)::date AS mes,
+                                  COALESCE(transportadora, '') AS transportadora
+                  FROM {particao}) k
+        """)
+        _pedidos_alterados(cur)
+    conn.commit()
+    cur.close()
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partições de pedidos_teste e log_pedidos')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('manter', help='cria as partições que faltam e as dos próximos períodos')
+    comandos.add_parser('listar', help='lista as partições anexadas e as arquivadas')
+    p_arquivar = comandos.add_parser('arquivar', help='desanexa as partições antigas para o schema arquivo')
+    p_arquivar.add_argument('--antes', required=True, type=date.fromisoformat,
+                            help='arquiva as partições que terminam até esta data (AAAA-MM-DD)')
+    p_arquivar.add_argument('--tabela', choices=TABELAS, default='pedidos_teste')
+    p_arquivar.add_argument('--forcar', action='store_true', help='arquiva mesmo com pedidos não entregues')
+    p_arquivar.add_argument('--simular', action='store_true', help='mostra o que seria arquivado e desfaz')
+    p_restaurar = comandos.add_parser('restaurar', help='anexa de novo uma partição arquivada')
+    p_restaurar.add_argument('particao')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.comando == 'manter':
+            criadas = manter(conn)
+            for tabela, particao in criadas:
+                print(f"criada {particao}")
+            print(f"{len(criadas)} partição(ões) criada(s)" if criadas else "nenhuma partição a criar")
+        elif args.comando == 'listar':
+            for tabela, particao, inicio, fim, linhas, arquivada_em in listar(conn):
+                periodo = f"{inicio} a {fim}" if inicio else "padrão"
+                situacao = f"arquivada em {arquivada_em:%Y-%m-%d %H:%M}" if arquivada_em else "anexada"
+                print(f"{tabela:15} {particao:28} {periodo:26} {linhas:>10} linha(s)  {situacao}")
+        elif args.comando == 'arquivar':
+            resultado = arquivar(conn, args.tabela, args.antes, args.forcar, args.simular)
+            for particao, linhas, motivo in resultado:
+                print(f"{particao}: mantida, {motivo}" if motivo else f"{particao}: {linhas} linha(s) arquivada(s)")
+            if not resultado:
+                print("nenhuma partição termina até " + args.antes.isoformat())
+            if args.simular:
+                print("[simulação, nada foi alterado]")
+        else:
+            linhas = restaurar(conn, args.particao)
+            if linhas is None:
+                sys.exit(f"partição arquivada não encontrada: {args.particao}")
+            print(f"{args.particao}: {linhas} linha(s) restaurada(s)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+from cache import CacheTTL
+from db import conexao
+
+# Tabelas pequenas de referência (status logístico e situação comercial), carregadas
+# uma vez por processo e recarregadas após REFERENCIAS_TTL segundos ou invalidar_referencias()
+REFERENCIAS_TTL = int(os.environ.get('REFERENCIAS_TTL', 300))
+_cache = CacheTTL(REFERENCIAS_TTL)
+
+
+def _carregar():
+    with conexao() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, descricao, cor FROM status_logistico_teste ORDER BY id")
+        status = {r[0]: {'descricao': r[1], 'cor': r[2]} for r in cur.fetchall()}
+        cur.execute("SELECT id, situacao FROM situacoes ORDER BY id")
+        situacoes = {r[0]: r[1] for r in cur.fetchall()}
+        cur.close()
+    return {'status': status, 'situacoes': situacoes}
+
+
+def _referencias():
+    return _cache.obter('referencias', _carregar)
+
+
+def invalidar_referencias():
+    _cache.invalidar()
+
+
+def status_logisticos():
+    return _referencias()['status']
+
+
+def situacoes_comerciais():
+    return _referencias()['situacoes']
+
+
+def choices_status():
+    return [(id_, s['descricao']) for id_, s in status_logisticos().items()]
+
+
+def ids_status(descricao):
+    return [id_ for id_, s in status_logisticos().items() if s['descricao'] == descricao]
+
+
+def ids_situacoes(nomes):
+    return [id_ for id_, situacao in situacoes_comerciais().items() if situacao in nomes]
+
+
+def decorar_pedidos(pedidos):
+    # Troca os ids de status/situação pelos textos que as telas e a exportação usam
+    status = status_logisticos()
+    situacoes = situacoes_comerciais()
+    for p in pedidos:
+        s = status.get(p.get('status_logistico_id')) or {}
+        p['status_descricao'] = s.get('descricao')
+        p['status_cor'] = s.get('cor')
+        p['situacao_comercial'] = situacoes.get(p.get('id_situacao'))
+    return pedidos
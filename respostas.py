@@ -0,0 +1,60 @@
+import hashlib
+import os
+import time
+from datetime import date
+from flask import current_app, request, session
+from cache import CacheLRU
+
+# Fragmentos renderizados das listagens (cards / tabela), reaproveitados enquanto a
+# versão dos dados não muda. Limitado em itens e bytes, com descarte LRU.
+RESPOSTA_CACHE_ITENS = int(os.environ.get('RESPOSTA_CACHE_ITENS', 512))
+RESPOSTA_CACHE_BYTES = int(os.environ.get('RESPOSTA_CACHE_BYTES', 32 * 1024 * 1024))
+
+cache_fragmentos = CacheLRU(RESPOSTA_CACHE_ITENS, RESPOSTA_CACHE_BYTES)
+
+_PARAMETROS_LISTAGEM = ('f_pedido', 'f_cliente', 'f_nota', 'f_status', 'f_data_ini', 'f_data_fim', 'page', 'cursor')
+
+
+def chave_listagem():
+    # Rota + filtros normalizados + página + perfil; o dia entra porque os atrasos dependem da data
+    filtros = []
+    for nome in _PARAMETROS_LISTAGEM:
+        valor = (request.values.get(nome) or '').strip()
+        if not valor or (nome == 'f_status' and valor == 'Todos') or (nome == 'page' and valor == '1'):
+            continue
+        filtros.append((nome, valor))
+    return (request.endpoint, tuple(filtros), session.get('perfil'), date.today().isoformat())
+
+
+def fragmento(chave, versao, renderizar):
+    html = cache_fragmentos.obter((chave, versao))
+    if html is None:
+        html = renderizar()
+        cache_fragmentos.guardar((chave, versao), html, len(html))
+    return html
+
+
+def _validade_csrf():
+    # Uma resposta 304 reaproveita o HTML com os tokens CSRF dos formulários: o ETag muda com o
+    # token da sessão (novo a cada login) e a cada metade do prazo do token, então a página
+    # reaproveitada sempre tem um token com pelo menos metade do prazo pela frente
+    limite = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    periodo = int(time.time() // (limite / 2)) if limite else None
+    return session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')), periodo
+
+
+def etag_listagem(chave, versao, *extras):
+    bruto = repr((chave, versao, session.get('usuario'), _validade_csrf()) + extras).encode()
+    return hashlib.sha1(bruto).hexdigest()
+
+
+def nao_modificado(etag):
+    # Com mensagem flash pendente a página precisa ser renderizada para exibi-la
+    return '_flashes' not in session and request.if_none_match.contains_weak(etag)
+
+
+def marcar_cache(resposta, etag, modificado):
+    resposta.set_etag(etag, weak=True)
+    resposta.last_modified = modificado
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
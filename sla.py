@@ -0,0 +1,130 @@
+import os
+from datetime import date, timedelta
+from db import conexao, com_failover
+
+# Indicadores de prazo logístico por transportadora (tempo até a expedição, até a entrega e
+# em trânsito, entregas no prazo e frete médio), lidos dos agregados sla_diario / sla_mensal
+# (migrations/0008_sla_diario.sql) e nunca dos pedidos: os meses inteiros do período vêm de
+# sla_mensal e só as pontas de sla_diario, então anos de histórico são poucas centenas de
+# linhas. Somas e percentis saem dos histogramas, com numpy, para todas as transportadoras
+# de uma vez.
+SLA_PERIODO_PADRAO = int(os.environ.get('SLA_PERIODO_PADRAO', 365))
+SLA_PERCENTIS = (50, 90, 95)
+# Última posição dos histogramas: 60 dias ou mais
+SLA_DIAS_MAX = 60
+METRICAS = ('expedicao', 'entrega', 'transito')
+# Contagens de cada métrica, na ordem de METRICAS
+_CONTAGENS = ('expedidos', 'entregues', 'transitos')
+_COLUNAS = ['pedidos', 'expedidos', 'soma_expedicao', 'entregues', 'soma_entrega', 'transitos', 'soma_transito',
+            'com_previsao', 'no_prazo', 'fretes', 'soma_frete']
+# Histogramas como texto ('3,0,1,...'): o numpy converte todos de uma vez, bem mais rápido
+# que o psycopg2 montar uma lista Python por array
+_SELECT = (f"SELECT transportadora, {', '.join(_COLUNAS)}, "
+           f"{', '.join(f'array_to_string(hist_{m}, {chr(39)},{chr(39)})' for m in METRICAS)}")
+SQL_SLA = f"""
+    {_SELECT} FROM sla_mensal
+    WHERE dia >= %(inicio)s AND dia < %(fim)s
+    UNION ALL
+    {_SELECT} FROM sla_diario
+    WHERE dia BETWEEN %(data_ini)s AND %(data_fim)s AND (dia < %(inicio)s OR dia >= %(fim)s)
+"""
+
+
+def periodo_sla(data_ini='', data_fim=''):
+    # Datas dos filtros (AAAA-MM-DD); sem data final, hoje; sem inicial, SLA_PERIODO_PADRAO dias antes
+    try:
+        fim = date.fromisoformat(data_fim) if data_fim else date.today()
+    except ValueError:
+        fim = date.today()
+    try:
+        ini = date.fromisoformat(data_ini) if data_ini else fim - timedelta(days=SLA_PERIODO_PADRAO)
+    except ValueError:
+        ini = fim - timedelta(days=SLA_PERIODO_PADRAO)
+    return min(ini, fim), max(ini, fim)
+
+
+def _meses_inteiros(data_ini, data_fim):
+    # [inicio, fim) dos meses que cabem inteiros no período; vazio (inicio == fim) se nenhum
+    inicio = data_ini if data_ini.day == 1 else (data_ini.replace(day=1) + timedelta(days=32)).replace(day=1)
+    fim = (data_fim + timedelta(days=1)).replace(day=1)
+    return (inicio, fim) if inicio < fim else (data_ini, data_ini)
+
+
+@com_failover
+def _ler_agregados(data_ini, data_fim):
+    inicio, fim = _meses_inteiros(data_ini, data_fim)
+    with conexao(leitura=True) as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_SLA, {'inicio': inicio, 'fim': fim, 'data_ini': data_ini, 'data_fim': data_fim})
+        linhas = cur.fetchall()
+        cur.close()
+    return linhas
+
+
+def _percentis(histogramas, percentis):
+    # histogramas: (grupos, SLA_DIAS_MAX + 1). Para cada grupo e percentil, o menor número de
+    # dias que cobre a fração pedida dos pedidos (nearest-rank); NaN para grupo vazio
+    import numpy as np
+    acumulado = histogramas.cumsum(axis=1)
+    total = acumulado[:, -1]
+    alvo = np.maximum(np.ceil(total[:, None] * np.asarray(percentis) / 100), 1)
+    dias = (acumulado[:, None, :] < alvo[:, :, None]).sum(axis=2).astype(float)
+    dias[total == 0] = np.nan
+    return dias
+
+
+def _numero(valor, casas=1):
+    if valor != valor:
+        return None
+    return int(valor) if casas == 0 else round(float(valor), casas)
+
+
+def indicadores_sla(data_ini, data_fim):
+    # Uma linha por transportadora (mais volume primeiro) e o total do período
+    import numpy as np
+    linhas = _ler_agregados(data_ini, data_fim)
+    nomes = sorted({l[0] for l in linhas})
+    posicao = {nome: i for i, nome in enumerate(nomes)}
+    grupos = np.array([posicao[l[0]] for l in linhas], dtype=np.intp)
+    n = len(_COLUNAS)
+
+    # Soma por transportadora; a última linha é o total
+    escalares = np.zeros((len(nomes) + 1, n))
+    np.add.at(escalares, grupos, np.array([l[1:n + 1] for l in linhas], dtype=float).reshape(-1, n))
+    escalares[-1] = escalares[:-1].sum(axis=0)
+    histogramas = {}
+    for i, metrica in enumerate(METRICAS):
+        soma = np.zeros((len(nomes) + 1, SLA_DIAS_MAX + 1), dtype=np.int64)
+        texto = ','.join(l[n + 1 + i] for l in linhas)
+        valores = np.fromstring(texto, dtype=np.int64, sep=',') if texto else np.zeros(0, dtype=np.int64)
+        np.add.at(soma, grupos, valores.reshape(-1, SLA_DIAS_MAX + 1))
+        soma[-1] = soma[:-1].sum(axis=0)
+        histogramas[metrica] = soma
+
+    valores = dict(zip(_COLUNAS, escalares.T))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        medias = {m: valores['soma_' + m] / valores[c] for m, c in zip(METRICAS, _CONTAGENS)}
+        no_prazo = valores['no_prazo'] / valores['com_previsao'] * 100
+        frete_medio = valores['soma_frete'] / valores['fretes']
+    percentis = {m: _percentis(histogramas[m], SLA_PERCENTIS) for m in METRICAS}
+
+    resultado = []
+    for i, nome in enumerate(nomes + [None]):
+        item = {
+            'transportadora': nome if nome is None else (nome or '(sem transportadora)'),
+            'pedidos': int(valores['pedidos'][i]),
+            'expedidos': int(valores['expedidos'][i]),
+            'entregues': int(valores['entregues'][i]),
+            'com_previsao': int(valores['com_previsao'][i]),
+            'no_prazo_pct': _numero(no_prazo[i]),
+            'frete_medio': _numero(frete_medio[i], 2),
+        }
+        for metrica in METRICAS:
+            item[metrica] = {'media': _numero(medias[metrica][i]),
+                             **{f'p{p}': _numero(percentis[metrica][i][j], 0) for j, p in enumerate(SLA_PERCENTIS)}}
+        resultado.append(item)
+    total = resultado.pop()
+    total['transportadora'] = 'Total'
+    resultado.sort(key=lambda item: -item['pedidos'])
+    return {'data_ini': data_ini.isoformat(), 'data_fim': data_fim.isoformat(), 'dias_max': SLA_DIAS_MAX,
+            'percentis': list(SLA_PERCENTIS), 'transportadoras': resultado, 'total': total}
@@ -0,0 +1,60 @@
+from datetime import date
+
+# pandas é importado dentro das funções: só carrega no primeiro uso (ver gunicorn.conf.py)
+
+SITUACOES_AGUARDANDO_ENVIO = ['atendido', '02 faturado mmvb']
+COLUNAS_DERIVADAS = ['status_descricao', 'entrega_atrasada', 'expedicao_atrasada']
+
+
+def _para_data(coluna):
+    import pandas as pd
+    # Datas vindas do banco (date) ou texto ('', 'None', 'null', '2024-01-31'...); inválidas viram NaT
+    return pd.to_datetime(coluna, errors='coerce', format='mixed').dt.normalize()
+
+
+def derivar_status(df, hoje=None):
+    # Regras de atraso aplicadas sobre colunas inteiras: entrega atrasada, expedição
+    # atrasada e troca do status logístico para 'Aguardando Envio' / 'Atrasado'.
+    import pandas as pd
+    if df.empty:
+        for coluna in COLUNAS_DERIVADAS:
+            if coluna not in df.columns:
+                df[coluna] = pd.Series(dtype=object)
+        return df
+
+    hoje = pd.Timestamp(hoje or date.today())
+    status = df['status_descricao'].astype(object)
+
+    entrega = _para_data(df['data_entrega'])
+    entrega_atrasada = (status != 'Entregue') & entrega.notna() & (entrega < hoje)
+    demais = ~entrega_atrasada
+
+    situacao = df['situacao_comercial'].fillna('').astype(str).str.strip().str.lower()
+    sem_status = status.isna() | (status == '') | (status == 'Aguardando Envio')
+    status = status.where(~(demais & situacao.isin(SITUACOES_AGUARDANDO_ENVIO) & sem_status), 'Aguardando Envio')
+
+    aguardando = demais & (status == 'Aguardando Envio')
+    expedicao = _para_data(df['data_expedicao'])
+    previsao = _para_data(df['data_previsao'])
+    atrasado = aguardando & previsao.notna() & (previsao < hoje)
+
+    df['status_descricao'] = status.where(~atrasado, 'Atrasado')
+    df['entrega_atrasada'] = entrega_atrasada
+    df['expedicao_atrasada'] = aguardando & expedicao.notna() & (expedicao < hoje) & ~atrasado
+    return df
+
+
+def processa_pedidos(pedidos):
+    # Linhas de pedidos_resumo (PEDIDOS_RESUMO=1) já vêm com os campos derivados do banco
+    if not pedidos or 'entrega_atrasada' in pedidos[0]:
+        return pedidos
+    import pandas as pd
+    colunas = ['status_descricao', 'situacao_comercial', 'data_entrega', 'data_expedicao', 'data_previsao']
+    df = derivar_status(pd.DataFrame({c: [p.get(c) for p in pedidos] for c in colunas}))
+    # Só as colunas derivadas voltam para os registros; os demais valores ficam intocados
+    for p, status, entrega, expedicao in zip(pedidos, df['status_descricao'].tolist(),
+                                             df['entrega_atrasada'].tolist(), df['expedicao_atrasada'].tolist()):
+        p['status_descricao'] = status
+        p['entrega_atrasada'] = entrega
+        p['expedicao_atrasada'] = expedicao
+    return pedidos
@@ -0,0 +1,162 @@
+import itertools
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from status_pedidos import SITUACOES_AGUARDANDO_ENVIO, derivar_status, processa_pedidos
+
+HOJE = date(2024, 3, 1)
+ONTEM = HOJE - timedelta(days=1)
+AMANHA = HOJE + timedelta(days=1)
+
+
+def processa_pedidos_por_linha(pedidos, hoje):
+    # Laço original de app.py (antes de status_pedidos), com date.today() trocado por hoje
+    for p in pedidos:
+        p['entrega_atrasada'] = False
+        if (p.get('status_descricao') != 'Entregue'
+            and p.get('data_entrega')
+            and p['data_entrega'] < hoje):
+            p['entrega_atrasada'] = True
+        else:
+            situacao = (p.get('situacao_comercial') or '').strip().lower()
+            if situacao in ['atendido', '02 faturado mmvb']:
+                if not p.get('status_descricao') or p.get('status_descricao') == 'Aguardando Envio':
+                    p['status_descricao'] = 'Aguardando Envio'
+            p['expedicao_atrasada'] = False
+            status = p.get('status_descricao')
+            if (
+                status == 'Aguardando Envio'
+                and p.get('data_expedicao')
+                and str(p.get('data_expedicao')).strip() not in ['', 'None', 'null']
+            ):
+                data_exp = p['data_expedicao']
+                if isinstance(data_exp, str):
+                    try:
+                        data_exp = pd.to_datetime(data_exp).date()
+                    except:
+                        data_exp = None
+                if data_exp and data_exp < hoje:
+                    p['expedicao_atrasada'] = True
+            if p.get('status_descricao') == 'Aguardando Envio' and p.get('data_previsao'):
+                data_prev = p['data_previsao']
+                if isinstance(data_prev, str):
+                    data_prev = pd.to_datetime(data_prev).date()
+                if data_prev and data_prev < hoje:
+                    p['status_descricao'] = 'Atrasado'
+                    p['expedicao_atrasada'] = False
+    return pedidos
+
+
+def derivar(pedidos, hoje):
+    colunas = ['status_descricao', 'situacao_comercial', 'data_entrega', 'data_expedicao', 'data_previsao']
+    df = derivar_status(pd.DataFrame({c: [p.get(c) for p in pedidos] for c in colunas}), hoje)
+    return [{'status_descricao': s, 'entrega_atrasada': bool(e), 'expedicao_atrasada': bool(x)}
+            for s, e, x in zip(df['status_descricao'], df['entrega_atrasada'], df['expedicao_atrasada'])]
+
+
+def esperado(pedidos, hoje):
+    # O laço antigo não define expedicao_atrasada quando a entrega está atrasada; o template lia como falso
+    return [{'status_descricao': p.get('status_descricao'), 'entrega_atrasada': p['entrega_atrasada'],
+             'expedicao_atrasada': p.get('expedicao_atrasada', False)}
+            for p in processa_pedidos_por_linha([dict(p) for p in pedidos], hoje)]
+
+
+STATUS = [None, '', 'Aguardando Envio', 'Em Trânsito', 'Entregue']
+SITUACOES = [None, '', 'Em aberto', 'Atendido', ' ATENDIDO ', '02 Faturado MMVB', '02 faturado mmvb ']
+# O laço antigo compara data_entrega direto com a data, então só aceita date, nulo ou vazio
+ENTREGAS = [None, '', ONTEM, HOJE, AMANHA]
+EXPEDICOES = [None, '', 'None', 'null', ' ', ONTEM, HOJE, AMANHA,
+              ONTEM.isoformat(), HOJE.isoformat(), AMANHA.isoformat()]
+# Texto que não é data em data_previsao ('None', 'null'...) derrubava o laço antigo (ver test_previsao_invalida)
+PREVISOES = [None, '', ONTEM, HOJE, AMANHA, ONTEM.isoformat(), HOJE.isoformat()]
+
+
+def test_situacoes_aguardando_envio_iguais_ao_laco_antigo():
+    assert sorted(SITUACOES_AGUARDANDO_ENVIO) == sorted(['atendido', '02 faturado mmvb'])
+
+
+def test_todas_as_combinacoes():
+    pedidos = [dict(zip(['status_descricao', 'situacao_comercial', 'data_entrega', 'data_expedicao',
+                         'data_previsao'], valores))
+               for valores in itertools.product(STATUS, SITUACOES, ENTREGAS, EXPEDICOES, PREVISOES)]
+    assert derivar(pedidos, HOJE) == esperado(pedidos, HOJE)
+
+
+@pytest.mark.parametrize('situacao', ['Atendido', '02 Faturado MMVB'])
+@pytest.mark.parametrize('status', [None, '', 'Aguardando Envio'])
+def test_aguardando_envio(situacao, status):
+    pedidos = [{'status_descricao': status, 'situacao_comercial': situacao, 'data_entrega': None,
+                'data_expedicao': ONTEM, 'data_previsao': None}]
+    assert derivar(pedidos, HOJE) == esperado(pedidos, HOJE) == [
+        {'status_descricao': 'Aguardando Envio', 'entrega_atrasada': False, 'expedicao_atrasada': True}]
+
+
+def test_entregue_com_data_de_entrega_passada_nao_atrasa():
+    pedidos = [{'status_descricao': 'Entregue', 'situacao_comercial': 'Atendido', 'data_entrega': ONTEM,
+                'data_expedicao': ONTEM, 'data_previsao': ONTEM}]
+    assert derivar(pedidos, HOJE) == esperado(pedidos, HOJE) == [
+        {'status_descricao': 'Entregue', 'entrega_atrasada': False, 'expedicao_atrasada': False}]
+
+
+@pytest.mark.parametrize('vazio', [None, '', 'None', 'null', ' '], ids=repr)
+def test_expedicao_vazia(vazio):
+    pedidos = [{'status_descricao': 'Aguardando Envio', 'situacao_comercial': 'Atendido', 'data_entrega': None,
+                'data_expedicao': vazio, 'data_previsao': None}]
+    assert derivar(pedidos, HOJE) == esperado(pedidos, HOJE) == [
+        {'status_descricao': 'Aguardando Envio', 'entrega_atrasada': False, 'expedicao_atrasada': False}]
+
+
+@pytest.mark.parametrize('previsao', ['None', 'null', ' ', 'sem data'], ids=repr)
+def test_previsao_invalida(previsao):
+    # O laço antigo levantava exceção (a página inteira falhava); agora a previsão é ignorada
+    pedidos = [{'status_descricao': None, 'situacao_comercial': 'Atendido', 'data_entrega': None,
+                'data_expedicao': ONTEM, 'data_previsao': previsao}]
+    with pytest.raises(ValueError):
+        esperado(pedidos, HOJE)
+    assert derivar(pedidos, HOJE) == [
+        {'status_descricao': 'Aguardando Envio', 'entrega_atrasada': False, 'expedicao_atrasada': True}]
+
+
+def test_hoje_no_limite():
+    # Datas iguais a hoje não estão atrasadas; as de ontem estão
+    pedidos = [
+        {'status_descricao': 'Em Trânsito', 'situacao_comercial': '', 'data_entrega': HOJE},
+        {'status_descricao': 'Em Trânsito', 'situacao_comercial': '', 'data_entrega': ONTEM},
+        {'status_descricao': None, 'situacao_comercial': 'Atendido', 'data_expedicao': HOJE},
+        {'status_descricao': None, 'situacao_comercial': 'Atendido', 'data_expedicao': HOJE.isoformat()},
+        {'status_descricao': None, 'situacao_comercial': 'Atendido', 'data_previsao': HOJE},
+        {'status_descricao': None, 'situacao_comercial': 'Atendido', 'data_previsao': ONTEM.isoformat(),
+         'data_expedicao': ONTEM},
+    ]
+    assert derivar(pedidos, HOJE) == esperado(pedidos, HOJE) == [
+        {'status_descricao': 'Em Trânsito', 'entrega_atrasada': False, 'expedicao_atrasada': False},
+        {'status_descricao': 'Em Trânsito', 'entrega_atrasada': True, 'expedicao_atrasada': False},
+        {'status_descricao': 'Aguardando Envio', 'entrega_atrasada': False, 'expedicao_atrasada': False},
+        {'status_descricao': 'Aguardando Envio', 'entrega_atrasada': False, 'expedicao_atrasada': False},
+        {'status_descricao': 'Aguardando Envio', 'entrega_atrasada': False, 'expedicao_atrasada': False},
+        {'status_descricao': 'Atrasado', 'entrega_atrasada': False, 'expedicao_atrasada': False},
+    ]
+    # Um dia depois, as mesmas datas passam a atrasar
+    assert derivar(pedidos, AMANHA) == esperado(pedidos, AMANHA)
+
+
+def test_processa_pedidos_mantem_os_demais_campos():
+    hoje = date.today()
+    pedidos = [{'id': 1, 'n_pedido': 10, 'status_descricao': None, 'situacao_comercial': 'Atendido',
+                'data_entrega': None, 'data_expedicao': hoje - timedelta(days=2), 'data_previsao': None},
+               {'id': 2, 'n_pedido': 11, 'status_descricao': 'Em Trânsito', 'situacao_comercial': 'Em aberto',
+                'data_entrega': hoje - timedelta(days=1), 'data_expedicao': None, 'data_previsao': None}]
+    referencia = processa_pedidos_por_linha([dict(p) for p in pedidos], hoje)
+    resultado = processa_pedidos(pedidos)
+    for antigo, novo in zip(referencia, resultado):
+        antigo.setdefault('expedicao_atrasada', False)
+        assert {k: bool(v) if k.endswith('atrasada') else v for k, v in novo.items()} == antigo
+
+
+def test_lista_vazia():
+    assert processa_pedidos([]) == []
+    df = derivar_status(pd.DataFrame({c: [] for c in ['status_descricao', 'situacao_comercial', 'data_entrega',
+                                                      'data_expedicao', 'data_previsao']}))
+    assert df.empty and all(c in df.columns for c in ['entrega_atrasada', 'expedicao_atrasada'])